@@ -3,7 +3,8 @@
 
 from nlplib.core.model.base import Model, SessionDependent
 
-from nlplib.core.model.naturallanguage import Document, Seq, Gram, Word, Index
+from nlplib.core.model.naturallanguage import (Document, Seq, Gram, Word, Index, Frequency, Tokenization, Passage,
+                                               ConcordanceKey, Bucket, Constituent)
 from nlplib.core.model.neuralnetwork import NeuralNetwork, Layer, Connection, NeuralNetworkIO
 
 from nlplib.core.model.sqlalchemy_ import Database
@@ -16,6 +17,12 @@ __all__ = ['Model',
            'Gram',
            'Word',
            'Index',
+           'Frequency',
+           'Tokenization',
+           'Passage',
+           'ConcordanceKey',
+           'Bucket',
+           'Constituent',
 
            'NeuralNetwork',
            'Layer',
@@ -4,7 +4,7 @@ import random
 
 from nlplib.core.process.index import Indexed
 from nlplib.core.model.exc import StorageError
-from nlplib.core.model import Database, Document, Word, NeuralNetwork, Layer, NeuralNetworkIO
+from nlplib.core.model import Database, Document, Word, Gram, NeuralNetwork, Layer, NeuralNetworkIO
 
 def _test_document (ut) :
     # Tests the addition and removal of documents and associated objects from the database.
@@ -53,6 +53,36 @@ def _test_document (ut) :
     with db as session :
         test_counts(session, 0, 0)
 
+def _test_unique_seqs (ut) :
+    # Sequences are kept unique by the database, not only by the lookups done when indexing.
+
+    db = Database()
+
+    with db as session :
+        session.add(Word('a'))
+        session.add(Gram('a b'))
+
+    @db
+    def add_duplicate_word (session) :
+        session.add(Word('a'))
+
+    ut.assert_raises(add_duplicate_word, StorageError)
+
+    @db
+    def add_duplicates_at_once (session) :
+        session.add(Word('b'))
+        session.add(Word('b'))
+
+    ut.assert_raises(add_duplicates_at_once, StorageError)
+
+    with db as session :
+        # The same string can still be a word and a gram.
+        session.add(Gram('a'))
+
+    with db as session :
+        ut.assert_equal(sorted(session.access.all_words()), [Word('a')])
+        ut.assert_equal(len(list(session.access.all_seqs())), 3)
+
 def _test_neural_network_io (ut) :
     # Neural networks IO objects should be able to handle sequences, <None>, or pickle-able Python objects as their
     # object property.
@@ -190,6 +220,7 @@ def _test_neural_network_names (ut) :
 
 def __test__ (ut) :
     _test_document(ut)
+    _test_unique_seqs(ut)
     _test_neural_network_io(ut)
     _test_neural_network_methods(ut)
     _test_neural_network_names(ut)
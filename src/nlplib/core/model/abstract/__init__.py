@@ -35,6 +35,26 @@ class Session (Base) :
     def _remove (self, object) :
         raise NotImplementedError
 
+    @contextmanager
+    def profile (self, name) :
+        ''' Within this context, the access methods use the named loading profile by default (see
+            <Access.profiles>). '''
+
+        self.access.profile(name) # This checks that the profile exists.
+
+        previous, self.access.load = (self.access.load, name)
+        try :
+            yield self
+        finally :
+            self.access.load = previous
+
+    def _reference (self, cls, id, **attrs) :
+        ''' This returns an object standing in for the database row of class <cls> with the primary key <id>, without
+            querying the database. Any attributes which aren't given as keyword arguments are loaded on first
+            access. '''
+
+        raise NotImplementedError
+
 class Database (Base) :
     ''' This class represents a database. Generally you don't interface with the database directly so much, but instead
         with a database session object. '''
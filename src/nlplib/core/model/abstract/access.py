@@ -1,7 +1,9 @@
 
 
 from nlplib.core.process.token import split
-from nlplib.core.model import SessionDependent, Document, Seq, Gram, Word, Index, NeuralNetwork
+from nlplib.core.process.concordance import Concordance
+from nlplib.core.model import (SessionDependent, Document, Seq, Gram, Word, Index, Frequency, Tokenization, Passage,
+                               ConcordanceKey, Bucket, NeuralNetwork)
 
 __all__ = ['Access', 'abstract_test']
 
@@ -9,15 +11,41 @@ class Access (SessionDependent) :
     ''' This class contains methods which act as convenient abstractions of common database queries; this provides the
         primary way to access the objects stored within a database. '''
 
+    # The ways that <Access.kwic> can sort occurrences (see <ConcordanceKey> for how many neighbouring words are
+    # compared when sorting by context).
+    kwic_orders = ('document', 'left', 'right')
+
+    # The loading profiles, which say which of the related objects (e.g., the indexes of sequences) are loaded along
+    # with the objects that the methods return, instead of one at a time as they're used. The profile used by default
+    # is <load>, see <Session.profile>.
+    profiles = {}
+    load = None
+
+    def profile (self, name=None) :
+        ''' This returns the named loading profile, or the one used by default. '''
+
+        name = name if name is not None else self.load
+        if name is None :
+            return {}
+
+        try :
+            return self.profiles[name]
+        except KeyError :
+            raise ValueError('There is no loading profile called {0!r}.'.format(name))
+
     def words (self, string, splitter=split) :
         ''' This returns the word objects corresponding to the word substrings within a string. If no word object is
-            found for a particular substring, <None> is used. '''
+            found for a particular substring, <None> is used. The words are all looked up at once (see
+            <Access.matching>). '''
 
         if isinstance(string, str) :
-            return [self.word(word_string) for word_string in splitter(string)]
+            word_strings = [str(word_string) for word_string in splitter(string)]
         else :
             # Treat string as a collection of strings.
-            return [self.word(word_string) for word_string in string]
+            word_strings = [str(word_string) for word_string in string]
+
+        words = {word.string : word for word in self.matching(set(word_strings), Word)}
+        return [words.get(word_string) for word_string in word_strings]
 
     def vocabulary (self) :
         return self.all_words()
@@ -26,7 +54,17 @@ class Access (SessionDependent) :
         # todo : remove if corpus model is added
         return self.all_documents()
 
-    def _all (self, cls, chunk_size=100) :
+    def _all (self, cls, chunk_size=100, fields=None, undefer=False, load=None) :
+        ''' This returns all of the objects of a class. If <fields> (a sequence of field names, e.g.,
+            <('string', 'count')>) is given, a named tuple of just those fields is returned for every object instead.
+            Rows are much cheaper to read than the objects themselves, which makes them the better choice for scanning
+            through the whole vocabulary. The private attributes of the objects are available without their leading
+            underscore (e.g., <'id'> and <'type'>), and the <'count'> of sequences is worked out by the database.
+
+            The heavy attributes of objects (the strings of documents, and the charges, errors and weights of neural
+            networks) are loaded the first time they're used, unless <undefer> is true, in which case they're loaded
+            along with the objects. <load> is the name of the loading profile to use (see <Access.profiles>). '''
+
         raise NotImplementedError
 
     def all_documents (self, *args, **kw) :
@@ -50,6 +88,21 @@ class Access (SessionDependent) :
     def all_indexes (self, *args, **kw) :
         return self._all(Index, *args, **kw)
 
+    def all_frequencies (self, *args, **kw) :
+        return self._all(Frequency, *args, **kw)
+
+    def all_tokenizations (self, *args, **kw) :
+        return self._all(Tokenization, *args, **kw)
+
+    def all_passages (self, *args, **kw) :
+        return self._all(Passage, *args, **kw)
+
+    def all_concordance_keys (self, *args, **kw) :
+        return self._all(ConcordanceKey, *args, **kw)
+
+    def all_buckets (self, *args, **kw) :
+        return self._all(Bucket, *args, **kw)
+
     def all_neural_networks (self, *args, **kw) :
         return self._all(NeuralNetwork, *args, **kw)
 
@@ -71,32 +124,138 @@ class Access (SessionDependent) :
 
         return self._seq(Word, str(word_string))
 
-    def specific (self, cls, id) :
-        ''' This returns a specific object by id. '''
+    def specific (self, cls, id, undefer=False, load=None) :
+        ''' This returns a specific object by id, see <Access._all> for <undefer> and <load>. '''
+
+        raise NotImplementedError
+
+    def most_common (self, cls=None, top=10, fields=None, load=None, url_prefix=None, since=None, until=None) :
+        ''' This returns most common objects based on their count. The counts can be limited to a subset of the
+            documents; those whose url starts with <url_prefix>, and those created on or after <since> and before
+            <until>. Only documents indexed through <Indexed> are counted, when the documents are limited. Rows of
+            <fields> can be returned instead of the objects (see <Access._all>), their <'count'> is the count within
+            the subset of documents. See <Access._all> for <load>. '''
+
+        raise NotImplementedError
+
+    def indexes (self, document, passage=None) :
+        ''' This returns all of the indexes (with their sequences) referencing the document, or only those in the
+            passage with the given number (see <Passage>). '''
+
+        raise NotImplementedError
+
+    def contains (self, document, seq) :
+        ''' This returns whether the sequence is in the document (this is what <seq in document> does). '''
+
+        raise NotImplementedError
+
+    def document_seqs (self, document, type=None) :
+        ''' This returns the sequences in the document, or only those of a type (<'seq'>, <'word'> or <'gram'>). '''
+
+        raise NotImplementedError
+
+    def passages_containing (self, seq, top=10) :
+        ''' This returns the <top> passages with the most occurrences of the sequence, along with how many there are
+            in each. Only indexed occurrences are counted (see <Indexed>). '''
+
+        raise NotImplementedError
+
+    def frequencies (self, document) :
+        ''' This returns all of the frequencies (with their sequences) referencing the document. '''
+
+        raise NotImplementedError
+
+    def document_frequency (self, seq, url_prefix=None, since=None, until=None) :
+        ''' This returns the number of documents the sequence occurs in, whether its occurrences were indexed or only
+            counted. The documents can be limited in the same way as for <Access.most_common>. '''
+
+        raise NotImplementedError
+
+    def concordance (self, seq) :
+        ''' This returns the concordance of the sequence, which leaves what queries it can to this object. '''
+
+        return Concordance(seq, self)
+
+    def contexts (self, seq, before=None, after=None) :
+        ''' This returns every occurrence of the sequence (see <Concordance>) as a tuple of the document's id, the
+            first and last token indexes, the raw text of up to <before> tokens before the occurrence, the raw text of
+            the occurrence itself, and the raw text of up to <after> tokens after it. The occurrences are in order of
+            document, then position. Unlike going through <Concordance>, the number of queries doesn't depend on the
+            number of occurrences, and only the text within the windows is read out of the documents. '''
+
+        raise NotImplementedError
+
+    def kwic (self, seq, before=None, after=None, order='document', limit=None, offset=None, cursor=None) :
+        ''' This returns a page of the sequence's occurrences, in the same form as <Access.contexts>, along with a
+            cursor for the page after it (or <None> if the page is empty). The occurrences can be put in <order> of
+            document and position (<'document'>), or of the words to their <'left'> (nearest first) or <'right'>. Pages
+            can be picked out by <limit> and <offset>, and by giving the cursor of the page before; cursors stay valid
+            when occurrences are added, and don't make the database skip over the pages before. If the sequence's
+            occurrences were stored with their sort keys (see <ConcordanceKey>), the sorting and paging is done by the
+            database, so the time a page takes doesn't depend on how common the sequence is. Otherwise the keys are
+            worked out for every page. '''
+
+        raise NotImplementedError
+
+    def neighbours (self, seq, distance=1, top=10) :
+        ''' This returns the <top> most common words found <distance> tokens away from the sequence's occurrences
+            (negative distances are to the left, positive ones to the right), along with how many times each was
+            found. The profiles are cached until the occurrences of the sequence change. '''
+
+        raise NotImplementedError
+
+    def buckets (self, time, seqs) :
+        ''' This returns the buckets of the sequences, for the span of time that <time> falls within. '''
+
+        raise NotImplementedError
+
+    def trending (self, window=Bucket.span, top=10, baseline=24, now=None, cls=None) :
+        ''' This returns the sequences whose counts over the latest <window> of time (up to <now>, which defaults to
+            the current time) are the highest relative to their average count over the <baseline> windows before it.
+            Only the occurrences in documents with a <created_on> time are counted. The window should be a multiple
+            of <Bucket.span>. '''
+
+        raise NotImplementedError
+
+    def grams_containing (self, word) :
+        ''' This returns all of the grams that contain the word (a word object or string). '''
 
         raise NotImplementedError
 
-    def most_common (self, cls=None, top=10) :
-        ''' This returns most common objects based on their count. '''
+    def grams_starting_with (self, word) :
+        ''' This returns all of the grams whose first word is the given word. '''
 
         raise NotImplementedError
 
-    def indexes (self, document) :
-        ''' This returns all of the indexes (with their sequences) referencing the document. '''
+    def grams_ending_with (self, word) :
+        ''' This returns all of the grams whose last word is the given word. '''
 
         raise NotImplementedError
 
-    def matching (self, strings, cls=Seq, chunk_size=100) :
-        ''' This returns sequences (grams and words) that match the given list of strings.
+    def constituents (self, gram) :
+        ''' This returns the words that a gram is made up of, in order. Only grams added to the database through
+            <Indexed> with <decompose> are broken up into their constituent words (see <Constituent>), and only those
+            grams are found by <grams_containing> and the like. '''
+
+        raise NotImplementedError
+
+    def matching (self, strings, cls=Seq, chunk_size=100, fields=None, load=None) :
+        ''' This returns sequences (grams and words) that match the given list of strings, or rows of their <fields>
+            (see <Access._all>, which also covers <load>).
 
             Note : This method is typically implemented using the SQL <IN> operator. Some database systems have
             stipulations regarding the maximum size of the set used for membership testing. The optional <chunk_size>
             argument allows the set to be broken up into multiple smaller sets (chunks), with a length corresponding to
-            <chunk_size>, so that the set may fall under this limit. '''
+            <chunk_size>, so that the set may fall under this limit. Implementations may put large sets of strings in
+            a temporary table instead, in which case <chunk_size> isn't used. '''
 
         raise NotImplementedError
 
-    def neural_network (self, name) :
+    def neural_network (self, name, undefer=False, load=None) :
+        ''' This returns the neural network with the given name, or <None>. If <undefer> is true, the network's
+            elements are all loaded up front (see <Access._all>), rather than as they're used. See <Access._all> for
+            <load>. '''
+
         raise NotImplementedError
 
     def nn (self, *args, **kw) :
@@ -150,3 +309,278 @@ def abstract_test (ut, db_cls) :
         ut.assert_equal(sorted(session.access.matching(['a', 'b'], Word)), mock((Word,), 'ab'))
         ut.assert_equal(sorted(session.access.matching([])), [])
 
+        ut.assert_equal(sorted(session.access.all_words(fields=('string', 'count'))), [('a', 1), ('b', 2), ('c', 3)])
+        ut.assert_equal([(row.type, row.string) for row in session.access.most_common(Word, 1, ('type', 'string'))],
+                        [('word', 'c')])
+        ut.assert_equal(sorted(session.access.matching(['a', 'z'], fields=('string',))), [('a',)] * 3)
+
+    _test_constituents(ut, db_cls)
+    _test_document_subsets(ut, db_cls)
+    _test_trending(ut, db_cls)
+    _test_contexts(ut, db_cls)
+    _test_kwic(ut, db_cls)
+    _test_neighbours(ut, db_cls)
+
+def _test_constituents (ut, db_cls) :
+    from nlplib.core.process.index import Indexed
+
+    # Grams are only broken up when asked to.
+    db = db_cls()
+
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat ate')), max_gram_length=2)
+
+    with db as session :
+        ut.assert_equal(session.access.constituents(session.access.gram('the cat')), [])
+        ut.assert_equal(session.access.grams_containing('cat'), [])
+
+    db = db_cls()
+
+    with db as session :
+        indexed = Indexed(session, decompose=True)
+        indexed.add(session.add(Document('the cat ate the food')), max_gram_length=3)
+        indexed.add(session.add(Document('a cat ate a fish')), max_gram_length=3)
+
+    def strings (grams) :
+        return sorted(str(gram) for gram in grams)
+
+    with db as session :
+        access = session.access
+
+        ut.assert_equal(strings(access.grams_starting_with('cat')), ['cat ate', 'cat ate a', 'cat ate the'])
+        ut.assert_equal(strings(access.grams_ending_with(access.word('cat'))), ['a cat', 'the cat'])
+        ut.assert_equal(strings(access.grams_containing('fish')), ['a fish', 'ate a fish'])
+
+        # The word <the> shows up twice within <the cat ate the>, but the gram is only returned once.
+        ut.assert_equal(strings(access.grams_containing('the')),
+                        ['ate the', 'ate the food', 'cat ate the', 'the cat', 'the cat ate', 'the food'])
+
+        ut.assert_equal(access.constituents(access.gram('ate the food')), [Word('ate'), Word('the'), Word('food')])
+        ut.assert_equal(access.constituents(Gram('not in the database')), [])
+
+        for method in (access.grams_containing, access.grams_starting_with, access.grams_ending_with) :
+            ut.assert_equal(method('zebra'), [])
+
+    # Removing a gram from the database removes its constituents too.
+    with db as session :
+        for document in list(session.access.all_documents()) :
+            session.remove(document)
+
+    with db as session :
+        ut.assert_equal(list(session.access.all_seqs()), [])
+        ut.assert_equal(session.access.grams_containing('cat'), [])
+
+def _test_document_subsets (ut, db_cls) :
+    from datetime import datetime
+    from nlplib.core.process.index import Indexed
+
+    db = db_cls()
+
+    documents = [('the cat ate the food the end', 'http://cats.com/1', datetime(2014, 1, 1)),
+                 ('the cat sat on a cat', 'http://cats.com/2', datetime(2014, 2, 1)),
+                 ('a dog ate a dog bone a', 'http://dogs.com/1', datetime(2014, 3, 1))]
+
+    with db as session :
+        indexed = Indexed(session)
+        for string, url, created_on in documents :
+            indexed.add(session.add(Document(string, url=url, created_on=created_on)), max_gram_length=2)
+
+    with db as session :
+        access = session.access
+
+        ut.assert_equal(access.most_common(Word, top=2, url_prefix='http://cats.com'), [Word('the'), Word('cat')])
+        ut.assert_equal(access.most_common(Word, top=2, url_prefix='http://dogs.com'), [Word('a'), Word('dog')])
+        ut.assert_equal(access.most_common(Gram, top=1, url_prefix='http://cats.com'), [Gram('the cat')])
+        ut.assert_equal(access.most_common(Word, url_prefix='http://birds.com'), [])
+
+        ut.assert_equal(access.most_common(Word, top=1, since=datetime(2014, 2, 1)), [Word('a')])
+        ut.assert_equal(access.most_common(Word, top=1, until=datetime(2014, 2, 1)), [Word('the')])
+        ut.assert_equal(access.most_common(Word, top=1, since=datetime(2014, 1, 15), until=datetime(2014, 2, 15)),
+                        [Word('cat')])
+
+        ate = access.word('ate')
+        ut.assert_equal(access.document_frequency(ate), 2)
+        ut.assert_equal(access.document_frequency(ate, url_prefix='http://cats.com'), 1)
+        ut.assert_equal(access.document_frequency(ate, since=datetime(2014, 2, 1)), 1)
+        ut.assert_equal(access.document_frequency(ate, url_prefix='http://cats.com', since=datetime(2014, 2, 1)), 0)
+
+        # The counts (which don't depend on the documents) aren't thrown off by the frequencies.
+        ut.assert_equal((access.word('cat').count, access.word('the').count), (3, 4))
+        ut.assert_equal(sorted(access.most_common(Word, top=3)), [Word('a'), Word('cat'), Word('the')])
+
+def _test_trending (ut, db_cls) :
+    from datetime import datetime, timedelta
+    from nlplib.core.process.index import Indexed
+
+    db = db_cls()
+
+    now = datetime(2014, 1, 1, 12, 30)
+    hours_ago = lambda hours : now - timedelta(hours=hours)
+
+    documents = [('the cat and the dog', hours_ago(2)),
+                 ('the cat and the dog', hours_ago(2)),
+                 ('the dog and the cat', hours_ago(1)),
+                 ('the zebra and the zebra', hours_ago(0)),
+                 ('the cat sat', hours_ago(0)),
+                 ('the undated zebra', None)]
+
+    with db as session :
+        indexed = Indexed(session)
+        for string, created_on in documents :
+            indexed.add(session.add(Document(string, created_on=created_on)), max_gram_length=2)
+
+    with db as session :
+        access = session.access
+
+        zebra, cat = (access.word('zebra'), access.word('cat'))
+        ut.assert_equal(sorted(int(bucket) for bucket in access.buckets(now, [zebra, cat])), [1, 2])
+        ut.assert_equal(access.buckets(hours_ago(1), [zebra]), [])
+        ut.assert_equal([int(bucket) for bucket in access.buckets(hours_ago(2), [cat])], [2])
+
+        ut.assert_equal(sorted(access.trending(top=2, baseline=2, now=now)), [Word('zebra'), Gram('the zebra')])
+        ut.assert_equal(access.trending(top=1, baseline=2, now=now, cls=Gram), [Gram('the zebra')])
+        ut.assert_equal(access.trending(top=1, baseline=2, now=hours_ago(1)), [Gram('dog and')])
+        ut.assert_equal(access.trending(now=hours_ago(5)), [])
+
+        # Days work too, everything from the last day is counted in the same window.
+        ut.assert_equal(access.trending(window=timedelta(days=1), top=1, now=now), [Word('the')])
+
+        # Removing a document takes its counts back out of the buckets.
+        for document in list(access.all_documents()) :
+            if document.created_on == now and 'zebra' in str(document) :
+                session.remove(document)
+
+    with db as session :
+        access = session.access
+        ut.assert_equal([int(bucket) for bucket in access.buckets(now, [access.word('the')])], [1])
+        ut.assert_equal(access.trending(top=1, baseline=2, now=now, cls=Word), [Word('sat')])
+
+        for document in list(access.all_documents()) :
+            session.remove(document)
+
+    with db as session :
+        ut.assert_equal(list(session.access.all_buckets()), [])
+
+def _test_contexts (ut, db_cls) :
+    from nlplib.core.process.index import Indexed
+    from nlplib.core.process.concordance import Concordance
+
+    strings = ['the cat  sat on the mat', 'a dog sat', 'the cat ate the  food']
+
+    for kw in [{}, {'packed' : True}] :
+        db = db_cls()
+
+        with db as session :
+            indexed = Indexed(session, **kw)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=2)
+
+        with db as session :
+            access = session.access
+
+            ids = sorted(document._id for document in access.all_documents())
+
+            ut.assert_equal(access.contexts(access.word('the'), before=1, after=1),
+                            [(ids[0], 0, 0, '', 'the', ' cat'), (ids[0], 4, 4, 'on ', 'the', ' mat'),
+                             (ids[2], 0, 0, '', 'the', ' cat'), (ids[2], 3, 3, 'ate ', 'the', '  food')])
+
+            ut.assert_equal(access.contexts(access.gram('cat sat'), before=2),
+                            [(ids[0], 1, 2, 'the ', 'cat  sat', ' on the')])
+
+            # The default window is the same as <Concordance>'s.
+            cat = access.word('cat')
+            ut.assert_equal([tuple(context[3:]) for context in access.contexts(cat)],
+                            [('', 'cat', '  sat on'), ('', 'cat', ' ate the')])
+            ut.assert_equal([raw for document, index, raw in Concordance(cat).raw()],
+                            [context[4] for context in access.contexts(cat)])
+
+            ut.assert_equal(access.contexts(Word('unknown')), [])
+
+def _test_kwic (ut, db_cls) :
+    from nlplib.core.process.index import Indexed
+
+    strings = ['the cat sat on the mat', 'a dog sat', 'the cat ate the food']
+
+    # The occurrences are paged the same way, whether their sort keys were stored or not.
+    for kw in [{}, {'packed' : True}, {'positional_grams' : False}, {'concordance_keys' : True},
+               {'packed' : True, 'concordance_keys' : True}] :
+        db = db_cls()
+
+        with db as session :
+            indexed = Indexed(session, **kw)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=2)
+
+        with db as session :
+            access = session.access
+
+            the = access.word('the')
+            ids = sorted(document._id for document in access.all_documents())
+
+            def positions (contexts) :
+                return [(ids.index(document_id), first_token) for document_id, first_token, *_ in contexts]
+
+            contexts, cursor = access.kwic(the)
+            ut.assert_equal(contexts, access.contexts(the))
+            ut.assert_equal(cursor, (ids[2], 3))
+
+            ut.assert_equal(positions(access.kwic(the, order='left')[0]), [(0, 0), (2, 0), (2, 3), (0, 4)])
+            ut.assert_equal(positions(access.kwic(the, order='right')[0]), [(2, 0), (0, 0), (2, 3), (0, 4)])
+
+            contexts, cursor = access.kwic(the, before=1, after=1, order='right', limit=1, offset=2)
+            ut.assert_equal(contexts, [(ids[2], 3, 3, 'ate ', 'the', ' food')])
+            ut.assert_equal(cursor, ('food', ids[2], 3))
+
+            # Walking through the pages with cursors.
+            pages, cursor = ([], None)
+            while True :
+                contexts, cursor = access.kwic(the, order='left', limit=3, cursor=cursor)
+                if not contexts :
+                    break
+                pages.append(positions(contexts))
+
+            ut.assert_equal(pages, [[(0, 0), (2, 0), (2, 3)], [(0, 4)]])
+
+            # Grams that are only counted don't have any occurrences to show.
+            ut.assert_equal(positions(access.kwic(access.gram('the cat'), order='right')[0]),
+                            [] if kw.get('positional_grams') is False else [(2, 0), (0, 0)])
+            ut.assert_equal(access.kwic(Word('unknown')), ([], None))
+            ut.assert_raises(lambda : access.kwic(the, order='middle'), ValueError)
+
+def _test_neighbours (ut, db_cls) :
+    from nlplib.core.process.index import Indexed
+
+    strings = ['the cat sat on the mat', 'a dog sat', 'the cat ate the food']
+
+    for kw in [{}, {'packed' : True}] :
+        db = db_cls()
+
+        with db as session :
+            indexed = Indexed(session, **kw)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=2)
+
+        with db as session :
+            access = session.access
+
+            the = access.concordance(access.word('the'))
+            ut.assert_equal(the.neighbours(), [(Word('cat'), 2), (Word('food'), 1), (Word('mat'), 1)])
+            ut.assert_equal(the.neighbours(top=1), [(Word('cat'), 2)])
+            ut.assert_equal(the.neighbours(distance=2), [(Word('ate'), 1), (Word('sat'), 1)])
+
+            # Without the database, the concordance works it out itself.
+            ut.assert_equal(Concordance(access.word('the')).neighbours(), the.neighbours())
+
+            ut.assert_equal(access.neighbours(access.word('sat'), distance=-1), [(Word('cat'), 1), (Word('dog'), 1)])
+            ut.assert_equal(access.neighbours(access.gram('the cat')), [(Word('ate'), 1), (Word('sat'), 1)])
+            ut.assert_equal(access.neighbours(access.word('the'), distance=-9), [])
+            ut.assert_equal(access.neighbours(Word('unknown')), [])
+            ut.assert_raises(lambda : access.neighbours(access.word('the'), distance=0), ValueError)
+
+        # The cached profile is thrown out once the sequence's occurrences change.
+        with db as session :
+            Indexed(session, **kw).add(session.add(Document('the dog')), max_gram_length=2)
+
+        with db as session :
+            ut.assert_equal(session.access.neighbours(session.access.word('the')),
+                            [(Word('cat'), 2), (Word('dog'), 1), (Word('food'), 1), (Word('mat'), 1)])
@@ -1,15 +1,40 @@
 
 
+from datetime import timedelta
 from functools import total_ordering
+from itertools import chain
 
 from nlplib.core.process.concordance import Concordance
 from nlplib.core.model.base import Model
 from nlplib.general.represent import pretty_truncate, represented_literally
+from nlplib.general.pack import pack, unpack
+from nlplib.general.compress import decompress
 from nlplib.general import composite
 from nlplib.core.base import Base
 
 class Document (Model) :
-    ''' A class for textual documents. '''
+    ''' A class for textual documents.
+
+        The sequences in a document are found through their frequencies (indexing keeps one for every sequence in
+        every document), the back-end provides these as <Document._indexed_seqs>. Sequences can also be associated
+        with a document directly through <Document.seqs>, indexing only does this when asked to, because it duplicates
+        what the frequencies already record.
+
+        The document's string can be kept in a text store (see <nlplib.general.store>) instead of in the database, in
+        which case the back-end sets <Document._store>, and the string's location within it. Otherwise, the string
+        can be kept compressed (see <nlplib.general.compress>); it's decompressed the first time it's needed, and kept
+        by the document from then on.
+
+        When the document is in a session, the back-end provides the session's access as <Document._access>, so that
+        membership tests and the <words> and <grams> of the document are worked out by the database, rather than by
+        loading every one of the document's sequences. '''
+
+    _indexed_seqs = ()
+    _access = None
+
+    _store = None
+    _text_offset, _text_length, _text_width = (None, None, None)
+    _text_compression, _text_compressed, _decompressed = (None, None, None)
 
     def __init__ (self, string, word_count=None, title=None, url=None, created_on=None) :
         self.string = string
@@ -20,6 +45,9 @@ class Document (Model) :
         self.created_on = created_on
 
         self.seqs = []
+        self.tokenization = None
+        self.passages = []
+        self.concordance_keys = []
 
     def __repr__ (self, *args, **kw) :
         return super().__repr__(pretty_truncate(self.string.replace('\n', ' '), 35), *args, **kw)
@@ -30,33 +58,99 @@ class Document (Model) :
     def __getitem__ (self, index) :
         return self.string[index]
 
+    # Setting the string clears where it's stored, so these don't need to look at the string itself (which the back-end
+    # might only load when it's asked for).
+    def _stored (self) :
+        return self._store is not None and self._text_offset is not None
+
+    @property
+    def string (self) :
+        if self._stored() :
+            return self._store.read(self._text_offset, self._text_length, self._text_width)
+        elif self._text_compression is not None :
+            if self._decompressed is None :
+                self._decompressed = decompress(self._text_compressed, self._text_compression)
+            return self._decompressed
+        return self._string
+
+    @string.setter
+    def string (self, string) :
+        self._string = string
+        self._text_offset, self._text_length, self._text_width = (None, None, None)
+        self._text_compression, self._text_compressed, self._decompressed = (None, None, None)
+
+    def snippet (self, start=None, end=None) :
+        ''' This returns <document.string[start:end]>, if the string is in a text store only that part of it is
+            read. '''
+
+        if self._stored() :
+            return self._store.read(self._text_offset, self._text_length, self._text_width, start, end)
+        return self.string[start:end]
+
     def __contains__ (self, seq) :
-        return seq in self.seqs
+        if self._access is not None :
+            return self._access.contains(self, seq)
+        return seq in self.seqs or seq in self._indexed_seqs
 
     def __len__ (self) :
-        return len(self.string)
+        # The length of stored and compressed strings is known without reading them.
+        return self._text_length if self._text_length is not None else len(self.string)
+
+    def _seqs (self, type) :
+        if self._access is not None :
+            yield from self._access.document_seqs(self, type)
+            return
+
+        seen = set()
+        for seq in chain(self.seqs, self._indexed_seqs) :
+            if seq not in seen and getattr(seq, '_is_' + type) :
+                seen.add(seq)
+                yield seq
 
     def seqs_only (self) :
-        for seq in self.seqs :
-            if seq._is_seq :
-                yield seq
+        return self._seqs('seq')
 
     def words (self) :
-        for word in self.seqs :
-            if word._is_word :
-                yield word
+        return self._seqs('word')
 
     def grams (self) :
-        for gram in self.seqs :
-            if gram._is_gram :
-                yield gram
+        return self._seqs('gram')
 
     def _associated (self, session) :
-        for index, seq in session.access.indexes(self) :
-            seq.indexes.remove(index)
+        seqs = []
+
+        # The indexes of documents which were split up into passages are gone through one passage at a time.
+        for passage in [passage.number for passage in self.passages] or [None] :
+            for index, seq in session.access.indexes(self, passage) :
+                seq.indexes.remove(index)
+                seqs.append(seq)
+                yield index
+
+        counts = {}
+        for frequency, seq in session.access.frequencies(self) :
+            seq.frequencies.remove(frequency)
+            seqs.append(seq)
+            counts[seq] = frequency.count
+            yield frequency
+
+        # The document's occurrences are taken back out of the trend buckets.
+        if self.created_on is not None :
+            for bucket in session.access.buckets(self.created_on, counts) :
+                bucket.count -= counts[bucket.seq]
+                if bucket.count < 1 :
+                    yield bucket
+
+        # The tokenization, passages and concordance keys go along with the indexes, they're orphans once they're
+        # detached from the document.
+        self.tokenization = None
+        self.passages = []
+        self.concordance_keys = []
+
+        # The indexes, frequencies and buckets are removed before the sequences, removing a sequence may query the
+        # database (to remove the sequence's own associated objects), which would flush the orphaned indexes.
+        for seq in set(seqs) :
             if seq.count < 1 :
                 yield seq
-            yield index
 
 @total_ordering
 class Seq (Model) :
@@ -71,6 +165,7 @@ class Seq (Model) :
         self.string = string
 
         self.indexes = []
+        self.frequencies = []
 
     def __repr__ (self, *args, **kw) :
         # Sequence objects can be represented as literal Python.
@@ -112,9 +207,12 @@ class Seq (Model) :
     def __hash__ (self) :
         return hash((self.__class__, self.string))
 
-    @composite(lambda self : (len(self.indexes),))
+    @composite(lambda self : (len(self.indexes),
+                              tuple((frequency.count, frequency.indexed) for frequency in self.frequencies)))
     def count (self) :
-        return len(self.indexes)
+        # Occurrences are either indexed one by one, or (for sequences indexed without their positions) tallied up
+        # per document. Frequencies that tally up indexes are skipped, so that these aren't counted twice.
+        return len(self.indexes) + sum(frequency.count for frequency in self.frequencies if not frequency.indexed)
 
     def concordance (self) :
         return Concordance(self)
@@ -172,7 +270,7 @@ class Index (Model) :
     ''' This class is used for indexing sequences (words or n-grams) in a document. '''
 
     def __init__ (self, document, first_token_index, last_token_index, first_character_index,
-                  last_character_index, tokenization_algorithm=None) :
+                  last_character_index, tokenization_algorithm=None, passage=None) :
 
         self.document = document
 
@@ -195,6 +293,11 @@ class Index (Model) :
 
         self.tokenization_algorithm = tokenization_algorithm
 
+        ''' The number of the passage (see <Passage>) that the index starts in, if the document was split up into
+            passages. '''
+
+        self.passage = passage
+
     def _int_or_none (self, value) :
         try :
             return int(value)
@@ -210,3 +313,198 @@ class Index (Model) :
     def __repr__ (self, *args, **kw) :
         return super().__repr__(self.first_token, self.document, *args, **kw)
 
+class Frequency (Model) :
+    ''' This records how many times a sequence occurs in a document. <Indexed> keeps one of these for every sequence in
+        every document it indexes, whichever way the occurrences themselves are stored, and frequencies are the only
+        per document record of a sequence. They're what the sequences in a document are looked up by, and what counts
+        are aggregated over for a set of documents, without going through the indexes.
+
+        If <indexed> is true, the sequence's occurrences in the document are also indexed individually. Otherwise, the
+        frequency stands in for the indexes; either only the count is kept, or the token indexes of the occurrences
+        are kept too, packed into a single value (see <nlplib.general.pack>). This takes up far less space than an
+        index per occurrence. '''
+
+    def __init__ (self, document, seq, count, positions=None, indexed=False) :
+        self.document = document
+        self.seq      = seq
+        self.count    = count
+        self.indexed  = indexed
+
+        self._positions = pack(positions) if positions is not None else None
+
+    def __int__ (self) :
+        return self.count
+
+    def __len__ (self) :
+        ''' The number of occurrences whose positions are known. '''
+
+        return self.count if self._positions is not None else 0
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.seq, self.count, *args, **kw)
+
+    @composite(lambda self : (self._positions,))
+    def positions (self) :
+        ''' The first token index of each occurrence, these are only unpacked when needed. '''
+
+        return tuple(unpack(self._positions)) if self._positions is not None else ()
+
+    @property
+    def tokenization_algorithm (self) :
+        ''' The tokenization algorithm that the positions were worked out with, which is the one the document's
+            tokenization (see <Tokenization>) was made with. '''
+
+        tokenization = getattr(self.document, 'tokenization', None)
+        return tokenization.tokenization_algorithm if tokenization is not None else None
+
+    def indexes (self, tokens=None) :
+        ''' This yields an index for each occurrence. The character indexes can be worked out from the document's
+            tokens (as made by the tokenization algorithm used for indexing), without them they're left as <None>. '''
+
+        length = len(self.seq.seqs) if self.seq._is_gram else 1
+
+        for first_token in self.positions :
+            last_token = first_token + length - 1
+
+            if tokens is None :
+                first_character, last_character = (None, None)
+            else :
+                first_character = tokens[first_token].first_character_index
+                last_character  = tokens[last_token].last_character_index
+
+            yield Index(self.document, first_token, last_token, first_character, last_character,
+                        self.tokenization_algorithm)
+
+class Tokenization (Model) :
+    ''' This records where each of a document's tokens starts and ends, as character indexes, packed into a single
+        value (see <nlplib.general.pack>). It lets the text around an occurrence be found without tokenizing the
+        document again, which means that indexes don't need to store their character indexes either. '''
+
+    def __init__ (self, document, tokens, tokenization_algorithm=None) :
+        self.document = document
+        self.tokenization_algorithm = tokenization_algorithm
+
+        self._offsets = pack(chain.from_iterable((token.first_character_index, token.last_character_index)
+                                                 for token in tokens))
+
+    def __len__ (self) :
+        return len(self.spans)
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.document, self.tokenization_algorithm, *args, **kw)
+
+    @composite(lambda self : (self._offsets,))
+    def spans (self) :
+        ''' The first and last character indexes of every token. These are only unpacked when needed. '''
+
+        offsets = tuple(unpack(self._offsets))
+        return tuple(zip(offsets[0::2], offsets[1::2]))
+
+    def characters (self, first_token, last_token) :
+        ''' The first and last character indexes of a range of tokens. '''
+
+        spans = self.spans
+        return (spans[first_token][0], spans[last_token][1])
+
+class Passage (Model) :
+    ''' This is a run of consecutive tokens within a document, such as a paragraph. Very long documents can be split up
+        into passages when they're indexed (see <Indexed>), each index then records the number of the passage it starts
+        in. This lets the occurrences within a small part of a document be worked with, without going through all of
+        the document's indexes. '''
+
+    def __init__ (self, document, number, first_token, last_token, first_character, last_character) :
+        self.document = document
+        self.number   = number
+
+        self.first_token = first_token
+        self.last_token  = last_token
+
+        self.first_character = first_character
+        self.last_character  = last_character
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.document, self.number, *args, **kw)
+
+    def __str__ (self) :
+        return self.document.snippet(self.first_character, self.last_character + 1)
+
+    def __len__ (self) :
+        ''' The number of tokens in the passage. '''
+
+        return self.last_token - self.first_token + 1
+
+class ConcordanceKey (Model) :
+    ''' This holds the sort keys of one of a sequence's occurrences in a document; the words to its left (nearest first)
+        and to its right, up to <depth> of each, separated by spaces. If it's given <concordance_keys>, <Indexed> keeps
+        one of these for every occurrence it stores the position of, whether as an index or as a packed position.
+        Together they make up a sort index, which lets concordances be sorted and paged by the database (see
+        <Access.kwic>). '''
+
+    depth = 2
+
+    def __init__ (self, document, seq, first_token, last_token, tokenization_algorithm=None, words=None) :
+        ''' <words> maps the token indexes of the document to the strings of the words there. '''
+
+        self.document = document
+        self.seq      = seq
+
+        self.first_token = first_token
+        self.last_token  = last_token
+        self.tokenization_algorithm = tokenization_algorithm
+
+        words = words if words is not None else {}
+        self.left  = self._key(words, range(first_token - 1, first_token - self.depth - 1, -1))
+        self.right = self._key(words, range(last_token + 1, last_token + self.depth + 1))
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.seq, self.left, self.right, *args, **kw)
+
+    @staticmethod
+    def _key (words, positions) :
+        # The key stops at the first position without a word (e.g., the start of the document), so keys compare the
+        # same way as tuples of the words would.
+        key = []
+        for position in positions :
+            word = words.get(position)
+            if word is None :
+                break
+            key.append(word)
+        return ' '.join(key)
+
+class Bucket (Model) :
+    ''' This holds the number of times a sequence occurred in all of the documents created within the same span of time
+        (an hour). These are kept up to date by <Indexed>, for documents with a <created_on> time. Buckets allow spikes
+        in the use of a sequence to be spotted (see <Access.trending>) without going through the documents or their
+        indexes. '''
+
+    span = timedelta(hours=1)
+
+    def __init__ (self, seq, start, count=0) :
+        self.seq   = seq
+        self.start = self.start_of(start)
+        self.count = count
+
+    def __int__ (self) :
+        return self.count
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.seq, self.start, self.count, *args, **kw)
+
+    @classmethod
+    def start_of (cls, time) :
+        ''' The start of the bucket that the time falls within. '''
+
+        return time.replace(minute=0, second=0, microsecond=0)
+
+class Constituent (Model) :
+    ''' This links a gram to one of the words it's made up of; a gram has one constituent for every position within
+        it. This allows grams to be looked up structurally, (e.g., all of the grams that start with a particular
+        word). Grams are only broken up into constituents when <Indexed> is asked to. '''
+
+    def __init__ (self, gram, word, position) :
+        self.gram     = gram
+        self.word     = word
+        self.position = position
+
+    def __repr__ (self, *args, **kw) :
+        return super().__repr__(self.position, self.word, *args, **kw)
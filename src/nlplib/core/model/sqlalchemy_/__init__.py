@@ -4,24 +4,31 @@
 
 from contextlib import contextmanager
 
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, class_mapper, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy import exc as sqlalchemy_exc
 from sqlalchemy import create_engine
 
 from nlplib.core.model.sqlalchemy_.map import default_mapped
-from nlplib.core.model.sqlalchemy_.access import Access
+from nlplib.core.model.sqlalchemy_.naturallanguage import SeqMapper
+from nlplib.core.model.sqlalchemy_.access import Access, track_changes
 from nlplib.core.model.exc import IntegrityError, StorageError
 from nlplib.core.model import abstract
+from nlplib.general.cache import Cache
+from nlplib.general.store import TextStore
+from nlplib.general.compress import compress
 
 __all__ = ['Session', 'Database']
 
 _make_sqlalchemy_session = sessionmaker(expire_on_commit=False)
+track_changes(_make_sqlalchemy_session)
 
 class Session (abstract.Session) :
     def __init__ (self, sqlalchemy_session) :
         self._sqlalchemy_session = sqlalchemy_session
 
         self.access = Access(self)
+        sqlalchemy_session.info['access'] = self.access
 
     def __contains__ (self, object) :
         return object in self._sqlalchemy_session
@@ -45,19 +52,92 @@ class Session (abstract.Session) :
             return objects
 
     def _remove (self, object) :
+        # Removals are noted right away, like additions are (see <track_changes>).
+        self._sqlalchemy_session.info.setdefault('pending_classes', set()).add(object.__class__)
         self._sqlalchemy_session.delete(object)
 
+    def _reference (self, cls, id, **attrs) :
+        object = self._sqlalchemy_session.identity_map.get(identity_key(cls, id))
+
+        if object is None :
+            # The object isn't in the session yet, so one is built from what is already known about it. Its
+            # relationships (e.g., <Seq.indexes>) are left unloaded, so appending to them via a backref doesn't
+            # trigger a load either.
+            object = class_mapper(cls).class_manager.new_instance()
+            object._id = id
+            for name, value in attrs.items() :
+                setattr(object, name, value)
+
+            make_transient_to_detached(object)
+            self._sqlalchemy_session.add(object)
+
+        return object
+
 class Database (abstract.Database) :
 
-    def __init__ (self, *args, **kw) :
+    # How many neighbour profiles (see <Access.neighbours>), and Bloom filters of the sequences in documents (see
+    # <Access.contains>) are cached.
+    neighbour_cache_size = 1000
+    bloom_cache_size     = 1000
+
+    def __init__ (self, *args, store=None, compression=None, compression_threshold=1000, inheritance='single',
+                  lookup_cache_size=None, **kw) :
+        ''' store                 : the path of a text store (see <nlplib.general.store>), if given, the strings of the
+                                    documents added to the database are kept in it rather than in the database itself
+            compression           : the name of a compression method (see <nlplib.general.compress>), if given (and
+                                    there isn't a text store), the strings of documents are compressed
+            compression_threshold : strings shorter than this aren't worth compressing
+            inheritance           : words and grams are always read from the <seq> table alone, with <'single'> that's
+                                    the only table they're written to; with <'joined'> they're also written to the
+                                    <word> and <gram> tables, which older versions of nlplib read them from (see
+                                    <nlplib.core.model.sqlalchemy_.migrate.match_seq_inheritance>)
+            lookup_cache_size     : if given, this many of the results of <Access.word>, <Access.gram>, <Access.seq>,
+                                    <Access.most_common> and <Access.neural_network> are cached, and shared by every
+                                    session of the database; they're thrown out whenever a session commits changes to
+                                    the objects they depend on (see <Database.lookup_cache> for how well it's doing) '''
+
+        if inheritance not in ('single', 'joined') :
+            raise ValueError("The inheritance can either be 'single' or 'joined'.")
+
         super().__init__(*args, **kw)
 
+        self.inheritance = inheritance
+
+        # The word and gram tables are only made for databases with joined inheritance, but they're kept up to date
+        # whenever they're there.
+        subtype_tables = {default_mapped.tables[subtype] for subtype in SeqMapper.subtypes}
         self._sqlalchemy_engine = create_engine(self.path)
-        default_mapped.metadata.create_all(self._sqlalchemy_engine)
+        default_mapped.metadata.create_all(self._sqlalchemy_engine,
+                                           tables=[table for table in default_mapped.metadata.sorted_tables
+                                                   if inheritance == 'joined' or table not in subtype_tables])
+        self._seq_subtype_tables = all(self._sqlalchemy_engine.has_table(subtype) for subtype in SeqMapper.subtypes)
+
+        self._neighbour_cache = Cache(self.neighbour_cache_size)
+        self._bloom_cache     = Cache(self.bloom_cache_size)
+        self._lookup_cache    = Cache(lookup_cache_size) if lookup_cache_size is not None else None
+        self._store = TextStore(store) if store is not None else None
+
+        if compression is not None :
+            compress('', compression) # This checks that the method exists.
+            self._compression = (compression, compression_threshold)
+        else :
+            self._compression = None
+
+    @property
+    def lookup_cache (self) :
+        ''' The lookup cache (see <Cache> for its hits, misses and hit rate), or <None> if it isn't used. '''
+
+        return self._lookup_cache
 
     @contextmanager
     def session (self) :
-        sqlalchemy_session = _make_sqlalchemy_session(bind=self._sqlalchemy_engine.connect())
+        sqlalchemy_session = _make_sqlalchemy_session(bind=self._sqlalchemy_engine.connect(),
+                                                      info={'neighbour_cache' : self._neighbour_cache,
+                                                            'bloom_cache'     : self._bloom_cache,
+                                                            'lookup_cache'    : self._lookup_cache,
+                                                            'store'           : self._store,
+                                                            'compression'     : self._compression,
+                                                            'seq_subtype_tables' : self._seq_subtype_tables})
 
         try :
             yield Session(sqlalchemy_session)
@@ -68,10 +148,207 @@ class Database (abstract.Database) :
         finally :
             sqlalchemy_session.close()
 
+def _test_store (ut) :
+    import os
+    import tempfile
+
+    from nlplib.core.model import Document
+    from nlplib.core.process.index import Indexed
+
+    with tempfile.TemporaryDirectory() as directory :
+        path = 'sqlite:///' + os.path.join(directory, 'nlplib.db')
+        db = Database(path, store=os.path.join(directory, 'text'))
+
+        strings = ['the cat  sat on the mat', 'na\xefve \u2014 the caf\xe9', 'the \U0001f408 sat']
+
+        with db as session :
+            indexed = Indexed(session)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=2)
+
+        # Only the location of the strings is kept in the database.
+        rows = db._sqlalchemy_engine.execute('SELECT string, text_length, text_width FROM document').fetchall()
+        ut.assert_equal(rows, [(None, 23, 1), (None, 16, 2), (None, 9, 4)])
+
+        # The strings can be read through another database object too.
+        for db in (db, Database(path, store=os.path.join(directory, 'text'))) :
+            with db as session :
+                access = session.access
+
+                documents = sorted(access.all_documents(), key=lambda document : document._id)
+                ut.assert_equal([str(document) for document in documents], strings)
+                ut.assert_equal([len(document) for document in documents], [23, 16, 9])
+                ut.assert_equal(documents[1].snippet(6, 7), '\u2014')
+                ut.assert_equal(documents[2].snippet(-3), 'sat')
+
+                the = access.word('the')
+                ut.assert_equal([raw for document, index, raw in the.concordance().raw()], ['the'] * 4)
+                ut.assert_equal([tuple(context[3:]) for context in access.contexts(access.word('sat'), before=1)],
+                                [('cat  ', 'sat', ' on the'), ('the \U0001f408 ', 'sat', '')])
+
+        # Changing the string of a document stores it again.
+        with db as session :
+            document = sorted(session.access.all_documents(), key=lambda document : document._id)[0]
+            document.string = 'a new string'
+
+        with db as session :
+            ut.assert_equal(sorted(str(document) for document in session.access.all_documents())[0], 'a new string')
+
+        db._store.close()
+        db._sqlalchemy_engine.dispose()
+
+def _test_compression (ut) :
+    from nlplib.core.model.sqlalchemy_.access import _counting_statements
+
+    from nlplib.core.model import Document
+    from nlplib.core.process.index import Indexed
+
+    ut.assert_raises(lambda : Database(compression='gzip'), ValueError)
+
+    for method in ('zlib', 'lzma') :
+        db = Database(compression=method, compression_threshold=20)
+
+        strings = ['the cat sat on the mat, the cat sat on the mat', 'na\xefve caf\xe9 \U0001f408 ' * 3, 'short']
+
+        with db as session :
+            indexed = Indexed(session)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=1)
+
+        # Only the strings under the threshold are kept as they are.
+        rows = db._sqlalchemy_engine.execute('SELECT string, text_compression, text_length FROM document').fetchall()
+        ut.assert_equal(rows, [(None, method, 46), (None, method, 39), ('short', None, None)])
+
+        statements = _counting_statements(db)
+
+        with db as session :
+            access = session.access
+
+            documents = sorted(access.all_documents(), key=lambda document : document._id)
+            ut.assert_equal([len(document) for document in documents], [46, 39, 5])
+
+            # The compressed strings aren't loaded until they're needed, and then only once.
+            ut.assert_true(not any('text_compressed' in statement for statement in statements))
+
+            ut.assert_equal([tuple(context[3:]) for context in access.contexts(access.word('cat'), before=1)],
+                            [('the ', 'cat', ' sat on'), ('the ', 'cat', ' sat on')])
+            ut.assert_equal(access.contexts(access.word('caf\xe9'), before=1, after=0)[-1][3:],
+                            ('na\xefve ', 'caf\xe9', ''))
+            ut.assert_equal([str(document) for document in documents], strings)
+            ut.assert_equal(sum('text_compressed' in statement for statement in statements), 2)
+
+            # Changing the string compresses it again.
+            documents[0].string = 'the dog sat on the mat, the dog sat on the mat'
+
+        with db as session :
+            document = sorted(session.access.all_documents(), key=lambda document : document._id)[0]
+            ut.assert_equal((str(document), document._text_compression), (str(document).replace('cat', 'dog'), method))
+
+def _test_inheritance (ut) :
+    from nlplib.core.model.sqlalchemy_.access import _counting_statements
+
+    from nlplib.core.model import Word, Gram
+
+    for inheritance, inserts in [('single', 2), ('joined', 4)] :
+        db = Database(inheritance=inheritance)
+
+        statements = _counting_statements(db)
+
+        with db as session :
+            session.add_many([Word('cat'), Gram('the cat')])
+        ut.assert_equal(sum(statement.startswith('INSERT') for statement in statements), inserts)
+
+        # Words and grams are looked up in the sequence table alone.
+        with db as session :
+            del statements[:]
+            ut.assert_equal((session.access.word('cat'), session.access.gram('the cat')),
+                            (Word('cat'), Gram('the cat')))
+            ut.assert_true(not any('JOIN' in statement for statement in statements))
+
+def _test_lookup_cache (ut) :
+    from nlplib.core.model.sqlalchemy_.access import _counting_statements
+
+    from nlplib.core.model import Document, Word, Gram, NeuralNetwork
+    from nlplib.core.model.abstract.access import abstract_test as abstract_access_test
+    from nlplib.core.process.index import Indexed
+
+    abstract_access_test(ut, lambda : Database(lookup_cache_size=100))
+
+    db = Database(lookup_cache_size=100)
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat saw the dog')), max_gram_length=2)
+        session.add(NeuralNetwork(2, 2, name='nn'))
+
+    statements = _counting_statements(db)
+
+    def lookups (session) :
+        access = session.access
+        return (access.word('cat'), access.word('bird'), access.gram('the cat'), access.most_common(Word),
+                access.most_common(Word, fields=('string',)), access.neural_network('nn'))
+
+    with db as session :
+        expected = lookups(session)
+    ut.assert_true(len(statements) >= 6)
+
+    # Every session after the first is served from memory, with objects of its own.
+    del statements[:]
+    for _ in range(3) :
+        with db as session :
+            cached = lookups(session)
+            ut.assert_equal(cached[:-1], expected[:-1])
+            ut.assert_true(all(object in session for object in cached if hasattr(object, '_id')))
+            ut.assert_equal(cached[-1].name, 'nn')
+    ut.assert_equal(statements, [])
+    ut.assert_equal((db.lookup_cache.hits, db.lookup_cache.misses), (18, 6))
+
+    # Committing a new word throws out the lookups which depend on sequences, but not the neural network.
+    with db as session :
+        session.add(Word('bird'))
+        ut.assert_equal(session.access.word('bird'), Word('bird'))
+
+    del statements[:]
+    with db as session :
+        ut.assert_equal(session.access.word('bird'), Word('bird'))
+        ut.assert_equal(session.access.neural_network('nn').name, 'nn')
+    ut.assert_equal(len(statements), 1)
+
+    # Loading objects doesn't stop a session from using the cache, adding or removing them does, straight away.
+    with db as session :
+        session.access.word('cat')
+        list(session.access.all_words())
+        del statements[:]
+        ut.assert_equal(session.access.word('cat'), Word('cat'))
+        ut.assert_equal(statements, [])
+
+        session.remove(session.access.word('bird'))
+        ut.assert_equal(session.access.word('bird'), None)
+        ut.assert_equal(session.access.neural_network('nn').name, 'nn')
+
+    with db as session :
+        ut.assert_equal(session.access.word('bird'), None)
+
+    # Nothing is cached from a session with uncommitted changes, or if it's rolled back.
+    try :
+        with db as session :
+            session.add(Word('fish'))
+            ut.assert_equal(session.access.word('fish'), Word('fish'))
+            raise ValueError
+    except ValueError :
+        pass
+
+    with db as session :
+        ut.assert_equal(session.access.word('fish'), None)
+
+    ut.assert_true(Database().lookup_cache is None)
+
 def __test__ (ut) :
     from nlplib.core.model.abstract import abstract_test
 
     abstract_test(ut, Database)
+    _test_store(ut)
+    _test_compression(ut)
+    _test_inheritance(ut)
+    _test_lookup_cache(ut)
 
 if __name__ == '__main__' :
     from nlplib.general.unittest import UnitTest
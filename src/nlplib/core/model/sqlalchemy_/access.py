@@ -1,47 +1,1187 @@
 
 
-from sqlalchemy.sql import or_
-from sqlalchemy import func
+from datetime import datetime
+from itertools import chain
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlalchemy.sql import or_, exists, and_, select, union, union_all, literal, case, tuple_
+from sqlalchemy.orm import aliased, class_mapper, undefer, selectinload, joinedload, raiseload
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, Text, func, event, inspect
 
 from nlplib.core.model.abstract import access as abstract
-from nlplib.core.model import Document, Seq, Gram, Word, Index, NeuralNetwork
+from nlplib.core.model import (Document, Seq, Gram, Word, Index, Frequency, Tokenization, Passage, ConcordanceKey,
+                               Bucket, Constituent, NeuralNetwork)
+from nlplib.core.model.neuralnetwork import Structure, Layer, NeuralNetworkIO
+from nlplib.core.process.token import tokenizer
 from nlplib.general.iterate import chunked
+from nlplib.general.pack import unpack
+from nlplib.general.bloom import BloomFilter
+from nlplib.general import fingerprint
+
+__all__ = ['Access', 'track_changes']
+
+# The character ranges that <Access.contexts> reads out of the documents are put in here, so that they can all be read
+# with a single query.
+_windows = Table('concordance_window', MetaData(),
+                 Column('id', Integer, primary_key=True),
+                 Column('document_id', Integer, nullable=False),
+                 Column('start', Integer, nullable=False),
+                 Column('length', Integer, nullable=False),
+                 prefixes=['TEMPORARY'])
+
+# Large sets of strings are put in here by <Access.matching>, and joined against the sequences.
+_strings = Table('matching_string', MetaData(),
+                 Column('string', Text, primary_key=True),
+                 Column('fingerprint', BigInteger, nullable=False),
+                 prefixes=['TEMPORARY'])
+
+_missing = object()
+
+@lru_cache(maxsize=None)
+def _row (fields) :
+    return namedtuple('Row', fields)
+
+def _undeferred (query, heavy=True) :
+    # The heavy columns (e.g., the strings of documents) are deferred, so they're only loaded when they're first used,
+    # unless they're asked for up front.
+    return query.options(undefer('*')) if heavy else query
+
+def _network_profile (cls) :
+    structure = selectinload(cls._structure)
+    layers = structure.selectinload(Structure.layers)
 
-__all__ = ['Access']
+    # The objects of the inputs and outputs are set up as soon as they're loaded, so they have to be joined in.
+    return [layers.undefer('*'), layers.selectinload(Layer.io).joinedload(NeuralNetworkIO._model),
+            structure.selectinload(Structure.connections).undefer('*')]
 
 class Access (abstract.Access) :
-    def _all (self, cls, chunk_size=100) :
-        yield from self.session._sqlalchemy_session.query(cls).yield_per(chunk_size)
+
+    # The loader options of each profile, for the kinds of objects they apply to.
+    profiles = {'counts'      : {Seq : lambda cls : [selectinload(cls.indexes), selectinload(cls.frequencies)]},
+                'concordance' : {Seq : lambda cls : [selectinload(cls.indexes).joinedload(Index.document)
+                                                                               .undefer(Document._string)]},
+                'network'     : {NeuralNetwork : _network_profile},
+                'strict'      : {object : lambda cls : [raiseload('*')]}}
+
+    # A Bloom filter of a document's sequences is built once the document has been checked this many times (see
+    # <Access.contains>).
+    bloom_threshold  = 4
+    bloom_error_rate = 0.01
+
+    # The lookups that can be served from the lookup cache (see <Database>), and the classes whose changes make their
+    # cached results stale.
+    cached_lookups = {'seq'            : (Seq,),
+                      'most_common'    : (Seq, Index, Frequency, Document),
+                      'neural_network' : (NeuralNetwork,)}
+
+    # <Access.matching> joins against a temporary table of the strings, rather than checking them in chunks, once
+    # there are more than this many of them.
+    matching_threshold = 1000
+
+    def _count (self, cls) :
+        # This works out <Seq.count> in the database, see <Access.most_common> for how occurrences are counted.
+        indexed = select([func.count()]).where(Index._seq_id == cls._id).as_scalar()
+        tallied = select([func.coalesce(func.sum(Frequency.count), 0)])
+        tallied = tallied.where(and_(Frequency._seq_id == cls._id, ~Frequency.indexed)).as_scalar()
+        return indexed + tallied
+
+    def _field (self, cls, name, count=None) :
+        if name == 'count' and issubclass(cls, Seq) :
+            return (self._count(cls) if count is None else count).label(name)
+
+        # Most fields are columns, some of which are mapped as private attributes (e.g., <Seq._id>).
+        column_attrs = class_mapper(cls).column_attrs
+        for key in (name, '_' + name) :
+            if key in column_attrs :
+                return getattr(cls, key).label(name)
+
+        raise ValueError('{cls} has no field {name!r}.'.format(cls=cls.__name__, name=name))
+
+    def _projected (self, cls, fields, count=None, *extra) :
+        ''' This returns a query for the fields (and any extra columns) of the objects, rather than for the objects
+            themselves, and the type of row to put the fields in. '''
+
+        fields = tuple(fields)
+        columns = [self._field(cls, name, count) for name in fields] + list(extra)
+
+        return (self.session._sqlalchemy_session.query(*columns).select_from(cls), _row(fields))
+
+    def _loaded (self, query, cls, load=None) :
+        # The options of the profile (by default, the one the session is using) which apply to the class are added.
+        profile = self.profile(load)
+        options = [option for base, make_options in profile.items() if issubclass(cls, base)
+                   for option in make_options(cls)]
+        return query.options(*options) if options else query
+
+    def _all (self, cls, chunk_size=100, fields=None, undefer=False, load=None) :
+        if fields is None :
+            query = _undeferred(self.session._sqlalchemy_session.query(cls), undefer)
+            yield from self._loaded(query, cls, load).yield_per(chunk_size)
+        else :
+            query, row = self._projected(cls, fields)
+            for values in query.yield_per(chunk_size) :
+                yield row._make(values)
+
+    def _lookup_cache (self, lookup) :
+        # The cache is only used by sessions which haven't changed anything the lookup depends on, so that uncommitted
+        # changes never make their way into it. The classes of the objects that were added or removed (but not yet
+        # flushed), and of those that were flushed are noted as it happens (see <track_changes>).
+        info = self.session._sqlalchemy_session.info
+        cache = info.get('lookup_cache')
+        if cache is not None :
+            changed = chain(info.get('pending_classes', ()), info.get('changed_classes', ()))
+            if not any(issubclass(cls, self.cached_lookups[lookup]) for cls in changed) :
+                return cache
+        return None
+
+    def _cached (self, key, look_up, dump, restore) :
+        ''' This returns the result of <look_up>, from the lookup cache if it's there. The results are cached as plain
+            values (made by <dump>), which <restore> turns back into objects of this session. '''
+
+        cache = self._lookup_cache(key[0])
+        if cache is None :
+            return look_up()
+
+        cached = cache.get(key, _missing)
+        if cached is not _missing :
+            return restore(cached)
+
+        result = look_up()
+
+        # Looking the result up may have flushed changes.
+        if self._lookup_cache(key[0]) is not None :
+            cache[key] = dump(result)
+        return result
+
+    def _dump_seq (self, seq) :
+        return (seq.__class__, seq._id, seq.string) if seq is not None else None
+
+    def _restore_seq (self, cached) :
+        return self.session._reference(cached[0], cached[1], string=cached[2]) if cached is not None else None
 
     def _seq (self, cls, string) :
-        return self.session._sqlalchemy_session.query(cls).filter_by(string=string).first()
+        # The fingerprint index narrows the search down to (almost always) a single row. The strings are compared
+        # here, rather than in the query, so that the database has nothing to go on but the index.
+        def look_up () :
+            query = self.session._sqlalchemy_session.query(cls).filter(cls._fingerprint == fingerprint(string))
+            return next((seq for seq in query.all() if seq.string == string), None)
+
+        return self._cached(('seq', cls, string), look_up, self._dump_seq, self._restore_seq)
+
+    def specific (self, cls, id, undefer=False, load=None) :
+        return self._loaded(_undeferred(self.session._sqlalchemy_session.query(cls), undefer), cls, load).get(id)
+
+    def _document_criteria (self, url_prefix=None, since=None, until=None) :
+        criteria = []
+        if url_prefix is not None :
+            criteria.append(Document.url.startswith(url_prefix))
+        if since is not None :
+            criteria.append(Document.created_on >= since)
+        if until is not None :
+            criteria.append(Document.created_on < until)
+        return criteria
+
+    def most_common (self, cls=Seq, top=10, fields=None, load=None, **filters) :
+        if self.profile(load) :
+            # The related objects of the profile aren't cached.
+            return self._most_common(cls, top, fields, load, **filters)
+
+        key = ('most_common', cls, top, fields if fields is None else tuple(fields), tuple(sorted(filters.items())))
+        if fields is None :
+            return self._cached(key, lambda : self._most_common(cls, top, **filters),
+                                lambda seqs : [self._dump_seq(seq) for seq in seqs],
+                                lambda cached : [self._restore_seq(seq) for seq in cached])
+        else :
+            return self._cached(key, lambda : self._most_common(cls, top, fields, **filters), tuple, list)
+
+    def _most_common (self, cls=Seq, top=10, fields=None, load=None, **filters) :
+        session = self.session._sqlalchemy_session
+        criteria = self._document_criteria(**filters)
+
+        if criteria :
+            # There's a frequency for every sequence in every indexed document, so these are aggregated instead of the
+            # (much more numerous) indexes.
+            counts = session.query(Frequency._seq_id.label('seq_id'), func.sum(Frequency.count).label('count'))
+            counts = counts.join(Document, Frequency.document).filter(*criteria).group_by(Frequency._seq_id)
+            counts = counts.subquery()
+
+            count = counts.c.count
+            query, row = self._projected(cls, fields, count) if fields is not None else (session.query(cls), None)
+            query = query.join(counts, counts.c.seq_id == cls._id).order_by(count.desc())
+        else :
+            # Every index counts as a single occurrence, while a frequency row counts for however many it tallied.
+            # Frequencies which tally up indexes are left out, because the indexes are already counted.
+            occurrences = union_all(select([Index._seq_id.label('seq_id'), literal(1).label('count')]),
+                                    select([Frequency._seq_id.label('seq_id'),
+                                            Frequency.count.label('count')]).where(~Frequency.indexed)).alias()
+
+            count = func.sum(occurrences.c.count)
+            query, row = self._projected(cls, fields, count) if fields is not None else (session.query(cls), None)
+            query = query.join(occurrences, occurrences.c.seq_id == cls._id)
+            query = query.group_by(cls._id if fields is not None else cls).order_by(count.desc())
+
+        if row is None :
+            return self._loaded(query, cls, load).slice(0, top).all()
+        else :
+            return [row._make(values) for values in query.slice(0, top)]
+
+    def indexes (self, document, passage=None) :
+        query = self.session._sqlalchemy_session.query(Index, Seq).filter(Index.document == document)
+        if passage is not None :
+            query = query.filter(Index.passage == passage)
+        return query.join(Seq).all()
+
+    def passages_containing (self, seq, top=10) :
+        if getattr(seq, '_id', None) is None :
+            return []
+
+        count = func.count(Index._id)
+
+        query = self.session._sqlalchemy_session.query(Passage, count)
+        query = query.join(Index, and_(Index._document_id == Passage._document_id, Index.passage == Passage.number))
+        query = query.filter(Index._seq_id == seq._id).group_by(Passage._document_id, Passage.number)
+        return query.order_by(count.desc(), Passage._document_id, Passage.number).slice(0, top).all()
+
+    def frequencies (self, document) :
+        query = self.session._sqlalchemy_session.query(Frequency, Seq)
+        return query.filter(Frequency.document == document).join(Seq).all()
+
+    def document_frequency (self, seq, **filters) :
+        if getattr(seq, '_id', None) is None :
+            return 0
+
+        criteria = self._document_criteria(**filters)
+        if criteria :
+            query = self.session._sqlalchemy_session.query(func.count(Frequency._document_id))
+            return query.join(Document, Frequency.document).filter(Frequency._seq_id == seq._id, *criteria).scalar()
+
+        # Every indexed document has a frequency for each of its sequences.
+        query = self.session._sqlalchemy_session.query(func.count(Frequency._document_id))
+        return query.filter(Frequency._seq_id == seq._id).scalar()
+
+    def _seq_ids (self, document) :
+        # The ids of the sequences in a document, whether they're indexed (every one of which has a frequency), or
+        # associated directly.
+        association = Document.seqs.property.secondary
+        return union(select([Frequency._seq_id]).where(Frequency._document_id == document._id),
+                     select([association.c.seq_id]).where(association.c.document_id == document._id))
+
+    def _bloom (self, document) :
+        sqlalchemy_session = self.session._sqlalchemy_session
+
+        cache = sqlalchemy_session.info.get('bloom_cache')
+        if cache is None or document._id in sqlalchemy_session.info.get('changed_documents', ()) :
+            # The filters are shared by every session, so they don't know about the changes that haven't been
+            # committed yet.
+            return None
+
+        # Until the filter is built, the cache holds the number of times the document has been checked.
+        checked = cache.get(document._id, 0)
+        if isinstance(checked, BloomFilter) :
+            return checked
+        elif checked + 1 < self.bloom_threshold :
+            cache[document._id] = checked + 1
+            return None
+
+        seq_ids = [seq_id for seq_id, in sqlalchemy_session.execute(self._seq_ids(document))]
+        bloom = cache[document._id] = BloomFilter(len(seq_ids), self.bloom_error_rate)
+        bloom.update(seq_ids)
+        return bloom
+
+    def contains (self, document, seq) :
+        # Changes to the document's sequences which haven't been flushed yet are flushed first, nothing else is (not
+        # even by the queries below).
+        sqlalchemy_session = self.session._sqlalchemy_session
+        pending = any(issubclass(cls, (Document, Index, Frequency, Seq))
+                      for cls in sqlalchemy_session.info.get('pending_classes', ()))
+        if sqlalchemy_session.autoflush and (pending or (document in sqlalchemy_session and
+                                                         sqlalchemy_session.is_modified(document))) :
+            sqlalchemy_session.flush()
+
+        with sqlalchemy_session.no_autoflush :
+            return self._contains(document, seq)
+
+    def _contains (self, document, seq) :
+        if not isinstance(seq, Seq) or getattr(document, '_id', None) is None :
+            return False
+        elif getattr(seq, '_id', None) is None :
+            seq = self._seq(seq.__class__, seq.string)
+            if seq is None :
+                return False
+
+        bloom = self._bloom(document)
+        if bloom is not None and seq._id not in bloom :
+            return False
+
+        association = Document.seqs.property.secondary
+        criteria = [exists().where(and_(Frequency._seq_id == seq._id, Frequency._document_id == document._id)),
+                    exists().where(and_(association.c.seq_id == seq._id, association.c.document_id == document._id))]
+        return self.session._sqlalchemy_session.query(or_(*criteria)).scalar()
+
+    def document_seqs (self, document, type=None) :
+        if getattr(document, '_id', None) is None :
+            return []
+
+        query = self.session._sqlalchemy_session.query(Seq).filter(Seq._id.in_(self._seq_ids(document)))
+        if type is not None :
+            query = query.filter(Seq._type == type)
+        return query.all()
+
+    def _packed_occurrences (self, seq) :
+        # The positions go with the tokenization algorithm of the document's tokenization.
+        packed = self.session._sqlalchemy_session.query(Frequency._document_id, Frequency._positions,
+                                                        Tokenization.tokenization_algorithm)
+        packed = packed.outerjoin(Tokenization, Tokenization._document_id == Frequency._document_id)
+        packed = packed.filter(Frequency._seq_id == seq._id, Frequency._positions != None).all()
+        if not packed :
+            return []
+
+        length = len(seq.seqs) if seq._is_gram else 1
+        return [(document_id, first_token, first_token + length - 1, tokenization_algorithm)
+                for document_id, positions, tokenization_algorithm in packed for first_token in unpack(positions)]
+
+    def _occurrences (self, seq) :
+        occurrences = self.session._sqlalchemy_session.query(Index._document_id, Index.first_token, Index.last_token,
+                                                             Index.tokenization_algorithm)
+        occurrences = occurrences.filter(Index._seq_id == seq._id).all()
 
-    def specific (self, cls, id) :
-        return self.session._sqlalchemy_session.query(cls).get(id)
+        return sorted(occurrences + self._packed_occurrences(seq))
 
-    def most_common (self, cls=Seq, top=10) :
+    def _spans (self, documents, occurrences, chunk_size=100) :
+        session = self.session._sqlalchemy_session
+
+        spans = {}
+        for tokenization in session.query(Tokenization).filter(Tokenization._document_id.in_(documents)) :
+            spans[(tokenization._document_id, tokenization.tokenization_algorithm)] = tokenization.spans
+
+        # Documents indexed before tokenizations were stored (or indexed with a different tokenization algorithm) are
+        # tokenized again, which means reading the whole document.
+        missing = {(document_id, tokenization_algorithm) for document_id, _, _, tokenization_algorithm in occurrences
+                   if (document_id, tokenization_algorithm) not in spans}
+
+        for chunk in chunked(sorted({document_id for document_id, _ in missing}), chunk_size, trail=True) :
+            for document in _undeferred(session.query(Document)).filter(Document._id.in_(chunk)) :
+                for tokenization_algorithm in {algorithm for id, algorithm in missing if id == document._id} :
+                    tokenize = tokenizer(tokenization_algorithm)
+                    if tokenize is not None :
+                        spans[(document._id, tokenization_algorithm)] = tuple(
+                            (token.first_character_index, token.last_character_index)
+                            for token in tokenize(str(document)))
+
+        return spans
+
+    def _decompressed (self, document_ids, chunk_size=100) :
+        # The documents with compressed strings are held on to for the rest of the session, so that each one is only
+        # decompressed once (see <Document.string>), no matter how many times it's read from.
+        sqlalchemy_session = self.session._sqlalchemy_session
+        documents = sqlalchemy_session.info.setdefault('decompressed', {})
+
+        missing = sorted(document_id for document_id in document_ids if document_id not in documents)
+        for chunk in chunked(missing, chunk_size, trail=True) :
+            query = sqlalchemy_session.query(Document).options(undefer(Document._text_compressed))
+            for document in query.filter(Document._id.in_(chunk)) :
+                documents[document._id] = document
+
+        return documents
+
+    def _contexts (self, occurrences, documents, before=None, after=None) :
+        before = abs(before) if before is not None else 0
+        after  = abs(after) if after is not None else 2
+
+        spans = self._spans(documents, occurrences)
+
+        windows, rows = ([], [])
+        for document_id, first_token, last_token, tokenization_algorithm in occurrences :
+            document_spans = spans.get((document_id, tokenization_algorithm))
+            if document_spans is None :
+                continue
+
+            start = document_spans[max(first_token - before, 0)][0]
+            end   = document_spans[min(last_token + after, len(document_spans) - 1)][1]
+
+            windows.append({'id' : len(windows), 'document_id' : document_id, 'start' : start,
+                            'length' : end - start + 1})
+            rows.append((document_id, first_token, last_token,
+                         document_spans[first_token][0] - start, document_spans[last_token][1] - start + 1))
+
+        if not windows :
+            return []
+
+        # Only the windows are read out of the documents, using <substr> (whose indexes start at one). The strings of
+        # documents kept in the text store are read from there instead, and compressed strings are read through their
+        # documents, which only decompress them once.
+        document = Document._sqlalchemy_table
+        texts = select([_windows.c.id, func.substr(document.c.string, _windows.c.start + 1, _windows.c.length),
+                        _windows.c.start, _windows.c.length, _windows.c.document_id,
+                        document.c.text_offset, document.c.text_length, document.c.text_width,
+                        document.c.text_compression])
+        texts = texts.select_from(_windows.join(document, document.c.id == _windows.c.document_id))
+
+        store = self.session._sqlalchemy_session.info.get('store')
 
+        connection = self.session._sqlalchemy_session.connection()
+        _windows.create(connection)
+        try :
+            connection.execute(_windows.insert(), windows)
+            results = connection.execute(texts).fetchall()
+        finally :
+            _windows.drop(connection)
+
+        compressed = self._decompressed({document_id for _, text, _, _, document_id, _, _, _, compression in results
+                                         if text is None and compression is not None})
+
+        texts = {}
+        for id, text, start, window_length, document_id, offset, length, width, compression in results :
+            if text is None and compression is not None :
+                text = compressed[document_id].snippet(start, start + window_length)
+            elif text is None and store is not None and offset is not None :
+                text = store.read(offset, length, width, start, start + window_length)
+            texts[id] = text
+
+        contexts = []
+        for id, (document_id, first_token, last_token, first, end) in enumerate(rows) :
+            text = texts[id]
+            contexts.append((document_id, first_token, last_token, text[:first], text[first:end], text[end:]))
+
+        return contexts
+
+    def contexts (self, seq, before=None, after=None) :
+        if getattr(seq, '_id', None) is None :
+            return []
+
+        documents = select([Frequency._document_id]).where(Frequency._seq_id == seq._id)
+
+        return self._contexts(self._occurrences(seq), documents, before, after)
+
+    def _packed_neighbours (self, document_ids, chunk_size=100) :
+        # The words (their ids and strings) at every position of the documents, for occurrences stored as packed
+        # positions.
         session = self.session._sqlalchemy_session
-        query = session.query(cls).join(Index).group_by(cls).order_by(func.count(Index._seq_id).desc())
 
-        return query.slice(0, top).all()
+        neighbours = {}
+        for chunk in chunked(sorted(document_ids), chunk_size, trail=True) :
+            indexed = session.query(Index._document_id, Index.first_token, Word._id, Word.string)
+            indexed = indexed.join(Word, Word._id == Index._seq_id)
+            for document_id, position, id, string in indexed.filter(Index._document_id.in_(chunk),
+                                                                    Index.first_token == Index.last_token) :
+                neighbours[(document_id, position)] = (id, string)
+
+            packed = session.query(Frequency._document_id, Frequency._positions, Word._id, Word.string)
+            packed = packed.join(Word, Word._id == Frequency._seq_id)
+            for document_id, positions, id, string in packed.filter(Frequency._document_id.in_(chunk),
+                                                                    Frequency._positions != None) :
+                for position in unpack(positions) :
+                    neighbours[(document_id, position)] = (id, string)
+
+        return neighbours
+
+    def kwic (self, seq, before=None, after=None, order='document', limit=None, offset=None, cursor=None) :
+        if order not in self.kwic_orders :
+            raise ValueError('The order must be one of {0}.'.format(', '.join(self.kwic_orders)))
+
+        if getattr(seq, '_id', None) is None :
+            return ([], None)
+
+        session = self.session._sqlalchemy_session
+
+        if session.query(exists().where(ConcordanceKey._seq_id == seq._id)).scalar() :
+            # The occurrences are paged through the sort index (see <ConcordanceKey>), which holds the occurrences
+            # stored either way, so the database does all of the sorting and skipping. The page is a range scan of one
+            # of its indexes, starting from the cursor if there is one.
+            key = [ConcordanceKey._document_id, ConcordanceKey.first_token]
+            if order != 'document' :
+                key.insert(0, getattr(ConcordanceKey, order))
+
+            query = session.query(ConcordanceKey._document_id, ConcordanceKey.first_token, ConcordanceKey.last_token,
+                                  ConcordanceKey.tokenization_algorithm, *key)
+            query = query.filter(ConcordanceKey._seq_id == seq._id)
+            if cursor is not None :
+                query = query.filter(tuple_(*key) > tuple_(*cursor))
+
+            rows = [(tuple(row[4:]), tuple(row[:4])) for row in query.order_by(*key).limit(limit).offset(offset)]
+        else :
+            rows = self._computed_kwic(seq, order, limit, offset, cursor)
+
+        occurrences = [occurrence for _, occurrence in rows]
+        contexts = self._contexts(occurrences, sorted({occurrence[0] for occurrence in occurrences}), before, after)
+        return (contexts, rows[-1][0] if rows else None)
+
+    def _neighbour (self, position) :
+        # The word indexed at a position in the same document as the occurrence (or an empty string if there isn't
+        # one), this is a correlated subquery so that every occurrence gets exactly one.
+        neighbour = aliased(Index)
+        word = select([Seq.string]).where(and_(Seq._id == neighbour._seq_id, Seq._type == 'word',
+                                               neighbour._document_id == Index._document_id,
+                                               neighbour.first_token == position,
+                                               neighbour.last_token == position))
+        return func.coalesce(word.limit(1).as_scalar(), '')
+
+    def _neighbours_key (self, positions) :
+        # The words at the positions (nearest first), joined up the same way as they are for <ConcordanceKey>.
+        key = None
+        for word in reversed([self._neighbour(position) for position in positions]) :
+            key = word if key is None else case([(word == '', ''), (key == '', word)], else_=word + ' ' + key)
+        return key
+
+    def _computed_kwic (self, seq, order, limit, offset, cursor) :
+        # Without the sort index, the keys of every occurrence are worked out for each page, so the time a page takes
+        # grows with how common the sequence is. The keys and cursors are the same as the sort index's.
+        distances = range(1, ConcordanceKey.depth + 1)
+        if order == 'left' :
+            keys = [self._neighbours_key([Index.first_token - distance for distance in distances])]
+        elif order == 'right' :
+            keys = [self._neighbours_key([Index.last_token + distance for distance in distances])]
+        else :
+            keys = []
+
+        session = self.session._sqlalchemy_session
+
+        # The sort keys are worked out in a subquery, so that they can be compared to the cursor as well as sorted by.
+        keyed = session.query(Index._document_id.label('document_id'), Index.first_token.label('first_token'),
+                              Index.last_token.label('last_token'),
+                              Index.tokenization_algorithm.label('tokenization_algorithm'),
+                              *(key.label('key') for key in keys))
+        keyed = keyed.filter(Index._seq_id == seq._id).subquery()
+
+        key = [keyed.c.key for _ in keys] + [keyed.c.document_id, keyed.c.first_token]
+
+        query = session.query(keyed.c.document_id, keyed.c.first_token, keyed.c.last_token,
+                              keyed.c.tokenization_algorithm, *key)
+        if cursor is not None :
+            query = query.filter(tuple_(*key) > tuple_(*cursor))
+        query = query.order_by(*key)
+        if limit is not None :
+            query = query.limit((offset or 0) + limit)
+
+        rows = [(tuple(row[4:]), tuple(row[:4])) for row in query]
+
+        # Occurrences stored as packed positions can't be sorted by the database, these are sorted here and merged in.
+        packed = self._packed_occurrences(seq)
+        if packed :
+            if keys :
+                words = {position : string for position, (_, string) in
+                         self._packed_neighbours({occurrence[0] for occurrence in packed}).items()}
+                sign, edge = (-1, 1) if order == 'left' else (1, 2)
+
+            for occurrence in packed :
+                document_id = occurrence[0]
+                occurrence_key = (ConcordanceKey._key(words, [(document_id, occurrence[edge] + sign * distance)
+                                                              for distance in distances]),) if keys else ()
+                occurrence_key += (document_id, occurrence[1])
+
+                if cursor is None or occurrence_key > tuple(cursor) :
+                    rows.append((occurrence_key, occurrence))
+
+            rows.sort(key=lambda row : row[0])
+
+        rows = rows[offset or 0:]
+        return rows[:limit] if limit is not None else rows
+
+    def _neighbour_counts (self, seq, distance) :
+        session = self.session._sqlalchemy_session
+
+        # The neighbours of indexed occurrences are found by joining the index table with itself on token positions.
+        occurrence, neighbour = (aliased(Index), aliased(Index))
+        position = (occurrence.first_token if distance < 0 else occurrence.last_token) + distance
+
+        query = session.query(Seq._id, Seq.string, func.count()).select_from(occurrence)
+        query = query.join(neighbour, and_(neighbour._document_id == occurrence._document_id,
+                                           neighbour.first_token == position,
+                                           neighbour.last_token == position))
+        query = query.join(Seq, Seq._id == neighbour._seq_id)
+        query = query.filter(occurrence._seq_id == seq._id, Seq._type == 'word').group_by(Seq._id, Seq.string)
+
+        counts = {(id, string) : count for id, string, count in query}
+
+        packed = self._packed_occurrences(seq)
+        if packed :
+            neighbours = self._packed_neighbours({occurrence[0] for occurrence in packed})
+            for document_id, first_token, last_token, _ in packed :
+                word = neighbours.get((document_id, (first_token if distance < 0 else last_token) + distance))
+                if word is not None :
+                    counts[word] = counts.get(word, 0) + 1
+
+        return counts
+
+    def neighbours (self, seq, distance=1, top=10) :
+        if not distance :
+            raise ValueError('The distance has to be to the left (negative) or to the right (positive).')
+
+        if getattr(seq, '_id', None) is None :
+            return []
+
+        # The profiles are kept by the database (see <_track_changes>), the ids and strings of the words are kept
+        # rather than the words themselves, because they belong to other sessions.
+        cache = self.session._sqlalchemy_session.info.get('neighbour_cache')
+        key = (seq._id, distance)
+
+        counts = cache.get(key) if cache is not None else None
+        if counts is None :
+            counts = sorted(self._neighbour_counts(seq, distance).items(), key=lambda item : (-item[1], item[0][1]))
+            if cache is not None :
+                cache[key] = counts
+
+        return [(self.session._reference(Word, id, string=string), count) for (id, string), count in counts[:top]]
+
+    def buckets (self, time, seqs, chunk_size=100) :
+        ids = [seq._id for seq in seqs if getattr(seq, '_id', None) is not None]
+
+        query = self.session._sqlalchemy_session.query(Bucket).filter(Bucket.start == Bucket.start_of(time))
+        return [bucket for chunked_ids in chunked(ids, chunk_size, trail=True)
+                for bucket in query.filter(Bucket._seq_id.in_(chunked_ids)).all()]
+
+    def trending (self, window=Bucket.span, top=10, baseline=24, now=None, cls=Seq) :
+        if now is None :
+            now = datetime.now()
+
+        # The bucket that <now> falls within is part of the latest window.
+        end = Bucket.start_of(now) + Bucket.span
+        recent_start = end - window
+
+        recent  = func.sum(case([(Bucket.start >= recent_start, Bucket.count)], else_=0))
+        earlier = func.sum(case([(Bucket.start < recent_start, Bucket.count)], else_=0))
+
+        # The counts are smoothed, so that sequences that never showed up before don't have infinite scores.
+        score = (recent + 1.0) / (earlier * 1.0 / baseline + 1.0)
+
+        session = self.session._sqlalchemy_session
+
+        scores = session.query(Bucket._seq_id.label('seq_id'), score.label('score'), recent.label('recent'))
+        scores = scores.filter(Bucket.start >= recent_start - window * baseline, Bucket.start < end)
+        scores = scores.group_by(Bucket._seq_id).having(recent > 0).subquery()
+
+        query = session.query(cls).join(scores, scores.c.seq_id == cls._id)
+        return query.order_by(scores.c.score.desc(), scores.c.recent.desc()).slice(0, top).all()
+
+    def _grams_with_constituent (self, word, *criteria) :
+        if isinstance(word, str) :
+            word = self.word(word)
+        if word is None :
+            return []
+
+        query = self.session._sqlalchemy_session.query(Gram).join(Constituent, Gram._constituents)
+        return query.filter(Constituent._word_id == word._id, *criteria).distinct().all()
+
+    def grams_containing (self, word) :
+        return self._grams_with_constituent(word)
+
+    def grams_starting_with (self, word) :
+        return self._grams_with_constituent(word, Constituent.position == 0)
+
+    def grams_ending_with (self, word) :
+        # The last constituent of a gram is the one without a constituent following it, this can be checked using the
+        # primary key index.
+        following = aliased(Constituent)
+        return self._grams_with_constituent(word, ~exists().where(and_(following._gram_id == Constituent._gram_id,
+                                                                       following.position == Constituent.position + 1)))
+
+    def constituents (self, gram) :
+        if getattr(gram, '_id', None) is None :
+            return []
+
+        query = self.session._sqlalchemy_session.query(Word).join(Constituent, Constituent._word_id == Word._id)
+        return query.filter(Constituent._gram_id == gram._id).order_by(Constituent.position).all()
+
+    def matching (self, strings, cls=Seq, chunk_size=100, fields=None, load=None) :
+        if fields is None :
+            query = self._loaded(self.session._sqlalchemy_session.query(cls), cls, load)
+        else :
+            # The string is always selected (last), so that collisions can be weeded out.
+            query, row = self._projected(cls, fields, None, cls.string)
+
+        strings = set(strings)
+        if len(strings) > self.matching_threshold :
+            matches = self._matching_table(query, cls, strings)
+        else :
+            matches = (match for chunked_strings in chunked(strings, chunk_size, trail=True)
+                       for match in query.filter(cls._fingerprint.in_({fingerprint(string)
+                                                                       for string in chunked_strings})).all())
+
+        for match in matches :
+            # Fingerprint collisions are weeded out here.
+            if fields is None :
+                if match.string in strings :
+                    yield match
+            elif match[-1] in strings :
+                yield row._make(match[:-1])
+
+    def _matching_table (self, query, cls, strings) :
+        # The strings are all sent over at once, and matched up in a single query.
+        connection = self.session._sqlalchemy_session.connection()
+        _strings.create(connection)
+        try :
+            connection.execute(_strings.insert(), [{'string' : string, 'fingerprint' : fingerprint(string)}
+                                                   for string in strings])
+            return query.join(_strings, and_(_strings.c.fingerprint == cls._fingerprint,
+                                             _strings.c.string == cls.string)).all()
+        finally :
+            _strings.drop(connection)
+
+    def neural_network (self, name, undefer=False, load=None) :
+        if undefer or self.profile(load) :
+            return self._neural_network(name, undefer, load)
+
+        # Only the network's id is cached, its elements are loaded as they're used.
+        return self._cached(('neural_network', name), lambda : self._neural_network(name),
+                            lambda network : network._id if network is not None else None,
+                            lambda id : None if id is None else self.session._reference(NeuralNetwork, id, name=name))
+
+    def _neural_network (self, name, undefer=False, load=None) :
+        query = self._loaded(self.session._sqlalchemy_session.query(NeuralNetwork), NeuralNetwork, load)
+        query = query.filter_by(name=name)
+
+        if undefer :
+            # The whole network is loaded up front, with a query for each kind of element.
+            structure = selectinload(NeuralNetwork._structure)
+            query = query.options(structure.selectinload(Structure.layers).undefer('*'),
+                                  structure.selectinload(Structure.connections).undefer('*'))
+
+        return query.first()
+
+def _track_changes (sqlalchemy_session, flush_context) :
+    # The sequences whose occurrences were added, removed or changed are noted when flushed, so that their cached
+    # neighbour profiles can be thrown out once the changes are committed.
+    # The same goes for the documents, and their Bloom filters.
+    # The classes of everything written are noted too, for the lookup cache.
+    changed = sqlalchemy_session.info.setdefault('changed_seqs', set())
+    changed_documents = sqlalchemy_session.info.setdefault('changed_documents', set())
+    changed_classes = sqlalchemy_session.info.setdefault('changed_classes', set())
+    sqlalchemy_session.info.pop('pending_classes', None)
+    for object in chain(sqlalchemy_session.new, sqlalchemy_session.dirty, sqlalchemy_session.deleted) :
+        changed_classes.add(object.__class__)
+        if isinstance(object, (Index, Frequency)) :
+            changed.add(object._seq_id)
+            changed_documents.add(object._document_id)
+        elif isinstance(object, Document) :
+            changed_documents.add(object._id)
+
+def _track_attached (sqlalchemy_session, object) :
+    # Only new objects are noted, not the existing ones put into the session (see <Session._reference>).
+    if inspect(object).key is None :
+        sqlalchemy_session.info.setdefault('pending_classes', set()).add(object.__class__)
+
+def _forget_changes (sqlalchemy_session) :
+    sqlalchemy_session.info.pop('pending_classes', None)
+    sqlalchemy_session.info.pop('changed_seqs', None)
+    sqlalchemy_session.info.pop('changed_documents', None)
+    sqlalchemy_session.info.pop('changed_classes', None)
+
+def _invalidate_changes (sqlalchemy_session) :
+    changed = sqlalchemy_session.info.pop('changed_seqs', set())
+    cache = sqlalchemy_session.info.get('neighbour_cache')
+    if changed and cache is not None :
+        for key in [key for key in cache if key[0] in changed] :
+            del cache[key]
+
+    changed_documents = sqlalchemy_session.info.pop('changed_documents', set())
+    cache = sqlalchemy_session.info.get('bloom_cache')
+    if cache is not None :
+        for document_id in changed_documents :
+            cache.discard(document_id)
+
+    changed_classes = sqlalchemy_session.info.pop('changed_classes', set())
+    cache = sqlalchemy_session.info.get('lookup_cache')
+    if changed_classes and cache is not None :
+        stale = {lookup for lookup, classes in Access.cached_lookups.items()
+                 if any(issubclass(cls, classes) for cls in changed_classes)}
+        for key in [key for key in cache if key[0] in stale] :
+            del cache[key]
+
+def track_changes (sessionmaker) :
+    ''' This keeps the neighbour profiles (see <Access.neighbours>), the Bloom filters of documents (see
+        <Access.contains>) and the lookups (see <Database>) cached for the sessions made by <sessionmaker> up to date.
+        Changes made to the database outside of these sessions aren't noticed.
+
+        Note : The lookups that a session makes use of the cache until it changes something they depend on. Adding and
+        removing objects counts as soon as it's done, while changing the attributes of objects already in the
+        database only counts once the changes are flushed. '''
+
+    event.listen(sessionmaker, 'after_attach', _track_attached)
+    event.listen(sessionmaker, 'after_flush', _track_changes)
+    event.listen(sessionmaker, 'after_commit', _invalidate_changes)
+    event.listen(sessionmaker, 'after_soft_rollback', lambda sqlalchemy_session, previous_transaction :
+                                                       _forget_changes(sqlalchemy_session))
+
+def _counting_statements (db) :
+    ''' This returns a list, which the SQL statements run against the database are appended to from now on. '''
+
+    statements = []
+    event.listen(db._sqlalchemy_engine, 'before_cursor_execute', lambda *args : statements.append(args[2]))
+    return statements
+
+def _test_fingerprint_collisions (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+
+    db = Database()
+
+    with db as session :
+        session.add_many([Word('foo'), Word('bar'), Gram('foo bar')])
+
+    # This fakes a collision, by giving <bar> the same fingerprint as <foo>.
+    with db as session :
+        session._sqlalchemy_session.query(Seq).filter(Seq.string == 'bar').update({Seq._fingerprint :
+                                                                                     fingerprint('foo')})
+
+    with db as session :
+        fingerprints = session._sqlalchemy_session.query(Seq._fingerprint).filter(Seq.string.in_(['foo', 'bar']))
+        ut.assert_equal(set(fingerprints.all()), {(fingerprint('foo'),)})
+
+        ut.assert_equal(session.access.word('foo'), Word('foo'))
+        ut.assert_equal(session.access.gram('foo bar'), Gram('foo bar'))
+        ut.assert_equal(session.access.word('baz'), None)
+        ut.assert_equal(list(session.access.matching(['foo'])), [Word('foo')])
+        ut.assert_equal(sorted(session.access.matching(['foo', 'foo bar'])), [Word('foo'), Gram('foo bar')])
+
+        # Lookups go through the fingerprint index, there's no index over the strings.
+        connection = session._sqlalchemy_session.connection()
+        plan = ' '.join(str(row[-1]) for row in connection.execute('EXPLAIN QUERY PLAN SELECT * FROM seq WHERE '
+                                                                   "fingerprint = 1 AND type IN ('word')"))
+        ut.assert_true('ix_seq_fingerprint_type_string' in plan)
+        inspector = inspect(connection)
+        ut.assert_equal([index['name'] for index in inspector.get_indexes('seq')], ['ix_seq_fingerprint_type_string'])
+
+        # The fingerprint is kept in sync with the string.
+        session.access.word('foo').string = 'baz'
+
+    with db as session :
+        ut.assert_equal(session.access.word('baz')._fingerprint, fingerprint('baz'))
+        ut.assert_equal(session.access.word('foo'), None)
+
+def _test_contexts_queries (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        indexed = Indexed(session)
+        for i in range(20) :
+            indexed.add(session.add(Document('the cat and the dog ' * (i + 1) + 'the end {0}'.format(i))),
+                        max_gram_length=1)
+
+    statements = _counting_statements(db)
+
+    def queries (string) :
+        with db as session :
+            seq = session.access.word(string)
+            del statements[:]
+            contexts = session.access.contexts(seq, before=1, after=1)
+            return (len(contexts), len(statements))
+
+    # The number of queries stays the same, however many occurrences and documents there are.
+    (the_count, the_queries), (end_count, end_queries) = (queries('the'), queries('0'))
+    ut.assert_equal((the_count, end_count), (440, 1))
+    ut.assert_equal(the_queries, end_queries)
+    ut.assert_true(the_queries <= 8)
+
+def _test_kwic_queries (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    for packed in (False, True) :
+        db = Database()
+
+        with db as session :
+            indexed = Indexed(session, packed=packed, concordance_keys=True)
+            for i in range(20) :
+                indexed.add(session.add(Document('the cat and the dog ' * (i + 1) + 'the end {0}'.format(i))),
+                            max_gram_length=1)
+
+        statements = _counting_statements(db)
+
+        def page (string, order) :
+            with db as session :
+                seq = session.access.word(string)
+                del statements[:]
+                contexts, cursor = session.access.kwic(seq, order=order, limit=5, offset=5)
+                return (len(contexts), list(statements))
+
+        # A page takes the same queries, however many occurrences there are, and packed positions aren't decoded.
+        for order in Access.kwic_orders :
+            (the_count, the_statements), (end_count, end_statements) = (page('the', order), page('end', order))
+            ut.assert_equal((the_count, end_count), (5, 5))
+            ut.assert_equal(len(the_statements), len(end_statements))
+            ut.assert_true(not any('FROM frequency' in statement for statement in the_statements))
+
+        # Pages sorted by context are read straight off of the sort index.
+        with db as session :
+            plan = ' '.join(str(row[-1]) for row in session._sqlalchemy_session.connection().execute(
+                'EXPLAIN QUERY PLAN SELECT last_token FROM concordance_key WHERE seq_id = 1 AND '
+                '("left", document_id, first_token) > (\'the\', 1, 1) ORDER BY "left", document_id, first_token '
+                'LIMIT 5'))
+            ut.assert_true('ix_concordance_key_seq_id_left' in plan)
+            ut.assert_true('TEMP B-TREE' not in plan)
+
+def _test_membership (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        document = session.add(Document('the cat sat on the mat'))
+        Indexed(session).add(document, max_gram_length=2)
+        session.add(Word('dog'))
+
+    statements = _counting_statements(db)
+
+    with db as session :
+        access = session.access
+        document = list(access.all_documents())[0]
+        cat, dog = (access.word('cat'), access.word('dog'))
+
+        # Neither the document's sequences nor its indexes are loaded, to find out whether it contains one. There's
+        # a query for each check (and for looking up the sequences which aren't from the database).
+        del statements[:]
+        ut.assert_equal([cat in document, dog in document, Gram('cat sat') in document, Gram('cat dog') in document,
+                         'cat' in document], [True, False, True, False, False])
+        ut.assert_equal(len(statements), 5)
+
+        # A check only flushes the session if the document's sequences may have changed.
+        flushes = []
+        event.listen(session._sqlalchemy_session, 'after_flush', lambda *args : flushes.append(args))
+        session.add(NeuralNetwork(2, 2))
+        ut.assert_true(cat in document)
+        ut.assert_equal(len(flushes), 0)
+        session.add(Word('bird'))
+        ut.assert_true(cat in document)
+        ut.assert_equal(len(flushes), 1)
+
+        ut.assert_equal(sorted(document.words()), [Word(string) for string in ['cat', 'mat', 'on', 'sat', 'the']])
+        ut.assert_equal(len(list(document.grams())), 5)
+        ut.assert_equal(list(document.seqs_only()), [])
+        ut.assert_true(cat in document)
+
+    # Once the document has been checked enough, its Bloom filter rules most sequences out without a query.
+    with db as session :
+        access = session.access
+        document = list(access.all_documents())[0]
+        dog = access.word('dog')
+
+        ut.assert_true(isinstance(db._bloom_cache[document._id], BloomFilter))
+
+        del statements[:]
+        ut.assert_true(dog not in document)
+        ut.assert_equal(len(statements), 0)
+
+        # Changes aren't hidden by the filter, before or after they're committed.
+        document.seqs.append(dog)
+        ut.assert_true(dog in document)
+
+    ut.assert_true(document._id not in db._bloom_cache)
+
+    with db as session :
+        ut.assert_true(session.access.word('dog') in list(session.access.all_documents())[0])
+
+def _test_deferred (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+
+    db = Database()
+
+    with db as session :
+        session.add(Document('the cat sat on the mat', title='cats'))
+        session.add(NeuralNetwork('abc', 3, 'def', name='foo'))
+
+    statements = _counting_statements(db)
+
+    def selected (column) :
+        return any(column in statement.split('FROM')[0] for statement in statements)
+
+    # Listing documents and finding networks doesn't read their heavy columns.
+    with db as session :
+        document = list(session.access.all_documents())[0]
+        ut.assert_equal((document.title, selected('document.string')), ('cats', False))
+
+        ut.assert_equal(str(document), 'the cat sat on the mat')
+        ut.assert_true(selected('document.string'))
+
+        del statements[:]
+        nn = session.access.neural_network('foo')
+        ut.assert_equal(nn.name, 'foo')
+        ut.assert_true(not selected('weights') and not selected('charges'))
+
+        ut.assert_equal(len(list(nn.predict('a'))), 3)
+        ut.assert_true(selected('weights') and selected('charges'))
+
+    # Unless they're asked for up front.
+    with db as session :
+        del statements[:]
+        document = list(session.access.all_documents(undefer=True))[0]
+        nn = session.access.neural_network('foo', undefer=True)
+        ut.assert_true(selected('document.string') and selected('weights') and selected('charges'))
+
+        del statements[:]
+        ut.assert_equal((str(document), len(list(nn.predict('a')))), ('the cat sat on the mat', 3))
+        ut.assert_true(not selected('document.string') and not selected('weights') and not selected('charges'))
+
+def _test_profiles (ut) :
+    from sqlalchemy.exc import InvalidRequestError
+
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        indexed = Indexed(session)
+        for i in range(10) :
+            indexed.add(session.add(Document('the cat sat on mat {0}'.format(i))), max_gram_length=1)
+        session.add(NeuralNetwork('abc', 3, 'def', name='foo'))
+
+    statements = _counting_statements(db)
+
+    def queries (function, load=None) :
+        with db as session :
+            with session.profile(load) :
+                del statements[:]
+                result = function(session.access)
+                return (result, len(statements))
+
+    def counts (access) :
+        return sorted(word.count for word in access.all_words())
+
+    def concordance (access) :
+        return sorted(str(index.document)
+                      for word in access.most_common(Word, top=5) for index in word.indexes)
+
+    def network (access) :
+        return len(list(access.neural_network('foo').predict('ab')))
+
+    # Without a profile, the related objects are loaded one object at a time. The results are the same either way.
+    for function, load, expected_queries in [(counts, 'counts', (31, 3)),
+                                             (concordance, 'concordance', (26, 2)),
+                                             (network, 'network', (11, 5))] :
+        (default_result, default_queries), (profile_result, profile_queries) = (queries(function),
+                                                                                queries(function, load))
+
+        ut.assert_equal(default_result, profile_result)
+        ut.assert_equal((default_queries, profile_queries), expected_queries)
+
+    # The profile can be given to a method directly too, and the strict profile doesn't load anything it isn't asked
+    # to.
+    with db as session :
+        ut.assert_equal(sorted(word.count for word in session.access.all_words(load='counts'))[-1], 10)
+        word = session.access.most_common(Word, top=1, load='strict')[0]
+        ut.assert_raises(lambda : word.indexes, InvalidRequestError)
+
+        ut.assert_raises(lambda : session.profile('sideways').__enter__(), ValueError)
+
+def _test_neighbour_cache (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat sat on the mat')), max_gram_length=1)
+
+    statements = _counting_statements(db)
+
+    def neighbours (string) :
+        with db as session :
+            seq = session.access.word(string)
+            del statements[:]
+            return (session.access.neighbours(seq), len(statements))
+
+    ut.assert_equal(neighbours('the'), ([(Word('cat'), 1), (Word('mat'), 1)], 2))
+    ut.assert_equal(neighbours('the'), ([(Word('cat'), 1), (Word('mat'), 1)], 0))
+    ut.assert_equal((db._neighbour_cache.hits, db._neighbour_cache.misses), (1, 1))
+
+    # Only the profiles of the sequences whose occurrences changed are thrown out.
+    neighbours('cat')
+    with db as session :
+        Indexed(session).add(session.add(Document('a dog')), max_gram_length=1)
+    ut.assert_equal(len(db._neighbour_cache), 2)
+
+    with db as session :
+        Indexed(session).add(session.add(Document('the dog')), max_gram_length=1)
+
+    with db as session :
+        ut.assert_equal(list(db._neighbour_cache), [(session.access.word('cat')._id, 1)])
+
+def _test_rows (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        document = session.add(Document('the cat sat on the mat', url='http://cats.com'))
+        Indexed(session).add(document, max_gram_length=2)
+
+    with db as session :
+        sqlalchemy_session = session._sqlalchemy_session
+        access = session.access
+
+        words = sorted(access.all_words(fields=('string', 'count')))
+        ut.assert_equal(words[-1], ('the', 2))
+        ut.assert_equal((words[-1].string, words[-1].count), ('the', 2))
+        ut.assert_equal(sorted(row.type for row in access.all_seqs(fields=('type',)))[-1], 'word')
+        ut.assert_equal(access.most_common(Word, top=1, fields=('string', 'count')), [('the', 2)])
+        ut.assert_equal(access.most_common(Word, top=1, fields=('string',), url_prefix='http://cats'), [('the',)])
+        ut.assert_equal(list(access.matching(['cat', 'the cat', 'dog'], Gram, fields=('string',))), [('the cat',)])
+        ut.assert_raises(lambda : list(access.all_words(fields=('colour',))), ValueError)
+
+        # The rows aren't objects, so nothing ends up in the session.
+        ut.assert_equal(len(sqlalchemy_session.identity_map), 0)
+
+        # The counts agree with the objects.
+        ut.assert_equal(words, sorted((word.string, word.count) for word in access.all_words()))
+
+def _test_batched_lookups (ut) :
+    from nlplib.core.model.sqlalchemy_ import Database
+
+    db = Database()
+
+    strings = ['word{0}'.format(i) for i in range(5000)]
+    with db as session :
+        for string in strings[::2] :
+            session.add(Word(string))
+        session.add(Gram('word0 word1'))
+
+    statements = _counting_statements(db)
+
+    with db as session :
+        access = session.access
+
+        # The words are looked up with a single query, and the missing ones are filled in with <None>, in order.
+        del statements[:]
+        ut.assert_equal(access.words('word2 word3 word0 word2 word1'),
+                        [Word('word2'), None, Word('word0'), Word('word2'), None])
+        ut.assert_equal(len(statements), 1)
 
-    def indexes (self, document) :
-        return self.session._sqlalchemy_session.query(Index, Seq).filter(Index.document == document).join(Seq).all()
+        # Large sets of strings are matched with a temporary table, which takes a handful of statements (creating,
+        # filling, joining and dropping it) no matter how many strings there are.
+        del statements[:]
+        words = list(access.matching(strings + ['word0 word1'], Word))
+        ut.assert_equal(sorted(str(word) for word in words), sorted(strings[::2]))
+        ut.assert_equal(len(statements), 4)
 
-    def matching (self, strings, cls=Seq, chunk_size=100) :
-        for chunked_strings in chunked(strings, chunk_size, trail=True) :
-            for match in self.session._sqlalchemy_session.query(cls).filter(cls.string.in_(chunked_strings)).all() :
-                yield match
+        ut.assert_equal(sorted(access.matching(strings + ['word0 word1'], Gram, fields=('string',))),
+                        [('word0 word1',)])
+        ut.assert_equal(len(list(access.matching(iter(strings)))), 2500)
+        ut.assert_equal(len(access.words(strings)), 5000)
 
-    def neural_network (self, name) :
-        return self.session._sqlalchemy_session.query(NeuralNetwork).filter_by(name=name).first()
+        # Below the threshold, the strings are checked in chunks.
+        del statements[:]
+        ut.assert_equal(len(list(access.matching(strings[:1000], chunk_size=250))), 500)
+        ut.assert_equal(len(statements), 4)
 
 def __test__ (ut) :
     from nlplib.core.model.abstract.access import abstract_test
     from nlplib.core.model.sqlalchemy_ import Database
 
     abstract_test(ut, Database)
+    _test_fingerprint_collisions(ut)
+    _test_contexts_queries(ut)
+    _test_kwic_queries(ut)
+    _test_membership(ut)
+    _test_deferred(ut)
+    _test_profiles(ut)
+    _test_neighbour_cache(ut)
+    _test_rows(ut)
+    _test_batched_lookups(ut)
 
 if __name__ == '__main__' :
     from nlplib.general.unittest import UnitTest
@@ -19,16 +19,21 @@ class ClassMapper (Base) :
     cls   = None
     name  = None
 
+    # Classes mapped with single table inheritance don't have a table of their own, they share the table of the class
+    # they inherit from.
+    single_table = False
+
     def __init__ (self, metadata, tables, classes) :
         self.metadata = metadata
         self.tables   = tables
         self.classes  = classes
 
-        self.table = Table(self.name, self.metadata, *self.columns())
+        self.table = Table(self.name, self.metadata, *self.columns()) if not self.single_table else None
 
     def map (self) :
-        self.cls._sqlalchemy_table = self.table
-        return mapper(self.cls, self.table, **self.mapper_kw())
+        mapped = mapper(self.cls, self.table, **self.mapper_kw())
+        self.cls._sqlalchemy_table = mapped.local_table
+        return mapped
 
     def columns (self) :
         return ()
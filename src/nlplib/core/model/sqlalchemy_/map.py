@@ -1,6 +1,7 @@
 
 
 from sqlalchemy.exc import ArgumentError
+from sqlalchemy.orm.base import manager_of_class
 from sqlalchemy import MetaData
 
 from nlplib.core.model.sqlalchemy_.base import ClassMapper
@@ -34,6 +35,12 @@ class Mapped (Base) :
         ''' This maps classes to their respective tables. '''
 
         for mapper in self.mappers :
+            # Classes are only mapped once, even if this module is run again (e.g., by the package wide tests, which
+            # import every module afresh). Mapping a subclass again would replace the mapper its parent loads it with.
+            manager = manager_of_class(mapper.cls)
+            if manager is not None and manager.is_mapped :
+                continue
+
             try :
                 mapper.map()
             except ArgumentError :
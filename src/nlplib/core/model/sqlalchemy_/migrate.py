@@ -0,0 +1,666 @@
+''' This module contains functions for bringing databases made by older versions of nlplib up to date. Each migration
+    checks whether it's needed first, so running one against an up to date database does nothing. '''
+
+
+from sqlalchemy import inspect, select, bindparam, exists, and_, or_, func, literal, literal_column
+from sqlalchemy.orm import undefer
+
+from nlplib.core.model.sqlalchemy_.map import default_mapped
+from nlplib.core.model.sqlalchemy_.naturallanguage import SeqMapper
+from nlplib.general.iterate import chunked
+from nlplib.general import fingerprint
+
+__all__ = ['add_fingerprints', 'remove_obsolete_indexes', 'add_frequency_positions', 'remove_redundant_associations',
+           'add_term_frequencies', 'add_tokenizations', 'add_concordance_keys', 'add_constituents',
+           'add_missing_indexes', 'add_text_store_columns',
+           'add_compression_columns', 'add_index_passages', 'match_seq_inheritance', 'migrate']
+
+def _has_column (engine, table_name, column_name) :
+    return any(column['name'] == column_name for column in inspect(engine).get_columns(table_name))
+
+def add_fingerprints (db, chunk_size=10000) :
+    ''' This adds the <fingerprint> column to the <seq> table, fills it in, and indexes it. '''
+
+    engine = db._sqlalchemy_engine
+    seq_table = default_mapped.tables['seq']
+
+    if _has_column(engine, 'seq', 'fingerprint') :
+        return False
+
+    with engine.begin() as connection :
+        connection.execute('ALTER TABLE seq ADD COLUMN fingerprint BIGINT')
+
+        update = seq_table.update().where(seq_table.c.id == bindparam('seq_id')).values(fingerprint=bindparam('fp'))
+
+        rows = connection.execute(select([seq_table.c.id, seq_table.c.string])).fetchall()
+        for chunk in chunked(rows, chunk_size, trail=True) :
+            connection.execute(update, [{'seq_id' : id, 'fp' : fingerprint(string)} for id, string in chunk])
+
+        for index in seq_table.indexes :
+            if 'fingerprint' in index.columns :
+                index.create(connection)
+
+    return True
+
+def remove_obsolete_indexes (db) :
+    ''' This drops the indexes over the fingerprints of sequences alone, and over their fingerprints and types, which
+        the unique one over their fingerprints, types and strings has replaced (see <add_missing_indexes>).
+
+        Note : Older databases also have a unique constraint over the types and strings of sequences, which SQLite can
+        only drop by making the table over again. It's left as it is, lookups don't use it. '''
+
+    obsolete = ('ix_seq_fingerprint', 'ix_seq_fingerprint_type')
+
+    with db._sqlalchemy_engine.begin() as connection :
+        existing = {existing['name'] for existing in inspect(connection).get_indexes('seq')}
+        for name in obsolete :
+            if name in existing :
+                connection.execute('DROP INDEX {0}'.format(name))
+
+    return bool(existing.intersection(obsolete))
+
+def add_frequency_positions (db) :
+    ''' This adds the column used for packed positions to the <frequency> table. '''
+
+    engine = db._sqlalchemy_engine
+
+    if _has_column(engine, 'frequency', 'positions') :
+        return False
+
+    with engine.begin() as connection :
+        connection.execute('ALTER TABLE frequency ADD COLUMN positions BLOB')
+
+    return True
+
+def remove_redundant_associations (db) :
+    ''' Indexing used to associate every sequence with its document directly, as well as through the sequence's
+        indexes. This removes the direct associations which the indexes (or frequencies) already account for.
+
+        Note : This also removes the associations made by indexing with <materialize> (see <Indexed>), so <migrate>
+        only does this for databases made before frequencies tallied up indexes (see <add_term_frequencies>), which
+        is when indexing stopped associating sequences by default. '''
+
+    tables = default_mapped.tables
+    association, index, frequency = (tables['document_seq_association'], tables['index'], tables['frequency'])
+
+    def accounted_for (table) :
+        return exists().where(and_(table.c.document_id == association.c.document_id,
+                                   table.c.seq_id == association.c.seq_id))
+
+    with db._sqlalchemy_engine.begin() as connection :
+        result = connection.execute(association.delete().where(or_(accounted_for(index), accounted_for(frequency))))
+
+    return result.rowcount > 0
+
+def add_term_frequencies (db) :
+    ''' This adds the <indexed> column to the <frequency> table, then tallies up the indexes of every sequence in every
+        document into a frequency (unless the document already has one for the sequence). The covering index used for
+        aggregating frequencies over a set of documents is added too. '''
+
+    engine = db._sqlalchemy_engine
+    index, frequency = (default_mapped.tables['index'], default_mapped.tables['frequency'])
+
+    changed = False
+
+    if not _has_column(engine, 'frequency', 'indexed') :
+        engine.execute('ALTER TABLE frequency ADD COLUMN indexed BOOLEAN NOT NULL DEFAULT 0')
+        changed = True
+
+    with engine.begin() as connection :
+        tallied = select([index.c.seq_id, index.c.document_id, func.count(index.c.id), literal(True)])
+        tallied = tallied.where(~exists().where(and_(frequency.c.seq_id == index.c.seq_id,
+                                                     frequency.c.document_id == index.c.document_id)))
+        tallied = tallied.group_by(index.c.seq_id, index.c.document_id)
+
+        result = connection.execute(frequency.insert().from_select(['seq_id', 'document_id', 'count', 'indexed'],
+                                                                   tallied))
+        changed = changed or result.rowcount > 0
+
+        existing = {existing['name'] for existing in inspect(connection).get_indexes('frequency')}
+        for table_index in frequency.indexes :
+            if table_index.name not in existing :
+                table_index.create(connection)
+                changed = True
+
+    return changed
+
+def add_tokenizations (db, chunk_size=100) :
+    ''' This stores the tokenization (see <Tokenization>) of every indexed document that doesn't have one yet. Their
+        indexes keep their character indexes. '''
+
+    from nlplib.core.model import Document, Index, Tokenization
+    from nlplib.core.process.token import tokenizer
+
+    # Packed positions used to record their tokenization algorithm in every frequency, before it was taken from the
+    # document's tokenization. Databases made back then still have the column.
+    recorded = _has_column(db._sqlalchemy_engine, 'frequency', 'tokenization_algorithm')
+    frequency = default_mapped.tables['frequency']
+
+    added = False
+
+    with db as session :
+        query = session._sqlalchemy_session.query
+
+        untokenized = query(Document).options(undefer(Document._string))
+        untokenized = untokenized.filter(~Document.tokenization.has(), Document._indexed_seqs.any())
+
+        for chunk in chunked(untokenized.all(), chunk_size, trail=True) :
+            for document in chunk :
+                # The tokenization has to match the one the indexes (or packed positions) were made with.
+                tokenization_algorithm = query(Index.tokenization_algorithm).filter(
+                    Index.document == document, Index.tokenization_algorithm != None).limit(1).scalar()
+
+                if tokenization_algorithm is None and recorded :
+                    algorithm = literal_column('tokenization_algorithm')
+                    tokenization_algorithm = session._sqlalchemy_session.execute(
+                        select([algorithm]).select_from(frequency).where(and_(
+                            frequency.c.document_id == document._id, algorithm != None)).limit(1)).scalar()
+
+                tokenize = tokenizer(tokenization_algorithm)
+                if tokenize is not None :
+                    session.add(Tokenization(document, tokenize(str(document)), tokenization_algorithm))
+                    added = True
+
+            session._sqlalchemy_session.flush()
+
+    return added
+
+def add_concordance_keys (db, chunk_size=100) :
+    ''' This stores the sort keys (see <ConcordanceKey>) of the occurrences in every indexed document that doesn't have
+        any yet, whether the occurrences are indexes or packed positions. This isn't part of <migrate>, the keys are
+        only kept when asked for (see <Indexed>), this is how an existing database is brought in line with indexing
+        that does. '''
+
+    from nlplib.core.model import Document, ConcordanceKey
+
+    added = False
+
+    with db as session :
+        query = session._sqlalchemy_session.query
+
+        unkeyed = query(Document).filter(~Document.concordance_keys.any(), Document._indexed_seqs.any())
+
+        for chunk in chunked(unkeyed.all(), chunk_size, trail=True) :
+            for document in chunk :
+                occurrences = session.access.indexes(document)
+                occurrences += [(index, seq) for frequency, seq in session.access.frequencies(document)
+                                for index in frequency.indexes()]
+
+                # The keys are made up of the words at the positions around each occurrence.
+                words = {index.first_token : seq.string for index, seq in occurrences if seq._is_word}
+
+                for index, seq in occurrences :
+                    if index.first_token is not None :
+                        session.add(ConcordanceKey(document, seq, index.first_token, index.last_token,
+                                                   index.tokenization_algorithm, words))
+                        added = True
+
+            session._sqlalchemy_session.flush()
+
+    return added
+
+def add_constituents (db, chunk_size=1000) :
+    ''' This breaks up every gram that hasn't been broken up into its constituent words yet (see <Constituent>). This
+        isn't part of <migrate>, grams are only broken up when asked for (see <Indexed>), this is how an existing
+        database is brought in line with indexing that does. '''
+
+    from nlplib.core.model import Word, Gram, Constituent
+
+    added = False
+
+    with db as session :
+        query = session._sqlalchemy_session.query
+
+        for chunk in chunked(query(Gram).filter(~Gram._constituents.any()).all(), chunk_size, trail=True) :
+            words = {str(word) : word for word in session.access.matching({word for gram in chunk
+                                                                            for word in gram.seqs}, cls=Word)}
+
+            for gram in chunk :
+                # Grams whose words were never stored on their own (e.g., added without <Indexed>) are left alone.
+                if all(word in words for word in gram.seqs) :
+                    gram._constituents = [Constituent(gram, words[word], position)
+                                          for position, word in enumerate(gram.seqs)]
+                    added = True
+
+            session._sqlalchemy_session.flush()
+
+    return added
+
+def add_missing_indexes (db) :
+    ''' This creates any of the tables' indexes that the database doesn't have yet (e.g., the one covering the
+        occurrences of a sequence, used by <Access.contexts>). '''
+
+    changed = False
+
+    with db._sqlalchemy_engine.begin() as connection :
+        inspector = inspect(connection)
+        for table in default_mapped.metadata.sorted_tables :
+            existing = {existing['name'] for existing in inspector.get_indexes(table.name)}
+            for table_index in table.indexes :
+                if table_index.name not in existing :
+                    table_index.create(connection)
+                    changed = True
+
+    return changed
+
+def add_text_store_columns (db) :
+    ''' This adds the columns recording where a document's string is within a text store to the <document> table. '''
+
+    engine = db._sqlalchemy_engine
+
+    if _has_column(engine, 'document', 'text_offset') :
+        return False
+
+    with engine.begin() as connection :
+        connection.execute('ALTER TABLE document ADD COLUMN text_offset BIGINT')
+        connection.execute('ALTER TABLE document ADD COLUMN text_length INTEGER')
+        connection.execute('ALTER TABLE document ADD COLUMN text_width INTEGER')
+
+    return True
+
+def add_compression_columns (db) :
+    ''' This adds the columns holding compressed strings (and the method they were compressed with) to the <document>
+        table. '''
+
+    engine = db._sqlalchemy_engine
+
+    if _has_column(engine, 'document', 'text_compression') :
+        return False
+
+    with engine.begin() as connection :
+        connection.execute('ALTER TABLE document ADD COLUMN text_compression VARCHAR')
+        connection.execute('ALTER TABLE document ADD COLUMN text_compressed BLOB')
+
+    return True
+
+def match_seq_inheritance (db) :
+    ''' This brings the <word> and <gram> tables in line with the database's inheritance (see <Database>). For single
+        inheritance they're dropped (older versions of nlplib can't read the database after that), for joined
+        inheritance they're made if need be, and the words and grams missing from them are added. '''
+
+    seq = default_mapped.tables['seq']
+    changed = False
+
+    with db._sqlalchemy_engine.begin() as connection :
+        existing = set(inspect(connection).get_table_names())
+
+        for subtype in SeqMapper.subtypes :
+            table = default_mapped.tables[subtype]
+
+            if db.inheritance == 'single' :
+                if subtype in existing :
+                    table.drop(connection)
+                    changed = True
+            else :
+                table.create(connection, checkfirst=True)
+
+                missing = select([seq.c.id]).where(and_(seq.c.type == subtype,
+                                                        ~exists().where(table.c.id == seq.c.id)))
+                changed = connection.execute(table.insert().from_select(['id'], missing)).rowcount > 0 or changed
+
+    db._seq_subtype_tables = db.inheritance == 'joined'
+
+    return changed
+
+def add_index_passages (db) :
+    ''' This adds the column recording which passage (see <Passage>) an index is in to the <index> table. '''
+
+    engine = db._sqlalchemy_engine
+
+    if _has_column(engine, 'index', 'passage') :
+        return False
+
+    engine.execute('ALTER TABLE "index" ADD COLUMN passage INTEGER')
+
+    return True
+
+def _is_legacy (db) :
+    # Databases made before frequencies tallied up indexes (see <add_term_frequencies>) either have a frequency table
+    # without the <indexed> column, or (if they're older than frequencies altogether) the empty one that <Database> has
+    # just made. Indexing always writes frequencies now, so an up to date database without any hasn't had anything
+    # indexed into it (and has no associations that the indexes account for).
+    engine = db._sqlalchemy_engine
+    frequency = default_mapped.tables['frequency']
+
+    return (not _has_column(engine, 'frequency', 'indexed') or
+            engine.execute(select([frequency.c.seq_id]).limit(1)).first() is None)
+
+def migrate (db) :
+    ''' This applies all of the migrations to a database. '''
+
+    # This has to be checked before the frequencies are brought up to date.
+    legacy = _is_legacy(db)
+
+    return any([add_text_store_columns(db),
+                add_compression_columns(db),
+                match_seq_inheritance(db),
+                add_index_passages(db),
+                add_fingerprints(db),
+                remove_obsolete_indexes(db),
+                add_frequency_positions(db),
+                legacy and remove_redundant_associations(db),
+                add_term_frequencies(db),
+                add_tokenizations(db),
+                add_missing_indexes(db)])
+
+def _test_add_missing_indexes (ut) :
+    from nlplib.core.model import Database
+
+    db = Database()
+    db._sqlalchemy_engine.execute('DROP INDEX ix_index_seq_id_document_id_first_token')
+
+    ut.assert_true(add_missing_indexes(db))
+    ut.assert_true(not add_missing_indexes(db))
+
+    indexes = inspect(db._sqlalchemy_engine).get_indexes('index')
+    ut.assert_true('ix_index_seq_id_document_id_first_token' in {index['name'] for index in indexes})
+
+def _test_add_tokenizations (ut) :
+    from nlplib.core.model import Database, Document
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        session.add(Document('not indexed'))
+        Indexed(session).add(session.add(Document('the  cat ate')), max_gram_length=2)
+        Indexed(session, packed=True).add(session.add(Document('a dog  ate')), max_gram_length=2)
+
+    # The packed positions of databases made before they were tied to the document's tokenization record the
+    # tokenization algorithm themselves.
+    engine = db._sqlalchemy_engine
+    engine.execute('ALTER TABLE frequency ADD COLUMN tokenization_algorithm VARCHAR')
+    engine.execute('UPDATE frequency SET tokenization_algorithm = (SELECT tokenization_algorithm FROM tokenization '
+                   'WHERE tokenization.document_id = frequency.document_id) WHERE positions IS NOT NULL')
+    engine.execute('DELETE FROM tokenization')
+
+    ut.assert_true(add_tokenizations(db))
+    ut.assert_true(not add_tokenizations(db))
+
+    with db as session :
+        tokenizations = {str(document) : document.tokenization for document in session.access.all_documents()}
+        ut.assert_true(tokenizations['not indexed'] is None)
+        ut.assert_equal(tokenizations['the  cat ate'].spans, ((0, 2), (5, 7), (9, 11)))
+        ut.assert_equal(tokenizations['a dog  ate'].spans, ((0, 0), (2, 4), (7, 9)))
+
+def _test_add_concordance_keys (ut) :
+    from nlplib.core.model import Database, Document
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        session.add(Document('not indexed'))
+        Indexed(session).add(session.add(Document('the cat sat on the mat')), max_gram_length=2)
+        Indexed(session, packed=True).add(session.add(Document('the dog ate the cat')), max_gram_length=2)
+
+    def keys (db) :
+        with db as session :
+            return sorted((str(key.seq), key.first_token, key.left, key.right)
+                          for key in session.access.all_concordance_keys())
+
+    def pages (db) :
+        with db as session :
+            the = session.access.word('the')
+            return [session.access.kwic(the, order=order) for order in session.access.kwic_orders]
+
+    # The keys aren't kept unless asked for, the pages are worked out without them.
+    ut.assert_equal(keys(db), [])
+    computed = pages(db)
+    ut.assert_equal(len(computed[0][0]), 4)
+
+    ut.assert_true(add_concordance_keys(db))
+    ut.assert_true(not add_concordance_keys(db))
+    ut.assert_equal(pages(db), computed)
+
+    # The keys are the same as the ones indexing would have kept.
+    kept = Database()
+
+    with kept as session :
+        Indexed(session, concordance_keys=True).add(session.add(Document('the cat sat on the mat')),
+                                                    max_gram_length=2)
+        Indexed(session, packed=True, concordance_keys=True).add(session.add(Document('the dog ate the cat')),
+                                                                 max_gram_length=2)
+
+    ut.assert_equal(keys(db), keys(kept))
+
+def _test_add_constituents (ut) :
+    from nlplib.core.model import Database, Document, Word, Gram
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat sat')), max_gram_length=3)
+        session.add(Gram('no words'))
+
+    ut.assert_true(add_constituents(db, chunk_size=2))
+    ut.assert_true(not add_constituents(db))
+
+    with db as session :
+        ut.assert_equal(session.access.constituents(session.access.gram('the cat sat')),
+                        [Word('the'), Word('cat'), Word('sat')])
+        ut.assert_equal(session.access.constituents(session.access.gram('no words')), [])
+        ut.assert_equal(sorted(session.access.grams_containing('cat')), [Gram('cat sat'), Gram('the cat'),
+                                                                          Gram('the cat sat')])
+
+def _test_add_term_frequencies (ut) :
+    from nlplib.core.model import Database, Document, Word
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat ate the food', url='a')), max_gram_length=2)
+        Indexed(session).add(session.add(Document('the cat', url='b')), max_gram_length=2)
+
+    def counts () :
+        with db as session :
+            return sorted((seq, seq.count) for seq in session.access.all_seqs())
+
+    before = counts()
+
+    # Databases made before the indexes were tallied up don't have any frequencies for them.
+    db._sqlalchemy_engine.execute('DELETE FROM frequency')
+
+    ut.assert_true(add_term_frequencies(db))
+    ut.assert_true(not add_term_frequencies(db))
+    ut.assert_equal(counts(), before)
+
+    with db as session :
+        ut.assert_equal(session.access.most_common(Word, top=1, url_prefix='a'), [Word('the')])
+        ut.assert_equal(session.access.document_frequency(session.access.word('cat'), url_prefix='b'), 1)
+
+def _test_remove_redundant_associations (ut) :
+    from nlplib.core.model import Database, Document, Word
+    from nlplib.core.process.index import Indexed
+
+    db = Database()
+
+    with db as session :
+        document = session.add(Document('the cat'))
+        Indexed(session, materialize=True).add(document, max_gram_length=2)
+        document.seqs.append(Word('dog')) # This one isn't accounted for by an index.
+
+    ut.assert_true(remove_redundant_associations(db))
+    ut.assert_true(not remove_redundant_associations(db))
+
+    with db as session :
+        document = session.access.all_documents().__next__()
+        ut.assert_equal(document.seqs, [Word('dog')])
+        ut.assert_equal(sorted(document.words()), [Word('cat'), Word('dog'), Word('the')])
+
+    # Up to date databases keep the associations made by <materialize>.
+    db = Database()
+
+    with db as session :
+        Indexed(session, materialize=True).add(session.add(Document('the cat sat')), max_gram_length=2)
+
+    migrate(db)
+
+    with db as session :
+        document = session.access.all_documents().__next__()
+        ut.assert_equal(sorted(str(seq) for seq in document.seqs), ['cat', 'cat sat', 'sat', 'the', 'the cat'])
+
+def _test_migrate_legacy_associations (ut) :
+    import os
+    import sqlite3
+    import tempfile
+
+    from nlplib.core.model import Database, Word
+
+    with tempfile.TemporaryDirectory() as directory :
+        path = os.path.join(directory, 'legacy.db')
+
+        # The database is laid out the way the first versions of nlplib did it, before it's ever opened as a
+        # <Database>. These associated every indexed sequence with its document, and had no frequency table.
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE document (id INTEGER PRIMARY KEY, string TEXT, length INTEGER, word_count INTEGER,
+                                   title TEXT, url VARCHAR, created_on DATETIME);
+            CREATE TABLE seq (id INTEGER PRIMARY KEY, type VARCHAR, string VARCHAR NOT NULL, UNIQUE (type, string));
+            CREATE TABLE word (id INTEGER PRIMARY KEY REFERENCES seq (id));
+            CREATE TABLE gram (id INTEGER PRIMARY KEY REFERENCES seq (id));
+            CREATE TABLE "index" (id INTEGER PRIMARY KEY, first_token INTEGER, last_token INTEGER,
+                                  first_character INTEGER, last_character INTEGER, tokenization_algorithm VARCHAR,
+                                  document_id INTEGER NOT NULL REFERENCES document (id),
+                                  seq_id INTEGER NOT NULL REFERENCES seq (id));
+            CREATE TABLE document_seq_association (document_id INTEGER REFERENCES document (id),
+                                                   seq_id INTEGER REFERENCES seq (id));
+
+            INSERT INTO document (id, string) VALUES (1, 'the cat');
+            INSERT INTO seq (id, type, string) VALUES (1, 'word', 'the'), (2, 'word', 'cat'), (3, 'word', 'dog');
+            INSERT INTO word (id) VALUES (1), (2), (3);
+            INSERT INTO "index" (first_token, last_token, first_character, last_character, document_id, seq_id)
+                VALUES (0, 0, 0, 2, 1, 1), (1, 1, 4, 6, 1, 2);
+            INSERT INTO document_seq_association (document_id, seq_id) VALUES (1, 1), (1, 2), (1, 3);
+        """)
+        connection.commit()
+        connection.close()
+
+        db = Database('sqlite:///' + path)
+        try :
+            ut.assert_true(migrate(db))
+
+            # Only the association that the indexes don't account for is left.
+            with db as session :
+                document = session.access.all_documents().__next__()
+                ut.assert_equal(document.seqs, [Word('dog')])
+                ut.assert_equal(sorted(document.words()), [Word('cat'), Word('dog'), Word('the')])
+                ut.assert_equal(len(list(session.access.all_frequencies())), 2)
+        finally :
+            db._sqlalchemy_engine.dispose()
+
+def _test_match_seq_inheritance (ut) :
+    import os
+    import tempfile
+
+    from nlplib.core.model import Database, Word, Gram
+
+    def tables (db) :
+        return {name for name in inspect(db._sqlalchemy_engine).get_table_names() if name in SeqMapper.subtypes}
+
+    def rows (db, subtype) :
+        return db._sqlalchemy_engine.execute('SELECT count(*) FROM {0}'.format(subtype)).scalar()
+
+    with tempfile.TemporaryDirectory() as directory :
+        path = 'sqlite:///' + os.path.join(directory, 'nlplib.db')
+
+        # Words and grams are only written to their own tables with joined inheritance.
+        db = Database(path)
+        with db as session :
+            session.add_many([Word('foo'), Word('bar'), Gram('foo bar')])
+        ut.assert_equal(tables(db), set())
+
+        db = Database(path, inheritance='joined')
+        ut.assert_true(match_seq_inheritance(db))
+        ut.assert_true(not match_seq_inheritance(db))
+        ut.assert_equal((rows(db, 'word'), rows(db, 'gram')), (2, 1))
+
+        with db as session :
+            session.add(Word('baz'))
+            session.remove(session.access.word('foo'))
+        ut.assert_equal((rows(db, 'word'), rows(db, 'gram')), (2, 1))
+
+        # Going back to single inheritance drops the tables, the sequences are all still there.
+        db = Database(path)
+        with db as session :
+            session.add(Word('qux'))
+        ut.assert_equal(rows(db, 'word'), 3)
+
+        ut.assert_true(match_seq_inheritance(db))
+        ut.assert_true(not match_seq_inheritance(db))
+        ut.assert_equal(tables(db), set())
+
+        with db as session :
+            ut.assert_equal(sorted(session.access.all_seqs()), [Word('bar'), Word('baz'), Word('qux'), Gram('foo bar')])
+
+        db._sqlalchemy_engine.dispose()
+
+    ut.assert_raises(lambda : Database(inheritance='concrete'), ValueError)
+
+def __test__ (ut) :
+    from nlplib.core.model import Database, Word
+
+    db = Database()
+
+    # The sequence table is replaced with one laid out the way older versions of nlplib did it.
+    engine = db._sqlalchemy_engine
+    engine.execute('DROP TABLE seq')
+    engine.execute('CREATE TABLE seq (id INTEGER PRIMARY KEY, type VARCHAR, string VARCHAR NOT NULL, '
+                   'UNIQUE (type, string))')
+    engine.execute("INSERT INTO seq (id, type, string) VALUES (1, 'word', 'foo'), (2, 'word', 'bar')")
+    engine.execute('CREATE TABLE word (id INTEGER PRIMARY KEY REFERENCES seq (id))')
+    engine.execute('INSERT INTO word (id) VALUES (1), (2)')
+
+    engine.execute('DROP TABLE frequency')
+    engine.execute('CREATE TABLE frequency (seq_id INTEGER NOT NULL, document_id INTEGER NOT NULL, '
+                   'count INTEGER NOT NULL, PRIMARY KEY (seq_id, document_id))')
+
+    engine.execute('DROP TABLE "index"')
+    engine.execute('CREATE TABLE "index" (id INTEGER PRIMARY KEY, first_token INTEGER, last_token INTEGER, '
+                   'first_character INTEGER, last_character INTEGER, tokenization_algorithm VARCHAR, '
+                   'document_id INTEGER NOT NULL, seq_id INTEGER NOT NULL)')
+
+    engine.execute('DROP TABLE document')
+    engine.execute('CREATE TABLE document (id INTEGER PRIMARY KEY, string TEXT, length INTEGER, word_count INTEGER, '
+                   'title TEXT, url VARCHAR, created_on DATETIME)')
+    engine.execute("INSERT INTO document (id, string) VALUES (1, 'an old document')")
+
+    # Older versions associated every sequence with its document, as well as tallying it up.
+    engine.execute('INSERT INTO frequency (seq_id, document_id, count) VALUES (1, 1, 1)')
+    engine.execute('INSERT INTO document_seq_association (document_id, seq_id) VALUES (1, 1)')
+
+    ut.assert_true(migrate(db))
+    ut.assert_true(not migrate(db))
+
+    unique = 'ix_seq_fingerprint_type_string'
+    ut.assert_true(unique in {index['name'] for index in inspect(engine).get_indexes('seq')})
+
+    # Databases from before sequences were looked up by their types as well had an index over the fingerprints alone,
+    # and later ones had one over their fingerprints and types (which didn't keep them unique).
+    engine.execute('CREATE INDEX ix_seq_fingerprint ON seq (fingerprint)')
+    engine.execute('CREATE INDEX ix_seq_fingerprint_type ON seq (fingerprint, type)')
+    ut.assert_true(migrate(db))
+    ut.assert_equal({index['name'] for index in inspect(engine).get_indexes('seq')}, {unique})
+
+    with db as session :
+        ut.assert_equal(session.access.word('foo'), Word('foo'))
+        ut.assert_equal(sorted(session.access.matching(['foo', 'bar'])), [Word('bar'), Word('foo')])
+        ut.assert_equal(len(list(session.access.all_frequencies())), 1)
+        ut.assert_equal([str(document) for document in session.access.all_documents()], ['an old document'])
+        ut.assert_equal(session.access.all_documents().__next__().seqs, [])
+        ut.assert_equal(list(session.access.all_indexes()), [])
+
+    _test_remove_redundant_associations(ut)
+    _test_migrate_legacy_associations(ut)
+    _test_add_term_frequencies(ut)
+    _test_add_tokenizations(ut)
+    _test_add_concordance_keys(ut)
+    _test_add_constituents(ut)
+    _test_add_missing_indexes(ut)
+    _test_match_seq_inheritance(ut)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -1,11 +1,16 @@
 ''' This module outlines how natural language related models are mapped to their respective SQLAlchemy tables. '''
 
 
-from sqlalchemy.orm import relationship, backref, column_property
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint, Table
+from sqlalchemy.orm import relationship, backref, column_property, object_session, deferred
+from sqlalchemy import (Column, Integer, BigInteger, String, DateTime, Text, LargeBinary, Boolean, ForeignKey,
+                        PrimaryKeyConstraint, Table, event)
+from sqlalchemy import Index as SQLIndex
 
 from nlplib.core.model.sqlalchemy_.base import ClassMapper
-from nlplib.core.model.naturallanguage import Document, Seq, Gram, Word, Index
+from nlplib.general import fingerprint
+from nlplib.general.compress import compress
+from nlplib.core.model.naturallanguage import (Document, Seq, Gram, Word, Index, Frequency, Tokenization,
+                                               Passage, ConcordanceKey, Bucket, Constituent)
 
 class DocumentMapper (ClassMapper) :
     cls  = Document
@@ -18,43 +23,161 @@ class DocumentMapper (ClassMapper) :
                 Column('word_count', Integer),
                 Column('title', Text),
                 Column('url', String),
-                Column('created_on', DateTime))
+                Column('created_on', DateTime),
+                # Where the string is in the text store, if the database has one (see <Database>).
+                Column('text_offset', BigInteger),
+                Column('text_length', Integer),
+                Column('text_width', Integer),
+                # The string, if the database compresses them (see <Database>), and the method used.
+                Column('text_compression', String),
+                Column('text_compressed', LargeBinary))
 
     def mapper_kw (self) :
         association = Table('document_seq_association',
                             self.metadata,
                             Column('document_id', Integer, ForeignKey('document.id')),
-                            Column('seq_id', Integer, ForeignKey('seq.id')))
+                            Column('seq_id', Integer, ForeignKey('seq.id')),
+                            SQLIndex('ix_document_seq_association_document_id_seq_id', 'document_id', 'seq_id'))
 
-        return {'properties' : {'seqs' : relationship(self.classes['seq'], secondary=association),
-                                '_id'  : self.table.c.id}}
+        # Indexing keeps a frequency for every sequence in every document, so (unlike the association table) this
+        # relationship doesn't need anything else written to be kept up to date.
+        indexed = self.tables['frequency']
+
+        return {'properties' : {'seqs'          : relationship(self.classes['seq'], secondary=association),
+                                '_indexed_seqs' : relationship(self.classes['seq'], secondary=indexed,
+                                                               primaryjoin=self.table.c.id == indexed.c.document_id,
+                                                               secondaryjoin=(self.tables['seq'].c.id ==
+                                                                              indexed.c.seq_id),
+                                                               viewonly=True),
+                                'tokenization'  : relationship(self.classes['tokenization'], uselist=False,
+                                                               back_populates='document',
+                                                               cascade='all, delete-orphan'),
+                                'passages'      : relationship(self.classes['passage'], back_populates='document',
+                                                               order_by=self.tables['passage'].c.number,
+                                                               cascade='all, delete-orphan'),
+                                'concordance_keys' : relationship(self.classes['concordance_key'],
+                                                                  back_populates='document',
+                                                                  cascade='all, delete-orphan'),
+                                '_id'           : self.table.c.id,
+                                '_string'       : deferred(self.table.c.string),
+                                '_text_offset'  : self.table.c.text_offset,
+                                '_text_length'  : self.table.c.text_length,
+                                '_text_width'   : self.table.c.text_width,
+                                '_text_compression' : self.table.c.text_compression,
+                                '_text_compressed'  : deferred(self.table.c.text_compressed)}}
+
+    def map (self, *args, **kw) :
+        mapper = super().map(*args, **kw)
+
+        # Strings are moved into the text store (when there is one) as they're written, and documents read from the
+        # database are given the store so that they can find their strings. Without a store, long strings are
+        # compressed, if the database compresses them. Strings (and compressed data) are only loaded when they're read,
+        # a string that hasn't been loaded hasn't been changed either, so it's left alone.
+        def store_string (mapper, connection, document) :
+            info = object_session(document).info
+            store, compression = (info.get('store'), info.get('compression'))
+
+            if document.__dict__.get('_string') is None :
+                return
+            elif store is not None :
+                document._text_offset, document._text_length, document._text_width = store.append(document._string)
+                document._string = None
+                document._store = store
+            elif compression is not None and len(document._string) >= compression[1] :
+                document._text_compression, document._text_length = (compression[0], len(document._string))
+                document._text_compressed = compress(document._string, compression[0])
+                document._decompressed, document._string = (document._string, None)
+
+        def set_store (document, context) :
+            document._store = context.session.info.get('store')
+
+        for name in ('before_insert', 'before_update') :
+            event.listen(mapper, name, store_string)
+        event.listen(mapper, 'load', set_store)
+
+        # Documents look things up through the access of whichever session they're in (see <Document._access>).
+        def access (document) :
+            sqlalchemy_session = object_session(document)
+            return sqlalchemy_session.info.get('access') if sqlalchemy_session is not None else None
+
+        self.cls._access = property(access)
+
+        return mapper
 
 class SeqMapper (ClassMapper) :
     cls  = Seq
     name = 'seq'
 
+    # Words and grams are kept in the sequence table (single table inheritance), older versions of nlplib also gave them
+    # tables of their own, which only hold their ids. These tables are kept up to date, for as long as a database has
+    # them (see <Database>).
+    subtypes = ('gram', 'word')
+
+    def __init__ (self, *args, **kw) :
+        super().__init__(*args, **kw)
+
+        self.subtype_tables = {subtype : Table(subtype, self.metadata,
+                                               Column('id', Integer, ForeignKey('seq.id'), primary_key=True))
+                               for subtype in self.subtypes}
+
     def columns (self) :
+        # Sequences are looked up by the fingerprint of their string (and their type), rather than by the string itself.
+        # The string is only at the end of the index, so that sequences are kept unique by the database; lookups find
+        # (almost always) a single row by the fingerprint alone. The fingerprint comes first, because plain sequences
+        # are looked up regardless of their type.
         return (Column('id', Integer, primary_key=True),
                 Column('type', String),
                 Column('string', String, nullable=False),
-                UniqueConstraint('type', 'string'))
+                Column('fingerprint', BigInteger),
+                SQLIndex('ix_seq_fingerprint_type_string', 'fingerprint', 'type', 'string', unique=True))
 
     def mapper_kw (self) :
         return {'polymorphic_identity' : self.name,
                 'polymorphic_on' : self.table.c.type,
-                'properties' : {'_id'     : self.table.c.id,
-                                '_type'   : self.table.c.type,
-                                'indexes' : relationship(self.classes['index'])}}
+                'properties' : {'_id'          : self.table.c.id,
+                                '_type'        : self.table.c.type,
+                                '_fingerprint' : self.table.c.fingerprint,
+                                'indexes'      : relationship(self.classes['index'], back_populates='seq'),
+                                'frequencies'  : relationship(self.classes['frequency'], back_populates='seq')}}
+
+    def map (self, *args, **kw) :
+        mapper = super().map(*args, **kw)
+
+        def set_fingerprint (mapper, connection, seq) :
+            seq._fingerprint = fingerprint(seq.string)
+
+        for name in ('before_insert', 'before_update') :
+            event.listen(mapper, name, set_fingerprint, propagate=True)
+
+        def insert_subtype (mapper, connection, seq) :
+            table = self.subtype_tables.get(seq._type)
+            if table is not None and object_session(seq).info.get('seq_subtype_tables') :
+                connection.execute(table.insert().values(id=seq._id))
+
+        def delete_subtype (mapper, connection, seq) :
+            table = self.subtype_tables.get(seq._type)
+            if table is not None and object_session(seq).info.get('seq_subtype_tables') :
+                connection.execute(table.delete().where(table.c.id == seq._id))
+
+        event.listen(mapper, 'after_insert', insert_subtype, propagate=True)
+        event.listen(mapper, 'before_delete', delete_subtype, propagate=True)
+
+        return mapper
 
 class GramMapper (ClassMapper) :
     cls  = Gram
     name = 'gram'
 
-    def columns (self) :
-        return (Column('id', Integer, ForeignKey('seq.id'), primary_key=True),)
+    single_table = True
 
     def mapper_kw (self) :
-        return {'properties' : {'_id' : column_property(self.table.c.id, self.tables['seq'].c.id)},
+        constituent_table = self.tables['constituent']
+
+        return {'properties' : {'_constituents' : relationship(self.classes['constituent'],
+                                                               foreign_keys=constituent_table.c.gram_id,
+                                                               order_by=constituent_table.c.position,
+                                                               cascade='all, delete-orphan',
+                                                               back_populates='gram')},
                 'inherits' : self.classes['seq'],
                 'polymorphic_identity' : self.name}
 
@@ -62,12 +185,10 @@ class WordMapper (ClassMapper) :
     cls  = Word
     name = 'word'
 
-    def columns (self) :
-        return (Column('id', Integer, ForeignKey('seq.id'), primary_key=True),)
+    single_table = True
 
     def mapper_kw (self) :
-        return {'properties' : {'_id' : column_property(self.table.c.id, self.tables['seq'].c.id)},
-                'inherits' : self.classes['seq'],
+        return {'inherits' : self.classes['seq'],
                 'polymorphic_identity' : self.name}
 
 class IndexMapper (ClassMapper) :
@@ -82,11 +203,136 @@ class IndexMapper (ClassMapper) :
                 Column('last_character', Integer),
                 Column('tokenization_algorithm', String),
                 Column('document_id', Integer, ForeignKey('document.id'), nullable=False, index=True),
-                Column('seq_id', Integer, ForeignKey('seq.id'), nullable=False))
+                Column('seq_id', Integer, ForeignKey('seq.id'), nullable=False),
+                Column('passage', Integer),
+                # This covers finding all of a sequence's occurrences (see <Access.contexts>) without touching the
+                # table itself.
+                SQLIndex('ix_index_seq_id_document_id_first_token', 'seq_id', 'document_id', 'first_token',
+                         'last_token', 'tokenization_algorithm'),
+                # This one covers finding what is at a position in a document (see <Access.neighbours>).
+                SQLIndex('ix_index_document_id_first_token', 'document_id', 'first_token', 'last_token', 'seq_id'))
 
     def mapper_kw (self) :
         return {'properties' : {'document'     : relationship(self.classes['document']),
+                                'seq'          : relationship(self.classes['seq'], back_populates='indexes'),
                                 '_id'          : self.table.c.id,
                                 '_document_id' : self.table.c.document_id,
                                 '_seq_id'      : self.table.c.seq_id}}
 
+class FrequencyMapper (ClassMapper) :
+    cls  = Frequency
+    name = 'frequency'
+
+    def columns (self) :
+        # A sequence is only counted once per document, so the pair makes for the primary key. The primary key covers
+        # the lookups by sequence (e.g., document frequencies), and the secondary index covers aggregating counts over
+        # a set of documents, so neither needs to touch the table itself.
+        return (Column('seq_id', Integer, ForeignKey('seq.id'), nullable=False),
+                Column('document_id', Integer, ForeignKey('document.id'), nullable=False),
+                Column('count', Integer, nullable=False),
+                Column('indexed', Boolean, nullable=False, default=False),
+                Column('positions', LargeBinary),
+                PrimaryKeyConstraint('seq_id', 'document_id'),
+                SQLIndex('ix_frequency_document_id_seq_id_count', 'document_id', 'seq_id', 'count'))
+
+    def mapper_kw (self) :
+        return {'properties' : {'document'     : relationship(self.classes['document']),
+                                'seq'          : relationship(self.classes['seq'], back_populates='frequencies'),
+                                '_positions'   : self.table.c.positions,
+                                '_document_id' : self.table.c.document_id,
+                                '_seq_id'      : self.table.c.seq_id}}
+
+class TokenizationMapper (ClassMapper) :
+    cls  = Tokenization
+    name = 'tokenization'
+
+    def columns (self) :
+        return (Column('document_id', Integer, ForeignKey('document.id'), primary_key=True),
+                Column('tokenization_algorithm', String),
+                Column('offsets', LargeBinary, nullable=False))
+
+    def mapper_kw (self) :
+        return {'properties' : {'document'     : relationship(self.classes['document'],
+                                                               back_populates='tokenization'),
+                                '_offsets'     : self.table.c.offsets,
+                                '_document_id' : self.table.c.document_id}}
+
+class PassageMapper (ClassMapper) :
+    cls  = Passage
+    name = 'passage'
+
+    def columns (self) :
+        return (Column('document_id', Integer, ForeignKey('document.id'), nullable=False),
+                Column('number', Integer, nullable=False),
+                Column('first_token', Integer, nullable=False),
+                Column('last_token', Integer, nullable=False),
+                Column('first_character', Integer, nullable=False),
+                Column('last_character', Integer, nullable=False),
+                PrimaryKeyConstraint('document_id', 'number'))
+
+    def mapper_kw (self) :
+        return {'properties' : {'document'     : relationship(self.classes['document'], back_populates='passages'),
+                                '_document_id' : self.table.c.document_id}}
+
+class ConcordanceKeyMapper (ClassMapper) :
+    cls  = ConcordanceKey
+    name = 'concordance_key'
+
+    def columns (self) :
+        # A sequence can only start at a token once, so the sequence, document and first token make for the primary
+        # key, which also covers paging through the occurrences in order of document. The secondary indexes are the
+        # sort index itself, they cover paging through the occurrences in order of their left or right keys.
+        return (Column('seq_id', Integer, ForeignKey('seq.id'), nullable=False),
+                Column('document_id', Integer, ForeignKey('document.id'), nullable=False),
+                Column('first_token', Integer, nullable=False),
+                Column('last_token', Integer, nullable=False),
+                Column('tokenization_algorithm', String),
+                Column('left', String, nullable=False),
+                Column('right', String, nullable=False),
+                PrimaryKeyConstraint('seq_id', 'document_id', 'first_token'),
+                SQLIndex('ix_concordance_key_seq_id_left', 'seq_id', 'left', 'document_id', 'first_token'),
+                SQLIndex('ix_concordance_key_seq_id_right', 'seq_id', 'right', 'document_id', 'first_token'))
+
+    def mapper_kw (self) :
+        return {'properties' : {'document'     : relationship(self.classes['document'],
+                                                               back_populates='concordance_keys'),
+                                'seq'          : relationship(self.classes['seq']),
+                                '_document_id' : self.table.c.document_id,
+                                '_seq_id'      : self.table.c.seq_id}}
+
+class BucketMapper (ClassMapper) :
+    cls  = Bucket
+    name = 'bucket'
+
+    def columns (self) :
+        # Buckets are always looked up by their time span first, the primary key covers looking up the buckets of
+        # particular sequences, and the secondary index covers summing up the counts over a range of time.
+        return (Column('start', DateTime, nullable=False),
+                Column('seq_id', Integer, ForeignKey('seq.id'), nullable=False),
+                Column('count', Integer, nullable=False),
+                PrimaryKeyConstraint('start', 'seq_id'),
+                SQLIndex('ix_bucket_start_seq_id_count', 'start', 'seq_id', 'count'))
+
+    def mapper_kw (self) :
+        return {'properties' : {'seq'     : relationship(self.classes['seq']),
+                                '_seq_id' : self.table.c.seq_id}}
+
+class ConstituentMapper (ClassMapper) :
+    cls  = Constituent
+    name = 'constituent'
+
+    def columns (self) :
+        # The primary key doubles as the index for finding the words of a gram, and the secondary index is used for
+        # finding the grams a word is in (at a particular position).
+        return (Column('gram_id', Integer, ForeignKey('seq.id'), nullable=False),
+                Column('position', Integer, nullable=False),
+                Column('word_id', Integer, ForeignKey('seq.id'), nullable=False),
+                PrimaryKeyConstraint('gram_id', 'position'),
+                SQLIndex('ix_constituent_word_id_position', 'word_id', 'position'))
+
+    def mapper_kw (self) :
+        return {'properties' : {'_gram_id' : self.table.c.gram_id,
+                                '_word_id' : self.table.c.word_id,
+                                'gram'     : relationship(self.classes['gram'], foreign_keys=self.table.c.gram_id,
+                                                          back_populates='_constituents'),
+                                'word'     : relationship(self.classes['word'], foreign_keys=self.table.c.word_id)}}
@@ -4,7 +4,7 @@
 import json
 import pickle
 
-from sqlalchemy.orm import relationship, column_property, reconstructor
+from sqlalchemy.orm import relationship, column_property, reconstructor, deferred
 from sqlalchemy import Column, Integer, Float, String, ForeignKey, Binary, TypeDecorator
 
 from nlplib.core.model.sqlalchemy_.base import ClassMapper
@@ -118,8 +118,9 @@ class LayerMapper (ClassMapper) :
         return {'inherits' : self.classes['element'],
                 'polymorphic_identity' : self.name,
                 'properties' : {'_id'      : column_property(self.table.c.id, self.tables['element'].c.id),
-                                '_charges' : self.table.c.charges,
-                                '_errors'  : self.table.c.errors,
+                                # The charges and errors are only unpickled once they're needed.
+                                '_charges' : deferred(self.table.c.charges, group='values'),
+                                '_errors'  : deferred(self.table.c.errors, group='values'),
                                 'io'       : relationship(self.classes['neural_network_io'],
                                                           foreign_keys=self.tables['neural_network_io'].c.layer_id)}}
 
@@ -135,7 +136,7 @@ class ConnectionMapper (ClassMapper) :
         return {'inherits' : self.classes['element'],
                 'polymorphic_identity' : self.name,
                 'properties' : {'_id'      : column_property(self.table.c.id, self.tables['element'].c.id),
-                                '_weights' : self.table.c.weights}}
+                                '_weights' : deferred(self.table.c.weights)}}
 
 class NeuralNetworkIOMapper (ClassMapper) :
     cls  = NeuralNetworkIO
@@ -0,0 +1,339 @@
+''' This module is used for building the index of a large corpus from scratch, using multiple processes. Every worker
+    process indexes the chunks of the corpus it's handed into its own SQLite database (a shard), which has the same
+    schema as any other database. The shards are then merged into the target database in bulk, using SQL alone.
+
+    Note : This only works with SQLite databases, because the shards are merged using SQLite's <ATTACH DATABASE>. '''
+
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from sqlalchemy import MetaData, Table, Column, Integer, select, exists, func, and_, inspect
+
+from nlplib.core.model.sqlalchemy_.map import default_mapped
+from nlplib.core.model import Database, Document
+from nlplib.core.process.index import Indexed, SeqCache
+from nlplib.general.iterate import chunked
+from nlplib.general.compress import compress
+
+__all__ = ['build', 'build_shard', 'merge']
+
+_shard_schema = 'shard'
+
+def _document (item) :
+    # Documents are given either as strings, or as dictionaries of keyword arguments for <Document>.
+    return Document(item) if isinstance(item, str) else Document(**item)
+
+def _index (db, items, cache, chunk_size=100, max_gram_length=5, **kw) :
+    for chunk in chunked(items, chunk_size, trail=True) :
+        with db as session :
+            indexed = Indexed(session, cache=cache, **kw)
+            for item in chunk :
+                document = session.add(_document(item))
+                if len(document) :
+                    indexed.add(document, max_gram_length=max_gram_length)
+
+def build_shard (path, items, chunk_size=100, **kw) :
+    ''' This indexes the documents into a new SQLite database at <path>. Any extra keyword arguments are given to
+        <Indexed>, except for <max_gram_length> which is given to <Indexed.add>. '''
+
+    db = Database('sqlite:///' + path)
+    _index(db, items, SeqCache(), chunk_size, **kw)
+
+    db._sqlalchemy_engine.dispose()
+    return path
+
+# The shard of the worker process, see <_start_worker>.
+_shard = {}
+
+def _start_worker (directory, kw) :
+    # Each worker process indexes all of the chunks it's handed into a shard of its own.
+    path = os.path.join(directory, 'shard_{0}.db'.format(os.getpid()))
+    _shard.update(path=path, db=Database('sqlite:///' + path), cache=SeqCache(), kw=kw)
+
+def _build_chunk (items) :
+    _index(_shard['db'], items, _shard['cache'], len(items), **_shard['kw'])
+    return _shard['path']
+
+def _references (column) :
+    return {foreign_key.column.table.name for foreign_key in column.foreign_keys}
+
+def _is_seq_subtype (table) :
+    # Sequence subclasses (e.g., words and grams) can have tables of their own, whose primary key is the sequence's
+    # id.
+    primary_key = list(table.primary_key.columns)
+    return len(primary_key) == 1 and _references(primary_key[0]) == {'seq'}
+
+def _is_surrogate_key (column) :
+    return column.primary_key and not column.foreign_keys and isinstance(column.type, Integer) and \
+           len(column.table.primary_key.columns) == 1
+
+class _Merge :
+    def __init__ (self, connection, metadata, store=None, compression=None) :
+        self.connection = connection
+        self.metadata = metadata
+
+        # The strings of the documents are kept the way the target keeps them (see <Database>).
+        self.store = store
+        self.compression = compression
+
+        # The target's tables are qualified too, because the shard's tables have the same names.
+        self.target, self.shard = ({}, {})
+        for tables, schema in [(self.target, 'main'), (self.shard, _shard_schema)] :
+            schema_metadata = MetaData()
+            for table in metadata.sorted_tables :
+                tables[table.name] = table.tometadata(schema_metadata, schema=schema)
+
+        self.seq_map = Table('seq_map', MetaData(),
+                             Column('old_id', Integer, primary_key=True),
+                             Column('new_id', Integer, nullable=False),
+                             prefixes=['TEMPORARY'])
+
+    def __call__ (self, path) :
+        self.connection.execute("ATTACH DATABASE ? AS {0}".format(_shard_schema), (path,))
+        try :
+            with self.connection.begin() :
+                self.seq_map.create(self.connection)
+                try :
+                    document_offset = self._merge_documents()
+                    self._merge_seqs()
+                    for table in self.metadata.sorted_tables :
+                        self._merge_rows(self.target[table.name], document_offset)
+                finally :
+                    self.seq_map.drop(self.connection)
+        finally :
+            self.connection.execute('DETACH DATABASE {0}'.format(_shard_schema))
+
+    def _merge_documents (self) :
+        # Documents are always new, so their ids are simply shifted past the ids already in the target.
+        document, shard_document = (self.target['document'], self.shard['document'])
+
+        offset = self.connection.execute(select([func.coalesce(func.max(document.c.id), 0)])).scalar()
+
+        columns = [column.name for column in document.columns]
+        selected = [shard_document.c.id + offset if name == 'id' else shard_document.c[name] for name in columns]
+        self.connection.execute(document.insert().from_select(columns, select(selected)))
+
+        if self.store is not None or self.compression is not None :
+            self._keep_strings(offset)
+
+        return offset
+
+    def _keep_strings (self, document_offset, chunk_size=100) :
+        # The shards keep their strings in the database, the target may want them in its text store, or compressed.
+        document = self.target['document']
+
+        ids = select([document.c.id]).where(and_(document.c.id > document_offset, document.c.string != None))
+        ids = [id for id, in self.connection.execute(ids)]
+
+        for chunk in chunked(ids, chunk_size, trail=True) :
+            strings = select([document.c.id, document.c.string]).where(document.c.id.in_(chunk))
+
+            for id, string in self.connection.execute(strings).fetchall() :
+                if self.store is not None :
+                    offset, length, width = self.store.append(string)
+                    values = {'text_offset' : offset, 'text_length' : length, 'text_width' : width}
+                elif len(string) >= self.compression[1] :
+                    method = self.compression[0]
+                    values = {'text_compression' : method, 'text_length' : len(string),
+                              'text_compressed' : compress(string, method)}
+                else :
+                    continue
+
+                self.connection.execute(document.update().where(document.c.id == id).values(string=None, **values))
+
+    def _merge_seqs (self) :
+        # Sequences are matched up by their type and string (found through their fingerprints), only the ones missing
+        # from the target are copied.
+        seq, shard_seq = (self.target['seq'], self.shard['seq'])
+
+        same = and_(seq.c.fingerprint == shard_seq.c.fingerprint, seq.c.type == shard_seq.c.type,
+                    seq.c.string == shard_seq.c.string)
+
+        columns = [column.name for column in seq.columns if column.name != 'id']
+        missing = select([shard_seq.c[name] for name in columns]).where(~exists().where(same))
+        self.connection.execute(seq.insert().from_select(columns, missing))
+
+        mapping = select([shard_seq.c.id, seq.c.id]).select_from(shard_seq.join(seq, same))
+        self.connection.execute(self.seq_map.insert().from_select(['old_id', 'new_id'], mapping))
+
+        # Words and grams only have tables of their own in databases with joined inheritance (see <Database>), in which
+        # case the target's are filled in from its sequence table.
+        existing = set(inspect(self.connection).get_table_names(schema='main'))
+        for table in self.metadata.sorted_tables :
+            if _is_seq_subtype(table) and table.name in existing :
+                subtype = self.target[table.name]
+                missing = select([seq.c.id]).where(and_(seq.c.type == table.name,
+                                                        ~exists().where(subtype.c.id == seq.c.id)))
+                self.connection.execute(subtype.insert().from_select(['id'], missing))
+
+    def _merge_rows (self, table, document_offset) :
+        if table.name in ('document', 'seq') or _is_seq_subtype(table) :
+            return
+
+        shard_table = self.shard[table.name]
+
+        columns, selected, source = ([], [], shard_table)
+        for column in table.columns :
+            shard_column = shard_table.c[column.name]
+            references = _references(column)
+
+            if _is_surrogate_key(column) :
+                # The target assigns new ids.
+                continue
+            elif 'document' in references :
+                selected.append((shard_column + document_offset).label(column.name))
+            elif 'seq' in references :
+                seq_map = self.seq_map.alias('seq_map_{0}'.format(column.name))
+                source = source.join(seq_map, seq_map.c.old_id == shard_column)
+                selected.append(seq_map.c.new_id.label(column.name))
+            else :
+                selected.append(shard_column.label(column.name))
+
+            columns.append(column.name)
+
+        referenced = set().union(*(_references(column) for column in table.columns))
+        if not referenced & {'document', 'seq'} :
+            # Only the natural language tables are built by the shards.
+            return
+
+        incoming = select(selected).select_from(source)
+
+        if 'count' in table.c and 'document' not in referenced :
+            # Counts which aren't tied to a document (e.g., those in trend buckets) can be spread across the shards,
+            # so the counts of rows that are already in the target are added up.
+            self._add_counts(table, incoming.alias('incoming'))
+
+        # Rows that are the same for every shard (e.g., the constituents of a gram found by more than one worker) are
+        # only kept once.
+        self.connection.execute(table.insert().from_select(columns, incoming).prefix_with('OR IGNORE'))
+
+    def _add_counts (self, table, incoming) :
+        same = and_(*(incoming.c[column.name] == column for column in table.primary_key.columns))
+
+        added = select([incoming.c.count]).where(same).as_scalar()
+        self.connection.execute(table.update().values(count=table.c.count + added).where(exists().where(same)))
+
+def merge (db, paths) :
+    ''' This merges the shards at the given paths into the database. '''
+
+    connection = db._sqlalchemy_engine.connect()
+    try :
+        merge_shard = _Merge(connection, default_mapped.metadata, db._store, db._compression)
+        for path in paths :
+            merge_shard(path)
+    finally :
+        connection.close()
+
+def build (db, items, workers=None, directory=None, chunk_size=100, **kw) :
+    ''' This indexes the documents (strings, or dictionaries of keyword arguments for <Document>) into the database,
+        using <workers> processes (by default, one for every core). The items can be any iterable (e.g., a generator
+        reading the documents from disk), they're read <chunk_size> at a time. Every worker indexes each of its chunks
+        in a session of its own, so the documents end up in the database in no particular order. The other keyword
+        arguments are given to <Indexed>, except for <max_gram_length> which is given to <Indexed.add>.
+
+        The shards always keep the strings of their documents in the database. When they're merged, the strings are
+        moved into the target's text store, or compressed, if the target does that (see <Database>), just like the
+        strings of documents added to it directly. '''
+
+    workers = workers or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory(dir=directory) as directory :
+        paths = set()
+
+        # The items are handed out to the workers a chunk at a time, and only a couple of chunks per worker are waiting
+        # at once, so the corpus is never held in memory as a whole.
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(directory, kw)) as executor :
+            pending = set()
+            for chunk in chunked(items, chunk_size, trail=True) :
+                pending.add(executor.submit(_build_chunk, chunk))
+                if len(pending) >= 2 * workers :
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    paths.update(future.result() for future in done)
+
+            paths.update(future.result() for future in pending)
+
+        merge(db, sorted(paths))
+
+    return db
+
+def __test__ (ut) :
+    from nlplib.core.model import Word
+
+    from datetime import datetime
+
+    # The two dated documents end up in different shards, so their trend buckets have to be added together.
+    strings = ['the cat ate the food', 'the dog ate the cat',
+               {'string' : 'a dog ate a cat', 'title' : 'dogs', 'created_on' : datetime(2014, 1, 1, 10)},
+               {'string' : 'the dog sat', 'created_on' : datetime(2014, 1, 1, 10, 30)},
+               'a cat and a dog', 'the food was good', '']
+
+    def summary (db) :
+        with db as session :
+            access = session.access
+            return (sorted((str(document), document.title) for document in access.all_documents()),
+                    sorted((seq, seq.count, access.document_frequency(seq)) for seq in access.all_seqs()),
+                    sorted((str(gram), tuple(str(word) for word in access.constituents(gram)))
+                           for gram in access.all_grams()),
+                    sorted((str(index.document), str(index.seq), index.first_token, index.last_character, index.passage)
+                           for index in access.all_indexes()),
+                    sorted((str(passage.document), passage.number, str(passage)) for passage in access.all_passages()),
+                    sorted((str(key.document), str(key.seq), key.first_token, key.left, key.right)
+                           for key in access.all_concordance_keys()),
+                    sorted((str(bucket.seq), bucket.start, bucket.count) for bucket in access.all_buckets()))
+
+    for kw in [{'decompose' : True}, {'positional_grams' : False, 'packed' : True, 'concordance_keys' : True},
+               {'passages' : 2}] :
+        expected = Database()
+        with expected as session :
+            indexed = Indexed(session, **kw)
+            for item in strings :
+                document = session.add(_document(item))
+                if len(document) :
+                    indexed.add(document, max_gram_length=3)
+
+        # The items are read from a generator, a couple of them at a time.
+        built = build(Database(), (item for item in strings), workers=3, chunk_size=2, max_gram_length=3, **kw)
+        ut.assert_equal(summary(built), summary(expected))
+
+        with built as session :
+            ut.assert_equal([int(bucket) for bucket in session.access.buckets(datetime(2014, 1, 1, 10),
+                                                                               [session.access.word('dog')])], [2])
+
+    # Merging into a database that already has documents and sequences in it.
+    db = Database()
+    with db as session :
+        Indexed(session, decompose=True).add(session.add(Document('the cat sat')), max_gram_length=2)
+
+    build(db, strings[:2], workers=2, max_gram_length=2, decompose=True)
+
+    with db as session :
+        ut.assert_equal(len(list(session.access.all_documents())), 3)
+        ut.assert_equal(session.access.word('cat').count, 3)
+        ut.assert_equal(session.access.gram('the cat').count, 3)
+        ut.assert_equal(session.access.word('sat').count, 1)
+        ut.assert_equal(session.access.constituents(session.access.gram('the cat')), [Word('the'), Word('cat')])
+        ut.assert_equal(len(session.access.constituents(session.access.gram('dog ate'))), 2)
+        ut.assert_equal(sorted(str(document) for document in session.access.all_documents()
+                               if Word('dog') in document), ['the dog ate the cat'])
+
+    # The strings end up wherever the target keeps them.
+    with tempfile.TemporaryDirectory() as directory :
+        for kw, column in [({'store' : os.path.join(directory, 'text')}, 'text_offset'),
+                           ({'compression' : 'zlib', 'compression_threshold' : 12}, 'text_compressed')] :
+            db = build(Database(**kw), strings, workers=2, max_gram_length=3)
+
+            # The documents, and the sequences with their counts.
+            ut.assert_equal(summary(db)[:2], summary(expected)[:2])
+
+            rows = db._sqlalchemy_engine.execute('SELECT string, {0} FROM document'.format(column)).fetchall()
+            kept = [string for string, elsewhere in rows if elsewhere is None]
+            ut.assert_equal(sorted(kept), [] if 'store' in kw else ['', 'the dog sat'])
+
+            if db._store is not None :
+                db._store.close()
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -2,7 +2,7 @@
 
 import nlplib.core.model
 
-from nlplib.core.process.token import split
+from nlplib.core.process.token import split, tokenizer
 from nlplib.core.base import Base
 
 __all__ = ['Window', 'Concordance']
@@ -30,8 +30,12 @@ class Window (Base) :
 class Concordance (Base) :
     ''' This class contains multiple handy methods for working with the concordance of a sequence. '''
 
-    def __init__ (self, seq) :
+    def __init__ (self, seq, access=None) :
+        ''' seq    : the sequence whose occurrences make up the concordance
+            access : if given, the queries which can be are left to the database (see <Access>) '''
+
         self.seq = seq
+        self.access = access
 
     def __iter__ (self) :
         try :
@@ -42,12 +46,43 @@ class Concordance (Base) :
             for index in self.seq.indexes :
                 yield (index.document, index, self.seq)
 
+            # Occurrences stored as packed positions are turned back into indexes on the fly.
+            for frequency in self.seq.frequencies :
+                for index in frequency.indexes() :
+                    yield (frequency.document, index, self.seq)
+
     def __len__ (self) :
         try :
-            return len(self.seq.indexes)
+            return len(self.seq.indexes) + sum(len(frequency) for frequency in self.seq.frequencies)
         except AttributeError :
             return 0
 
+    def _spans (self, document, tokenization_algorithm, spans_for_documents) :
+        # The first and last character indexes of every token in the document. These are stored along with indexed
+        # documents (see <Tokenization>), otherwise the document is tokenized again. Either way, this is only done
+        # once per document.
+        key = (document, tokenization_algorithm)
+        try :
+            return spans_for_documents[key]
+        except KeyError :
+            tokenization = getattr(document, 'tokenization', None)
+            if tokenization is not None and tokenization.tokenization_algorithm == tokenization_algorithm :
+                spans = tokenization.spans
+            else :
+                tokenize = tokenizer(tokenization_algorithm)
+                spans = tuple((token.first_character_index, token.last_character_index)
+                              for token in tokenize(str(document)))
+
+            spans_for_documents[key] = spans
+            return spans
+
+    def _characters (self, document, index, spans_for_documents) :
+        if index.first_character is not None :
+            return (index.first_character, index.last_character)
+
+        spans = self._spans(document, index.tokenization_algorithm, spans_for_documents)
+        return (spans[index.first_token][0], spans[index.last_token][1])
+
     def __repr__ (self, *args, **kw) :
         return super().__repr__(self.seq, *args, **kw)
 
@@ -55,16 +90,27 @@ class Concordance (Base) :
         ''' This yields tuples that contain the raw string (unmodified whitespace and all) which the sequence object
             was representing. '''
 
+        spans_for_documents = {}
         for document, index, seq in self :
-            raw_string = str(document)[index.first_character:index.last_character+1]
+            first_character, last_character = self._characters(document, index, spans_for_documents)
+            raw_string = document.snippet(first_character, last_character+1)
             yield (document, index, raw_string)
 
     def gram_tuples (self, before=None, after=None, splitter=split) :
 
         window = Window(before=before, after=after)
 
+        spans_for_documents = {}
         already_split_documents = {}
         for document, index, seq in self :
+            if splitter is split :
+                # The default splitter's tokens can be sliced straight out of the document, so only the tokens within
+                # the window are looked at.
+                spans = self._spans(document, 're_tokenized', spans_for_documents)
+                yield tuple(document.snippet(first, last+1) for first, last in spans[window.slice(index.first_token,
+                                                                                                 index.last_token)])
+                continue
+
             try :
                 split_document = already_split_documents[document]
             except KeyError :
@@ -78,6 +124,32 @@ class Concordance (Base) :
         for gram_tuple in self.gram_tuples(*args, **kw) :
             yield gram_cls(gram_tuple)
 
+    def neighbours (self, distance=1, top=10) :
+        ''' This returns the <top> most common words found <distance> tokens away from the occurrences (negative
+            distances are to the left, positive ones to the right), along with how many times each was found. '''
+
+        if self.access is not None :
+            return self.access.neighbours(self.seq, distance, top)
+
+        if not distance :
+            raise ValueError('The distance has to be to the left (negative) or to the right (positive).')
+
+        # Without a database, the documents are split up again.
+        counts, already_split_documents = ({}, {})
+        for document, index, seq in self :
+            try :
+                split_document = already_split_documents[document]
+            except KeyError :
+                split_document = tuple(split(document))
+                already_split_documents[document] = split_document
+
+            position = (index.first_token if distance < 0 else index.last_token) + distance
+            if 0 <= position < len(split_document) :
+                word = nlplib.core.model.Word(split_document[position])
+                counts[word] = counts.get(word, 0) + 1
+
+        return sorted(counts.items(), key=lambda item : (-item[1], str(item[0])))[:top]
+
     def documents (self, documents=None) :
         if documents is None :
             documents = {}
@@ -112,6 +184,13 @@ def __test__ (ut) :
                          'use the C memory stack, thus allowing massively concurrent programs. PyPy also has a '
                          'stackless version')]
 
+    for packed in (False, True) :
+        _test_concordance(ut, document_strings, packed)
+
+def _test_concordance (ut, document_strings, packed) :
+    from nlplib.core.process.index import Indexed
+    from nlplib.core.model import Database, Document, Word, Gram
+
     db = Database()
 
     # This builds our index for testing.
@@ -119,18 +198,31 @@ def __test__ (ut) :
         for document_string in document_strings :
             session.add(Document(document_string))
 
-        indexed = Indexed(session)
+        indexed = Indexed(session, packed=packed)
         for document in session.access.all_documents() :
             indexed.add(document, max_gram_length=5)
 
     # Testing
     with db as session :
+        ut.assert_equal(len(list(session.access.all_indexes())) == 0, packed)
+
+        # The character indexes are worked out from the documents' tokenizations instead of being stored.
+        ut.assert_true(all(index.first_character is None for index in session.access.all_indexes()))
+        ut.assert_true(all(len(document.tokenization) for document in session.access.all_documents()))
+
         is_a = session.access.gram('is a')
 
         concordance_of_is_a = Concordance(is_a)
         ut.assert_equal(len(concordance_of_is_a), 2)
 
-        ut.assert_equal(list(concordance_of_is_a), list(is_a.concordance()))
+        if packed :
+            # Indexes are made afresh from the packed positions every time, so they're compared by value.
+            def occurrences (concordance) :
+                return [(document, int(index), len(index), seq) for document, index, seq in concordance]
+
+            ut.assert_equal(occurrences(concordance_of_is_a), occurrences(is_a.concordance()))
+        else :
+            ut.assert_equal(list(concordance_of_is_a), list(is_a.concordance()))
 
         grams_for_concordance = concordance_of_is_a.grams(before=1, after=2)
         correct_strings = ['Python is a widely used', 'Python is a significant fork']
@@ -1,28 +1,224 @@
 
 
+from time import time
+from bisect import bisect_right
+
 from nlplib.core.process.parse import Parsed
-from nlplib.core.model import SessionDependent
+from nlplib.core.process.passage import segmenter
+from nlplib.core.model import (SessionDependent, Seq, Frequency, Tokenization, Passage, ConcordanceKey, Bucket,
+                               Constituent)
+from nlplib.general.cache import Cache
+
+__all__ = ['SeqCache', 'Indexed']
+
+class SeqCache :
+    ''' This maps sequence strings to the ids of the sequences already stored in the database. A single instance can
+        be shared by every <Indexed> object used throughout an ingestion (even across sessions), so very common words
+        and grams are only looked up in the database once, instead of once per document.
+
+        Note : Sequence ids are only learned once the database has assigned them. If a session used for indexing is
+        rolled back, the cache should be cleared, because it may hold the ids of rows which no longer exist. '''
+
+    def __init__ (self, size=100000) :
+        self._ids = Cache(size)
+        self._pending = []
+
+        # These are used for estimating how much time the cache saved.
+        self.strings_looked_up = 0
+        self.lookup_time = 0.0
+
+    def __repr__ (self) :
+        stats = ' '.join('{0}={1}'.format(name, value) for name, value in sorted(self.stats().items()))
+        return '<{name} {stats}>'.format(name=self.__class__.__name__, stats=stats)
+
+    def __len__ (self) :
+        return len(self._ids)
+
+    def _key (self, seq) :
+        return (seq.__class__, str(seq))
+
+    def _resolve_pending (self) :
+        # New sequences are only given ids when they're flushed to the database.
+        still_pending = []
+        for seq in self._pending :
+            if seq._id is None :
+                still_pending.append(seq)
+            else :
+                self._ids[self._key(seq)] = seq._id
+        self._pending = still_pending
+
+    def add (self, seq) :
+        if getattr(seq, '_id', None) is None :
+            self._pending.append(seq)
+        else :
+            self._ids[self._key(seq)] = seq._id
+
+    def discard (self, seq) :
+        key = self._key(seq)
+        self._ids.discard(key)
+        self._pending = [pending for pending in self._pending if self._key(pending) != key]
+
+    def clear (self) :
+        self._ids.clear()
+        self._pending = []
+
+    def partition (self, seqs) :
+        ''' This splits the sequences into those with a known id, and those which need to be looked up. '''
+
+        self._resolve_pending()
+
+        known, unknown = ({}, [])
+        for seq in seqs :
+            id = self._ids.get(self._key(seq))
+            if id is None :
+                unknown.append(seq)
+            else :
+                known[seq] = id
+
+        return (known, unknown)
+
+    def warm (self, session, top=10000) :
+        ''' This fills the cache with the most common sequences already in the database. '''
 
-__all__ = ['Indexed']
+        # The least common sequences are added first, so that they're the first to go if the cache overflows.
+        for seq in reversed(session.access.most_common(Seq, top=top)) :
+            self.add(seq)
+
+    def time_saved (self) :
+        ''' An estimate (in seconds) of the time spent querying the database, that was saved by the cache. '''
+
+        try :
+            return self._ids.hits * (self.lookup_time / self.strings_looked_up)
+        except ZeroDivisionError :
+            return 0.0
+
+    def stats (self) :
+        return {'size'       : len(self),
+                'hits'       : self._ids.hits,
+                'misses'     : self._ids.misses,
+                'hit_rate'   : round(self._ids.hit_rate(), 4),
+                'time_saved' : round(self.time_saved(), 4)}
 
 class _AddIndexes (SessionDependent) :
-    def __init__ (self, session, document, parsed) :
+    def __init__ (self, session, document, parsed, cache=None, positional_grams=True, packed=False,
+                  materialize=False, segment=None, decompose=False, concordance_keys=False) :
         super().__init__(session)
         self.document = document
         self.parsed = parsed
+        self.cache = cache
+        self.positional_grams = positional_grams
+        self.packed = packed
+        self.materialize = materialize
+        self.segment = segment
+        self.decompose = decompose
+        self.concordance_keys = concordance_keys
+
+        self.counts = {}
+        self.words = {}
 
     def __call__ (self) :
         seqs_from_document = set(self.parsed)
 
-        seqs = self._merge_with_seqs_in_db(seqs_from_document)
+        self._add_tokenization(seqs_from_document)
+        self._add_passages(seqs_from_document)
+        if self.concordance_keys :
+            self._note_words(seqs_from_document)
 
-        self.document.seqs.extend(seqs)
+        seqs = list(self._merge_with_seqs_in_db(seqs_from_document))
 
-    def _merge_with_seqs_in_db (self, seqs_from_document) :
-        strings_from_document = (str(seq) for seq in seqs_from_document)
+        if self.decompose :
+            self._decompose_new_grams(seqs)
+
+        # New sequences are added along with their indexes.
+        self.session.add_many(seqs)
+
+        self._add_to_buckets()
+
+        if self.materialize :
+            self.document.seqs.extend(seqs)
+
+        if self.cache is not None :
+            for seq in seqs :
+                self.cache.add(seq)
+
+    def _add_tokenization (self, seqs_from_document) :
+        tokens = getattr(self.parsed, 'tokens', None)
+        if tokens is None :
+            return
+
+        self.session.add(Tokenization(self.document, tokens, self.parsed.tokenize.__name__))
+
+        # The character indexes can be worked out from the tokenization, so they aren't stored with every index.
+        for seq in seqs_from_document :
+            for index in seq.indexes :
+                index.first_character, index.last_character = (None, None)
+
+    def _add_passages (self, seqs_from_document) :
+        tokens = getattr(self.parsed, 'tokens', None)
+        if self.segment is None or tokens is None :
+            return
+
+        ranges = list(self.segment(str(self.document), tokens))
+        self.session.add_many(Passage(self.document, number, first_token, last_token,
+                                      tokens[first_token].first_character_index,
+                                      tokens[last_token].last_character_index)
+                              for number, (first_token, last_token) in enumerate(ranges))
+
+        # Each index is put in the passage it starts in.
+        first_tokens = [first_token for first_token, _ in ranges]
+        for seq in seqs_from_document :
+            for index in seq.indexes :
+                index.passage = bisect_right(first_tokens, index.first_token) - 1
+
+    def _note_words (self, seqs_from_document) :
+        # The words at each position of the document make up the sort keys of the occurrences next to them (see
+        # <ConcordanceKey>).
+        self.words = {index.first_token : str(seq) for seq in seqs_from_document if seq._is_word
+                      for index in seq.indexes}
+
+    def _add_to_buckets (self) :
+        if self.document.created_on is None :
+            return
+
+        counts = dict(self.counts)
+        for bucket in self.session.access.buckets(self.document.created_on, counts) :
+            bucket.count += counts.pop(bucket.seq)
+
+        # The rest of the sequences haven't shown up in this span of time yet.
+        self.session.add_many(Bucket(seq, self.document.created_on, count) for seq, count in counts.items())
+
+    def _decompose_new_grams (self, seqs) :
+        # Every word within a gram is also parsed out of the document as a word of its own, so all of the constituent
+        # words are at hand. Grams which are already in the database (they have an id) are left as they are.
+        words = {str(seq) : seq for seq in seqs if seq._is_word}
+
+        for seq in seqs :
+            if seq._is_gram and seq._id is None :
+                seq._constituents = [Constituent(seq, words[word_string], position)
+                                     for position, word_string in enumerate(seq.seqs)]
+
+    def _seqs_already_in_db (self, seqs_from_document) :
+        if self.cache is None :
+            known, unknown = ({}, seqs_from_document)
+        else :
+            known, unknown = self.cache.partition(seqs_from_document)
 
+        time_0 = time()
         seqs_already_in_db = {(seq.__class__, str(seq)) : seq
-                              for seq in self.session.access.matching(strings_from_document)}
+                              for seq in self.session.access.matching(str(seq) for seq in unknown)}
+
+        if self.cache is not None :
+            self.cache.lookup_time += time() - time_0
+            self.cache.strings_looked_up += len(unknown)
+
+        for seq, id in known.items() :
+            seqs_already_in_db[(seq.__class__, str(seq))] = self.session._reference(seq.__class__, id,
+                                                                                     string=str(seq))
+
+        return seqs_already_in_db
+
+    def _merge_with_seqs_in_db (self, seqs_from_document) :
+        seqs_already_in_db = self._seqs_already_in_db(seqs_from_document)
 
         for seq_from_document in seqs_from_document :
             try :
@@ -31,20 +227,114 @@ class _AddIndexes (SessionDependent) :
             except KeyError :
                 # The sequence wasn't in the database, so it's added to the database.
                 seq = seq_from_document
+
+            self.counts[seq] = len(seq_from_document.indexes)
+
+            if seq_from_document._is_gram and not self.positional_grams :
+                self._count(seq, seq_from_document)
+            elif self.packed :
+                self._count(seq, seq_from_document, keep_positions=True)
             else :
-                seq.indexes.extend(seq_from_document.indexes)
+                self._attach(seq, seq_from_document)
 
             yield seq
 
+    def _add_concordance_keys (self, seq, indexes) :
+        # Every occurrence whose position is kept (however it's kept) gets its sort keys, if they're kept at all.
+        if not self.concordance_keys :
+            return
+
+        self.session.add_many(ConcordanceKey(self.document, seq, index.first_token, index.last_token,
+                                             index.tokenization_algorithm, self.words)
+                              for index in indexes if index.first_token is not None)
+
+    def _attach (self, seq, seq_from_document) :
+        # The indexes are also tallied up. The frequency is the document's only record of the sequence, it's what
+        # membership and per document counts are worked out from.
+        self.session.add(Frequency(self.document, seq, len(seq_from_document.indexes), indexed=True))
+        self._add_concordance_keys(seq, seq_from_document.indexes)
+
+        if seq is seq_from_document :
+            return
+
+        # The indexes are attached from the index side, this way the sequence's (potentially huge) collection of
+        # existing indexes doesn't need to be loaded. They're detached from the parsed sequence first, so that it isn't
+        # dragged into the session along with them.
+        indexes = tuple(seq_from_document.indexes)
+        del seq_from_document.indexes[:]
+
+        for index in indexes :
+            index.seq = seq
+            self.session.add(index)
+
+    def _count (self, seq, seq_from_document, keep_positions=False) :
+        # The parsed indexes are boiled down to a single frequency, and thrown away.
+        indexes = tuple(seq_from_document.indexes)
+        del seq_from_document.indexes[:]
+
+        # The tokenization algorithm the positions go with is the one recorded by the document's tokenization, so it
+        # isn't repeated in every frequency.
+        if keep_positions :
+            positions = sorted(index.first_token for index in indexes)
+            self._add_concordance_keys(seq, indexes)
+        else :
+            positions = None
+
+        self.session.add(Frequency(self.document, seq, len(indexes), positions))
+
 class Indexed (SessionDependent) :
     ''' This is used to construct a textual index of documents within the database. This allows for rapid word and
-        n-gram (groups of words) lookups. '''
+        n-gram (groups of words) lookups. A <SeqCache> can be given, to cut down on sequence lookups when indexing many
+        documents.
+
+        If <positional_grams> is false, words are still indexed occurrence by occurrence, but for grams only the
+        number of times they occur in each document is stored (see <Frequency>). The counts of grams indexed this way
+        are still correct, but their concordances are empty. This stores far fewer rows, roughly <max_gram_length>
+        times fewer.
+
+        If <packed> is true, no indexes are stored at all. Instead, every sequence gets a single frequency per
+        document, which holds the (packed) token indexes of all of its occurrences. The indexes are worked out from
+        these (and the document's <Tokenization>) when the concordance is used.
+
+        If <concordance_keys> is true, every occurrence whose position is stored (either way) also gets its sort keys
+        (see <ConcordanceKey>), so that concordances can be sorted by context and paged through by the database,
+        however common the sequence is. This writes a row for every one of those occurrences, which roughly doubles
+        the time indexing takes, and what's stored. Without them, <Access.kwic> works the keys out as it goes. Keys
+        should be kept from the first document on; the keys of an existing database can be added by
+        <nlplib.core.model.sqlalchemy_.migrate.add_concordance_keys>.
+
+        If <materialize> is true, the sequences are also associated with the document directly (see
+        <Document.seqs>). This isn't needed for looking up the sequences in a document (the frequencies are used for
+        that), and it writes a second row for every sequence in every document.
+
+        If <passages> is given, documents are split up into passages (see <Passage>), either of <passages> tokens
+        each, or by paragraph if <passages> is <'paragraph'> (see <nlplib.core.process.passage>). Each index records
+        the passage it starts in.
+
+        If <decompose> is true, new grams are also broken up into the words they're made up of (see <Constituent>), so
+        that grams can be looked up by their words (e.g., <Access.grams_containing>). This writes a row for every word
+        of every new gram. Grams which are already in the database aren't broken up again, so this should be used
+        from the first document on; the grams of an existing database can be broken up by
+        <nlplib.core.model.sqlalchemy_.migrate.add_constituents>. '''
+
+    def __init__ (self, session, cache=None, positional_grams=True, packed=False, materialize=False,
+                  passages=None, decompose=False, concordance_keys=False) :
+        super().__init__(session)
+        self.cache = cache
+        self.positional_grams = positional_grams
+        self.packed = packed
+        self.materialize = materialize
+        self.segment = segmenter(passages)
+        self.decompose = decompose
+        self.concordance_keys = concordance_keys
 
     def _documents (self) :
-        return {index.document for index in self.session.access.all_indexes()}
+        return ({index.document for index in self.session.access.all_indexes()} |
+                {frequency.document for frequency in self.session.access.all_frequencies()})
 
     def __contains__ (self, document) :
-        return len(document) and len(self.session.access.indexes(document))
+        return len(document) and (len(self.session.access.indexes(document)) or
+                                  len(self.session.access.frequencies(document)))
 
     def __iter__ (self) :
         return iter(self._documents())
@@ -61,7 +351,10 @@ class Indexed (SessionDependent) :
     def add (self, document, *args, max_gram_length=5, parser=Parsed, **kw) :
         ''' This will add an index for each word and gram in a document. '''
 
-        _AddIndexes(self.session, document, parser(document, *args, max_gram_length=max_gram_length, **kw))()
+        _AddIndexes(self.session, document, parser(document, *args, max_gram_length=max_gram_length, **kw),
+                    cache=self.cache, positional_grams=self.positional_grams, packed=self.packed,
+                    materialize=self.materialize, segment=self.segment, decompose=self.decompose,
+                    concordance_keys=self.concordance_keys)()
 
         return document
 
@@ -72,16 +365,254 @@ class Indexed (SessionDependent) :
             simply call <session.remove(document)>. '''
 
         for object in document._associated(self.session) :
+            if self.cache is not None and isinstance(object, Seq) :
+                self.cache.discard(object)
             self.session.remove(object)
 
     def clear (self) :
         for document in self._documents() :
             self.remove(document)
 
+def _test_seq_cache (ut) :
+    from nlplib.core.model import Document, Database, Word, Gram
+
+    strings = ['the cat ate the food', 'the dog ate the cat', 'a cat and a dog']
+
+    def build (cache=None) :
+        db = Database()
+        for string in strings :
+            # A new session is used for every document, the cache lives across all of them.
+            with db as session :
+                Indexed(session, cache=cache).add(session.add(Document(string)), max_gram_length=2)
+        return db
+
+    def counts (db) :
+        with db as session :
+            return sorted((seq, seq.count) for seq in session.access.all_seqs())
+
+    cache = SeqCache()
+    ut.assert_equal(counts(build(cache)), counts(build()))
+
+    stats = cache.stats()
+    ut.assert_equal(stats['hits'], 7) # <the>, <ate>, <cat>, <ate the> and <the cat>, then <cat> and <dog>
+    ut.assert_equal(stats['misses'], 17)
+    ut.assert_true(stats['time_saved'] >= 0.0)
+
+    with build() as session :
+        warmed = SeqCache(size=2)
+        warmed.warm(session)
+        ut.assert_equal(len(warmed), 2)
+
+        known, unknown = warmed.partition([Word('the'), Word('cat'), Gram('a cat'), Word('zebra')])
+        ut.assert_equal(set(known), {Word('the'), Word('cat')})
+        ut.assert_equal(set(unknown), {Gram('a cat'), Word('zebra')})
+        ut.assert_true(all(known[seq] == session.access.word(str(seq))._id for seq in known))
+
+    # Sequences removed from the database are removed from the cache too.
+    cache = SeqCache()
+    db = build(cache)
+    with db as session :
+        document = session.access.all_documents().__next__()
+        cache.warm(session)
+        Indexed(session, cache=cache).remove(document)
+        ut.assert_true(session.access.word('food') is None)
+        ut.assert_equal(cache.partition([Word('food')]), ({}, [Word('food')]))
+
+def _test_count_only_grams (ut) :
+    from nlplib.core.model import Document, Database, Word, Gram
+
+    strings = ['the cat ate the food and the cat slept', 'the dog ate the cat', 'a cat and a dog']
+
+    def build (positional_grams) :
+        db = Database()
+        with db as session :
+            indexed = Indexed(session, positional_grams=positional_grams)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=3)
+        return db
+
+    positional, counted = build(True), build(False)
+
+    def summary (db) :
+        with db as session :
+            access = session.access
+            return (sorted((seq, seq.count, access.document_frequency(seq)) for seq in access.all_seqs()),
+                    [(seq, seq.count) for seq in access.most_common(Gram, top=2)],
+                    [(seq, seq.count) for seq in access.most_common(Seq, top=3)])
+
+    ut.assert_equal(summary(counted), summary(positional))
+
+    with counted as session :
+        access = session.access
+
+        # Only words have indexes.
+        ut.assert_true(all(index.seq._is_word for index in access.all_indexes()))
+        ut.assert_equal(len(list(access.all_indexes())), 19)
+        ut.assert_equal(sum(int(frequency) for frequency in access.all_frequencies() if not frequency.indexed), 16 + 13)
+
+        # Every sequence has a single frequency per document, whether its occurrences are indexed or not.
+        pairs = [(frequency.document, frequency.seq) for frequency in access.all_frequencies()]
+        ut.assert_equal(len(pairs), len(set(pairs)))
+        ut.assert_equal(len(pairs), sum(len(list(document.words())) + len(list(document.grams()))
+                                        for document in access.all_documents()))
+
+        the_cat = access.gram('the cat')
+        ut.assert_equal((the_cat.count, len(the_cat.indexes), access.document_frequency(the_cat)), (3, 0, 2))
+        ut.assert_equal(access.most_common(Gram, top=1), [Gram('the cat')])
+        ut.assert_equal(access.document_frequency(Gram('not in the database')), 0)
+
+        # Grams which are already in the database are counted too.
+        Indexed(session, positional_grams=False).add(session.add(Document('the cat')))
+        ut.assert_equal(access.gram('the cat').count, 4)
+
+    with counted as session :
+        for document in list(session.access.all_documents()) :
+            session.remove(document)
+
+    with counted as session :
+        ut.assert_equal(list(session.access.all_seqs()), [])
+        ut.assert_equal(list(session.access.all_frequencies()), [])
+
+def _test_packed (ut) :
+    from sqlalchemy import inspect
+    from nlplib.core.model import Document, Database
+
+    strings = ['The cat ate the food,  and the cat slept.', 'The dog ate the cat!']
+
+    def build (**kw) :
+        db = Database()
+        with db as session :
+            indexed = Indexed(session, **kw)
+            for string in strings :
+                indexed.add(session.add(Document(string)), max_gram_length=3)
+        return db
+
+    def summary (db) :
+        with db as session :
+            access = session.access
+            concordances = sorted((str(seq), str(document), int(index), len(index), raw)
+                                  for seq in access.all_seqs() for document, index, raw in seq.concordance().raw())
+            return (sorted((seq, seq.count, len(seq.concordance())) for seq in access.all_seqs()),
+                    sorted((seq, seq.count) for seq in access.most_common(top=3)),
+                    concordances)
+
+    positional, packed = build(), build(packed=True)
+    ut.assert_equal(summary(packed), summary(positional))
+
+    with packed as session :
+        access = session.access
+        ut.assert_equal(list(access.all_indexes()), [])
+
+        the_cat = access.gram('the cat')
+        ut.assert_equal(sorted(frequency.positions for frequency in the_cat.frequencies), [(0, 6), (3,)])
+
+        # The tokenization algorithm is the document's, rather than being stored along with every frequency.
+        ut.assert_equal({frequency.tokenization_algorithm for frequency in the_cat.frequencies}, {'re_tokenized'})
+        columns = inspect(packed._sqlalchemy_engine).get_columns('frequency')
+        ut.assert_true('tokenization_algorithm' not in {column['name'] for column in columns})
+        ut.assert_equal([raw for document, index, raw in the_cat.concordance().raw()],
+                        ['The cat', 'the cat', 'the cat'])
+
+        indexed = Indexed(session, packed=True)
+        ut.assert_equal(len(indexed), 2)
+        document = access.all_documents().__next__()
+        ut.assert_true(document in indexed)
+
+        indexed.remove(document)
+        ut.assert_true(document not in indexed)
+        ut.assert_equal(access.gram('the cat').count, 1)
+
+    # Packing can be combined with only counting grams.
+    with build(packed=True, positional_grams=False) as session :
+        the_cat = session.access.gram('the cat')
+        ut.assert_equal((the_cat.count, len(the_cat.concordance())), (3, 0))
+        ut.assert_equal(len(session.access.word('cat').concordance()), 3)
+
+def _test_materialize (ut) :
+    from nlplib.core.model import Document, Database, Word, Gram
+
+    for kw in [{}, {'materialize' : True}, {'packed' : True, 'positional_grams' : False}] :
+        db = Database()
+        with db as session :
+            Indexed(session, **kw).add(session.add(Document('the cat ate')), max_gram_length=2)
+
+        with db as session :
+            document = session.access.all_documents().__next__()
+            ut.assert_equal(len(document.seqs), 5 if kw.get('materialize') else 0)
+            ut.assert_equal(sorted(document.words()), [Word('ate'), Word('cat'), Word('the')])
+            ut.assert_equal(sorted(document.grams()), [Gram('cat ate'), Gram('the cat')])
+            ut.assert_true(Gram('the cat') in document)
+            ut.assert_true(Word('dog') not in document)
+
+def _test_passages (ut) :
+    from nlplib.core.model import Document, Database, Word
+
+    string = 'the cat sat\n\nthe dog sat on the cat\n\nthe end'
+
+    def build (**kw) :
+        db = Database()
+        with db as session :
+            indexed = Indexed(session, **kw)
+            indexed.add(session.add(Document(string)), max_gram_length=2)
+            indexed.add(session.add(Document('a cat')), max_gram_length=2)
+        return db
+
+    def counts (db) :
+        with db as session :
+            return sorted((seq, seq.count) for seq in session.access.all_seqs())
+
+    db = build(passages='paragraph')
+    ut.assert_equal(counts(db), counts(build()))
+
+    with db as session :
+        access = session.access
+
+        document = sorted(access.all_documents(), key=len)[-1]
+        ut.assert_equal([str(passage) for passage in document.passages], ['the cat sat', 'the dog sat on the cat',
+                                                                          'the end'])
+        ut.assert_equal([len(passage) for passage in document.passages], [3, 6, 2])
+
+        ut.assert_equal(sorted(str(seq) for index, seq in access.indexes(document, 2)), ['end', 'the', 'the end'])
+        ut.assert_equal(len(access.indexes(document)), 21)
+
+        # Grams which cross into the next passage are put in the passage they start in.
+        ut.assert_equal(sorted((str(seq), index.passage) for index, seq in access.indexes(document)
+                               if str(seq) in ('sat the', 'cat the')), [('cat the', 1), ('sat the', 0)])
+
+        the = access.word('the')
+        ut.assert_equal([(passage.number, count) for passage, count in access.passages_containing(the)],
+                        [(1, 2), (0, 1), (2, 1)])
+        ut.assert_equal(len(access.passages_containing(access.word('cat'), top=2)), 2)
+        ut.assert_equal(access.passages_containing(Word('unknown')), [])
+
+    # Updating or removing the document takes its passages with it.
+    with db as session :
+        document = sorted(session.access.all_documents(), key=len)[-1]
+        indexed = Indexed(session, passages=4)
+        indexed.update(document)
+
+    with db as session :
+        document = sorted(session.access.all_documents(), key=len)[-1]
+        ut.assert_equal([(passage.first_token, passage.last_token) for passage in document.passages],
+                        [(0, 3), (4, 7), (8, 10)])
+
+        session.remove(document)
+
+    with db as session :
+        ut.assert_equal([str(passage) for passage in session.access.all_passages()], ['a cat'])
+        ut.assert_equal(session.access.word('cat').count, 1)
+
 def __test__ (ut) :
+    from itertools import chain
     from nlplib.core.model import Document, Database, Word
     from nlplib.core.process.concordance import Concordance
 
+    _test_seq_cache(ut)
+    _test_count_only_grams(ut)
+    _test_packed(ut)
+    _test_materialize(ut)
+    _test_passages(ut)
+
     corpus = [("I'd just like to interject for a moment. What you're referring to as Linux, is in fact, GNU/Linux, or "
                "as I've recently taken to calling it, GNU plus Linux."),
 
@@ -155,11 +686,25 @@ def __test__ (ut) :
     with db as session :
         first_document = sorted_all_documents(session)[0]
         ut.assert_true(first_document not in indexed)
+        ut.assert_true(first_document.tokenization is None)
+
+        # Indexing the document again.
+        Indexed(session).update(first_document)
+        ut.assert_equal(len(first_document.tokenization), 33)
+
+    with db as session :
+        first_document = sorted_all_documents(session)[0]
+        ut.assert_true(first_document in indexed)
+        ut.assert_equal(first_document.tokenization.spans[:2], ((0, 0), (2, 2)))
         session.remove(first_document)
+        ut.assert_equal(len(list(session.access.all_tokenizations())), 1)
 
     with db as session :
         second_document = sorted_all_documents(session)[0]
-        ut.assert_equal(sorted(second_document.seqs), sorted(session.access.all_seqs()))
+        ut.assert_equal(second_document.seqs, [])
+        ut.assert_equal(sorted(chain(second_document.words(), second_document.grams())),
+                        sorted(session.access.all_seqs()))
+        ut.assert_true(all(seq in second_document for seq in session.access.all_seqs()))
         ut.assert_true(all(index.document is second_document for index in session.access.all_indexes()))
         Indexed(session).remove(second_document)
 
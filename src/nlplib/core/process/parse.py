@@ -18,6 +18,9 @@ class Parsed (Base) :
         self.stem = stem
         self.tokenize = tokenize
 
+        # The document's tokens, these are filled in as the document is parsed.
+        self.tokens = []
+
     def __repr__ (self, *args, **kw) :
         return super().__repr__(self.document, *args, **kw)
 
@@ -37,6 +40,7 @@ class Parsed (Base) :
 
     def _stem_tokens (self, tokens) :
         for token in tokens :
+            self.tokens.append(token)
             yield (self.stem(str(token)), token)
 
     def _sub_grams (self, tuple_) :
@@ -50,6 +54,7 @@ class Parsed (Base) :
             yield tuple_[:i]
 
     def _parse (self) :
+        self.tokens = []
         stems_and_tokens = self._stem_tokens(self.tokenize(self.document))
         max_gram_length = self.max_gram_length
 
@@ -106,6 +111,8 @@ def __test__ (ut) :
         ut.assert_true(all(index.tokenization_algorithm == 're_tokenized'
                            for seq in parsed for index in seq.indexes))
 
+        ut.assert_equal([str(token) for token in parsed.tokens], [str(token) for token in re_tokenized(text)])
+
     # The parser shouldn't have any database related side-effects.
     with db as session :
         ut.assert_equal(len(list(session.access.all_seqs())), 0)
@@ -0,0 +1,73 @@
+''' This module contains the ways of splitting a document up into passages (see <Passage>). Each takes the document's
+    string and tokens, and yields the first and last token indexes of every passage, in order. '''
+
+
+import re
+
+__all__ = ['fixed', 'paragraphs', 'segmenter']
+
+def fixed (string, tokens, size=100) :
+    ''' This splits the tokens into passages of <size> tokens (the last passage may be shorter). '''
+
+    for first_token in range(0, len(tokens), size) :
+        yield (first_token, min(first_token + size, len(tokens)) - 1)
+
+_paragraph_break = re.compile(r'\n[^\S\n]*\n')
+
+def paragraphs (string, tokens) :
+    ''' This splits the tokens into paragraphs, which are separated by blank lines. '''
+
+    breaks = (match.end() for match in _paragraph_break.finditer(string))
+    next_break = next(breaks, None)
+
+    first_token = 0
+    for index, token in enumerate(tokens) :
+        if next_break is not None and token.first_character_index >= next_break :
+            if index > first_token :
+                yield (first_token, index - 1)
+            first_token = index
+
+            while next_break is not None and next_break <= token.first_character_index :
+                next_break = next(breaks, None)
+
+    if len(tokens) :
+        yield (first_token, len(tokens) - 1)
+
+def segmenter (passages) :
+    ''' This returns the function for splitting documents up into passages, given either the size of fixed size
+        passages, <'paragraph'>, or a function which works like the ones in this module. '''
+
+    if passages is None or callable(passages) :
+        return passages
+    elif passages == 'paragraph' :
+        return paragraphs
+    elif isinstance(passages, int) and passages > 0 :
+        return lambda string, tokens : fixed(string, tokens, passages)
+    else :
+        raise ValueError("Passages can be split up by a positive size, 'paragraph' or a function.")
+
+def __test__ (ut) :
+    from nlplib.core.process.token import re_tokenized
+
+    string = 'The cat sat.\n\nThe dog ate,\nthen slept.\n  \n\n Fin'
+    tokens = list(re_tokenized(string))
+
+    ut.assert_equal(list(fixed(string, tokens, 4)), [(0, 3), (4, 7), (8, 8)])
+    ut.assert_equal(list(fixed(string, tokens[:4], 4)), [(0, 3)])
+    ut.assert_equal(list(fixed(string, [], 4)), [])
+
+    ut.assert_equal([' '.join(str(token) for token in tokens[first:last+1])
+                     for first, last in paragraphs(string, tokens)],
+                    ['The cat sat', 'The dog ate then slept', 'Fin'])
+    ut.assert_equal(list(paragraphs('\n\nfoo', list(re_tokenized('\n\nfoo')))), [(0, 0)])
+    ut.assert_equal(list(paragraphs('', [])), [])
+
+    ut.assert_equal(list(segmenter(2)(string, tokens))[-1], (8, 8))
+    ut.assert_true(segmenter('paragraph') is paragraphs)
+    ut.assert_true(segmenter(None) is None)
+    ut.assert_raises(lambda : segmenter('sentence'), ValueError)
+    ut.assert_raises(lambda : segmenter(0), ValueError)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
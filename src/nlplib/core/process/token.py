@@ -4,7 +4,8 @@ import re
 
 from nlplib.core.base import Base
 
-__all__ = ['Token', 're_tokenized', 'split_tokenized', 'nltk_tokenized', 'split', 'halve', 'map_over_indexes']
+__all__ = ['Token', 're_tokenized', 'split_tokenized', 'nltk_tokenized', 'tokenizer', 'split', 'halve',
+           'map_over_indexes']
 
 class Token (Base) :
     __slots__ = ('string', 'index', 'first_character_index', 'last_character_index')
@@ -63,6 +64,12 @@ else :
 
         return _tokenized(string, nltk.word_tokenize)
 
+def tokenizer (name) :
+    ''' This returns the tokenizer with the given name (as recorded in <Index.tokenization_algorithm>), or <None> if
+        it's not one of the tokenizers from this module. '''
+
+    return {tokenize.__name__ : tokenize for tokenize in (re_tokenized, split_tokenized, nltk_tokenized)}.get(name)
+
 def split (string, tokenize=re_tokenized) :
     for token in tokenize(string) :
         yield str(token)
@@ -87,6 +94,9 @@ def __test__ (ut) :
             ut.assert_equal(text[token.slice()], str(token))
             ut.assert_equal(str(tokenized[token.index]), str(token))
 
+    ut.assert_true(tokenizer('re_tokenized') is re_tokenized)
+    ut.assert_true(tokenizer('some_custom_tokenizer') is None)
+
     ut.assert_equal(list(map_over_indexes(halve, 'hello')),
                     [('', 'hello'), ('h', 'ello'), ('he', 'llo'), ('hel', 'lo'), ('hell', 'o'), ('hello', '')])
 
@@ -1,18 +1,190 @@
+''' This module contains a prefix completion index over the vocabulary of a database, which suggests the most common
+    words and grams that start with whatever has been typed so far. '''
 
 
-from nlplib.core.control.score import Scored
-from nlplib.core.process.parse import Parsed
-from nlplib.core.model import SessionDependent, NeuralNetwork
+import pickle
+from bisect import bisect_left, bisect_right, insort
+
+__all__ = ['Completer']
+
+def _rank (counts) :
+    return lambda string : (-counts[string], string)
+
+class Completer :
+    ''' This suggests the <top> most common strings (by the counts of their sequences) that start with a prefix. The
+        strings are kept in a sorted list, and the best completions of every prefix of them are worked out ahead of
+        time, so that completing a prefix is a single dictionary lookup. Ties are broken alphabetically. '''
+
+    # This is bumped whenever the layout of saved completers changes.
+    version = 1
+
+    # Whether the completer keeps grams up to date as well as words (see <Completer.refresh>).
+    grams = True
+
+    def __init__ (self, counts=(), top=10) :
+        ''' counts : pairs of strings and their counts (e.g., the rows of <Access.all_words>), strings with a count of
+                     zero are left out
+            top    : how many completions are kept for every prefix '''
+
+        self.top = top
+
+        self._counts  = {string : count for string, count in counts if count > 0}
+        self._strings = sorted(self._counts)
+
+        # The strings are visited from most to least common, so the first <top> strings to reach a prefix are its best
+        # completions.
+        completions = {}
+        for string in sorted(self._counts, key=_rank(self._counts)) :
+            for end in range(len(string) + 1) :
+                found = completions.setdefault(string[:end], [])
+                if len(found) < top :
+                    found.append(string)
+
+        self._completions = {prefix : tuple(found) for prefix, found in completions.items()}
+
+    def __repr__ (self) :
+        return '<{name} of {length} strings, top={top}>'.format(name=self.__class__.__name__, length=len(self),
+                                                                top=self.top)
+
+    def __len__ (self) :
+        return len(self._counts)
+
+    def __contains__ (self, string) :
+        return string in self._counts
+
+    @classmethod
+    def build (cls, session, top=10, grams=True, chunk_size=1000) :
+        ''' This builds a completer out of the words (and, if <grams> is true, the grams) of a database. '''
+
+        access = session.access
+
+        counts = list(access.all_words(chunk_size, fields=('string', 'count')))
+        if grams :
+            counts.extend(access.all_grams(chunk_size, fields=('string', 'count')))
+
+        completer = cls(counts, top)
+        completer.grams = grams
+        return completer
+
+    def complete (self, prefix, top=None) :
+        ''' This returns the most common strings that start with the prefix, and their counts, as <(string, count)>
+            pairs; at most <top> of them (by default, as many as the completer keeps). '''
+
+        completions = self._completions.get(prefix, ())
+        return [(string, self._counts[string]) for string in completions[:top]]
+
+    def _children (self, prefix) :
+        # The strings starting with the prefix are next to each other in the sorted list, so the prefixes one character
+        # longer can be found by skipping from one run of strings to the next.
+        start, end = (bisect_left(self._strings, prefix), bisect_right(self._strings, prefix + '\U0010ffff'))
+        if start < end and self._strings[start] == prefix :
+            start += 1
+
+        while start < end :
+            child = self._strings[start][:len(prefix) + 1]
+            yield child
+            start = bisect_right(self._strings, child + '\U0010ffff', start, end)
+
+    def _recomplete (self, prefix) :
+        # Anything that is among the best completions of a prefix is either the prefix itself, or among the best
+        # completions of one of the prefixes one character longer.
+        candidates = [prefix] if prefix in self._counts else []
+        for child in self._children(prefix) :
+            candidates.extend(self._completions.get(child, ()))
+
+        return tuple(sorted(candidates, key=_rank(self._counts))[:self.top])
+
+    def _update (self, string, count) :
+        old_count = self._counts.get(string, 0)
+        if count == old_count :
+            return
+
+        if count > 0 :
+            if string not in self._counts :
+                insort(self._strings, string)
+            self._counts[string] = count
+        else :
+            del self._strings[bisect_left(self._strings, string)]
+            del self._counts[string]
+
+        rank = _rank(self._counts)
+
+        # The prefixes are updated from the longest to the shortest, because the shorter ones may need the completions
+        # of the longer ones.
+        for end in range(len(string), -1, -1) :
+            prefix = string[:end]
+            completions = self._completions.get(prefix, ())
+
+            if count > old_count :
+                # A string that became more common can only push others out.
+                completions = tuple(sorted(set(completions) | {string}, key=rank)[:self.top])
+            elif string not in completions :
+                # If the string wasn't good enough for this prefix, it isn't for any of the shorter prefixes either.
+                break
+            elif len(completions) < self.top :
+                # All of the strings starting with the prefix are already among its completions.
+                completions = tuple(sorted((other for other in completions if other in self._counts), key=rank))
+            else :
+                completions = self._recomplete(prefix)
+
+            if completions :
+                self._completions[prefix] = completions
+            else :
+                self._completions.pop(prefix, None)
+
+    def update (self, counts) :
+        ''' This sets the counts of the strings (given as pairs, like to <Completer>), adding the new ones and removing
+            the ones whose count is zero. Only the completions of the prefixes of these strings are worked out
+            again. '''
+
+        for string, count in counts :
+            self._update(string, count)
+
+    def refresh (self, session, seqs) :
+        ''' This looks up the current counts of the sequences (or strings) in the database, and updates the completer
+            with them. This keeps the completer up to date as documents are indexed, given the sequences of those
+            documents (e.g., their <Document.words> and <Document.grams>). '''
+
+        strings = {str(seq) for seq in seqs}
+        types = ('word', 'gram') if self.grams else ('word',)
+
+        counts = dict.fromkeys(strings, 0)
+        for string, count, type in session.access.matching(strings, fields=('string', 'count', 'type')) :
+            if type in types :
+                counts[string] = count
+
+        self.update(counts.items())
+
+    def save (self, path) :
+        ''' This saves the completer to a file, which <Completer.load> reads back without working anything out again.
+            Like any pickle, the file should only be loaded if it's trusted. '''
+
+        with open(path, 'wb') as file :
+            pickle.dump((self.version, self.top, self.grams, self._counts, self._strings, self._completions), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load (cls, path) :
+        with open(path, 'rb') as file :
+            version, top, grams, counts, strings, completions = pickle.load(file)
+
+        if version != cls.version :
+            raise ValueError('The completer was saved by an incompatible version ({0}).'.format(version))
+
+        completer = cls(top=top)
+        completer.grams = grams
+        completer._counts, completer._strings, completer._completions = (counts, strings, completions)
+        return completer
 
-from nlplib.general import timing
-@timing
 def __demo__ (ut) :
 
     from nlplib.data import builtin_db
+    from nlplib.core.control.score import Scored
     from nlplib.core.model import Word, NeuralNetwork
 
     from nlplib.exterior.train import usable
     from nlplib.exterior.util import plot
+    from nlplib.general import timing
 
     top = 10
 
@@ -24,7 +196,11 @@ def __demo__ (ut) :
     with builtin_db() as session :
         patterns = usable(nn, list(session.access.all_documents())[:], gram_size=2)
 
-    errors = [nn.train(input_words, output_words, rate=0.1) for input_words, output_words in patterns]
+    @timing
+    def train () :
+        return [nn.train(input_words, output_words, rate=0.1) for input_words, output_words in patterns]
+
+    errors = train()
 
     from nlplib.general.math import avg
 
@@ -43,7 +219,83 @@ def __demo__ (ut) :
 
     return ask
 
+def __test__ (ut) :
+    import os
+    import random
+    import tempfile
+
+    from nlplib.core.model import Database, Document, Word
+    from nlplib.core.process.index import Indexed
+
+    def brute_force (counts, prefix, top) :
+        matching = [(string, count) for string, count in counts.items() if string.startswith(prefix) and count > 0]
+        return sorted(matching, key=lambda item : (-item[1], item[0]))[:top]
+
+    counts = {'cat' : 5, 'car' : 3, 'cart' : 7, 'care' : 3, 'dog' : 2, 'c' : 1, 'caf\xe9' : 4}
+    completer = Completer(counts.items(), top=3)
+
+    ut.assert_equal(completer.complete('ca'), [('cart', 7), ('cat', 5), ('caf\xe9', 4)])
+    ut.assert_equal(completer.complete('car'), [('cart', 7), ('car', 3), ('care', 3)])
+    ut.assert_equal(completer.complete('ca', top=1), [('cart', 7)])
+    ut.assert_equal(completer.complete('', top=1), [('cart', 7)])
+    ut.assert_equal(completer.complete('x'), [])
+    ut.assert_equal(len(completer), 7)
+
+    # Updating the counts gives the same completions as building the completer from scratch.
+    completer.update([('cart', 0), ('cab', 6), ('dog', 9)])
+    counts.update({'cart' : 0, 'cab' : 6, 'dog' : 9})
+    ut.assert_equal(completer.complete('ca'), [('cab', 6), ('cat', 5), ('caf\xe9', 4)])
+    ut.assert_equal(completer.complete('cart'), [])
+    ut.assert_true('cart' not in completer)
+
+    random.seed(0)
+    strings = [''.join(random.choice('abc') for _ in range(random.randint(1, 5))) for _ in range(300)]
+    counts = {string : random.randint(0, 20) for string in strings}
+    completer = Completer(counts.items(), top=4)
+    for _ in range(500) :
+        string, count = (random.choice(strings), random.randint(0, 20))
+        completer.update([(string, count)])
+        counts[string] = count
+
+    fresh = Completer(counts.items(), top=4)
+    for prefix in set(string[:end] for string in strings for end in range(len(string) + 1)) :
+        ut.assert_equal(completer.complete(prefix), brute_force(counts, prefix, 4))
+        ut.assert_equal(fresh.complete(prefix), brute_force(counts, prefix, 4))
+
+    # Building from a database, and keeping up with newly indexed documents.
+    db = Database()
+    with db as session :
+        Indexed(session).add(session.add(Document('the cat sat on the mat, the cat ate')), max_gram_length=2)
+
+    with db as session :
+        completer = Completer.build(session)
+        ut.assert_equal(completer.complete('the'), [('the', 3), ('the cat', 2), ('the mat', 1)])
+        ut.assert_equal(completer.complete('ca'), [('cat', 2), ('cat ate', 1), ('cat sat', 1)])
+
+        completer = Completer.build(session, grams=False)
+        ut.assert_equal(completer.complete('the'), [('the', 3)])
+
+    with db as session :
+        completer = Completer.build(session)
+
+    with db as session :
+        document = session.add(Document('the cat sat'))
+        Indexed(session).add(document, max_gram_length=2)
+        completer.refresh(session, list(document.words()) + list(document.grams()) + ['dog'])
+
+    ut.assert_equal(completer.complete('the c'), [('the cat', 3)])
+    ut.assert_equal(completer.complete('s'), [('sat', 2), ('sat on', 1)])
+
+    with tempfile.TemporaryDirectory() as directory :
+        path = os.path.join(directory, 'completer')
+        completer.save(path)
+        loaded = Completer.load(path)
+
+    ut.assert_equal(loaded.complete('the'), completer.complete('the'))
+    ut.assert_equal((loaded.top, loaded.grams, len(loaded)), (10, True, len(completer)))
+
 if __name__ == '__main__' :
     from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
     ask = __demo__(UnitTest())
 
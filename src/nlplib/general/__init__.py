@@ -2,52 +2,77 @@
     tasks. '''
 
 
+import weakref
 from time import time
 from functools import wraps
+from hashlib import blake2b
 
 from nlplib.general.unittest import _logging_function
+from nlplib.general.cache import Cache
 
-__all__ = ['composite', 'subclasses', 'timing']
+__all__ = ['composite', 'subclasses', 'timing', 'fingerprint']
 
 class _Composite :
-    def __init__ (self, key=lambda object : (), identity=lambda object : (id(object),)) :
+    def __init__ (self, key=lambda object : (), size=None) :
         self.key = key
-        self.identity = identity
-        self.history = {}
-        self.cache = {}
+        self.size = size
+
+        self.hits   = 0
+        self.misses = 0
+
+        # Without a size, values are kept on the objects themselves (so they go when the objects do). Otherwise, the
+        # values for at most <size> objects are kept here, the least recently used are discarded first.
+        self._cache = Cache(size) if size is not None else None
 
     def __call__ (self, function) :
         @wraps(function)
         def get (object) :
-            identity = self.identity(object)
             key = self.key(object)
 
             hash(key) # Unhashable types shouldn't be used as a key.
 
-            full_key = identity + key
-
-            if self.has_changed(identity, key) :
-                return self.update(object, function, identity, key, full_key)
+            try :
+                last_key, value = self._cached(object)
+            except KeyError :
+                pass
             else :
-                return self.cache[full_key]
-
-        return property(get)
-
-    def has_changed (self, identity, key) :
-        try :
-            last = self.history[identity]
-        except KeyError :
-            return True
+                if key == last_key :
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            value = function(object)
+            self._store(object, key, value)
+            return value
+
+        return _CompositeProperty(get, composite=self)
+
+    def _cached (self, object) :
+        if self._cache is None :
+            return vars(object)['_composites'][self]
+
+        # The id of an object can be reused once the object is gone, so the object itself is checked too.
+        reference, key, value = self._cache[id(object)]
+        if reference() is not object :
+            raise KeyError(id(object))
+        return (key, value)
+
+    def _store (self, object, key, value) :
+        if self._cache is None :
+            vars(object).setdefault('_composites', {})[self] = (key, value)
         else :
-            return key != last
+            self._cache[id(object)] = (weakref.ref(object), key, value)
 
-    def update (self, object, function, identity, key, full_key) :
-        self.history[identity] = key
-        value = self.cache[full_key] = function(object)
-        return value
+class _CompositeProperty (property) :
+    def __init__ (self, *args, composite=None, **kw) :
+        super().__init__(*args, **kw)
+        self.composite = composite
 
 def composite (*args, **kw) :
-    ''' A decorator for making lazily evaluated cached read only properties. '''
+    ''' A decorator for making lazily evaluated cached read only properties. The value is worked out again whenever
+        the <key> (a function of the object, returning a hashable value) changes. If <size> is given, only the values
+        for the <size> most recently used objects are kept. The decorator's hits and misses can be found on the
+        property, as <cls.name.composite>. '''
 
     return _Composite(*args, **kw)
 
@@ -58,6 +83,13 @@ def subclasses (cls) :
         yield subclass
         yield from subclasses(subclass)
 
+def fingerprint (string) :
+    ''' This returns a signed 64 bit integer derived from a string. Unlike <hash>, the value is the same across
+        processes (it doesn't depend on <PYTHONHASHSEED>), so it's suitable for storing in a database. '''
+
+    digest = blake2b(str(string).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
 def timing (function, log=print) :
     ''' A simple decorator which prints how long a function took to return. '''
 
@@ -73,6 +105,64 @@ def timing (function, log=print) :
 
     return timed
 
+def _test_composite_storage (ut) :
+    import gc
+
+    class Foo :
+        def __init__ (self, x) :
+            self.x = x
+
+        @composite(key=lambda self : (self.x,))
+        def double (self) :
+            return self.x * 2
+
+        @composite(key=lambda self : (self.x,), size=2)
+        def triple (self) :
+            return self.x * 3
+
+    class Bar (Foo) :
+        @composite(key=lambda self : (self.x,))
+        def double (self) :
+            return -super().double
+
+    counters = lambda cls, name : (getattr(cls, name).composite.hits, getattr(cls, name).composite.misses)
+
+    foos = [Foo(x) for x in range(3)]
+    ut.assert_equal([foo.double for foo in foos + foos], [0, 2, 4] * 2)
+    ut.assert_equal(counters(Foo, 'double'), (3, 3))
+
+    # Overridden composites don't share their values.
+    bar = Bar(1)
+    ut.assert_equal((bar.double, bar.double), (-2, -2))
+
+    # The values don't keep the objects alive.
+    reference = weakref.ref(foos[0])
+    del foos[0]
+    gc.collect()
+    ut.assert_true(reference() is None)
+
+    # Bounded composites only keep the most recently used values.
+    ut.assert_equal([foo.triple for foo in foos + foos[::-1]], [3, 6, 6, 3])
+    ut.assert_equal(counters(Foo, 'triple'), (2, 2))
+    other = Foo(3)
+    ut.assert_equal((other.triple, foos[1].triple, foos[0].triple), (9, 6, 3))
+    ut.assert_equal(counters(Foo, 'triple'), (2, 5))
+    ut.assert_equal(len(Foo.triple.composite._cache), 2)
+
+    # A new object which happens to get the id of one that's gone (or of another object, as far as the cache can
+    # tell) doesn't get its value, even if the keys are the same. The reuse of the id is faked here.
+    gone = Foo(5)
+    reference = weakref.ref(gone)
+    del gone
+    gc.collect()
+
+    cache = Foo.triple.composite._cache
+    for stale_reference in [reference, weakref.ref(other)] :
+        new = Foo(5)
+        cache[id(new)] = (stale_reference, (5,), 'stale')
+        ut.assert_equal(new.triple, 15)
+        ut.assert_equal(new.triple, 15)
+
 def __test__ (ut) :
 
     class Foo :
@@ -127,6 +217,13 @@ def __test__ (ut) :
     baz = Baz()
     ut.assert_raises(lambda : baz.bar, TypeError)
 
+    _test_composite_storage(ut)
+
+    ut.assert_equal(fingerprint('foo'), 8359717351044633339)
+    ut.assert_equal(fingerprint('foo'), fingerprint('foo'))
+    ut.assert_true(fingerprint('foo') != fingerprint('foo '))
+    ut.assert_true(all(-2**63 <= fingerprint(string) < 2**63 for string in ['', 'a', 'the cat', '\u00dc' * 1000]))
+
 def __demo__ () :
     from time import sleep
 
@@ -0,0 +1,67 @@
+''' This module contains a Bloom filter, a compact set which can only answer whether an item is probably in it, or
+    definitely isn't. '''
+
+
+from math import ceil, log
+from hashlib import blake2b
+
+__all__ = ['BloomFilter']
+
+class BloomFilter :
+    ''' A set like container, which can be added to but not removed from. An item which was added is always found, an
+        item which wasn't is wrongly found about <error_rate> of the time, as long as no more than <capacity> items are
+        added. Items are told apart by their string form. '''
+
+    def __init__ (self, capacity, error_rate=0.01) :
+        capacity = max(capacity, 1)
+
+        self.capacity   = capacity
+        self.error_rate = error_rate
+
+        # The optimal number of bits and hash functions for the capacity and error rate.
+        self.size   = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.hashes = max(round(self.size / capacity * log(2)), 1)
+
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __repr__ (self) :
+        return '<{name} of {size} bits, {hashes} hashes>'.format(name=self.__class__.__name__, size=self.size,
+                                                                 hashes=self.hashes)
+
+    def _positions (self, item) :
+        # The hash functions are made out of two halves of a single digest (see Kirsch and Mitzenmacher, "Less
+        # Hashing, Same Performance").
+        digest = blake2b(str(item).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        first, second = (int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little'))
+
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add (self, item) :
+        for position in self._positions(item) :
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def update (self, items) :
+        for item in items :
+            self.add(item)
+
+    def __contains__ (self, item) :
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+def __test__ (ut) :
+    bloom = BloomFilter(1000)
+    bloom.update(range(0, 2000, 2))
+
+    ut.assert_true(all(number in bloom for number in range(0, 2000, 2)))
+
+    # The rate of false positives should be around the error rate.
+    false_positives = sum(number in bloom for number in range(1, 20001, 2))
+    ut.assert_true(false_positives < 300)
+
+    ut.assert_true('cat' not in BloomFilter(0))
+    bloom = BloomFilter(0)
+    bloom.add('caf\xe9')
+    ut.assert_true('caf\xe9' in bloom)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -0,0 +1,155 @@
+''' This module contains a simple size bounded cache, which discards the least recently used items first. '''
+
+
+from collections import OrderedDict
+from threading import Lock
+
+__all__ = ['Cache']
+
+class Cache :
+    ''' A mapping like container, that holds at most <size> items. If <size> is <None> the cache is unbounded. Hits and
+        misses are counted by <Cache.get>, so that the effectiveness of the cache can be monitored.
+
+        Even reading an item reorders the items, so every access holds a lock; a cache can be shared by threads (e.g.,
+        by the sessions of a database, see <Database>). '''
+
+    def __init__ (self, size=None) :
+        self.size = size
+
+        self.hits   = 0
+        self.misses = 0
+
+        self._items = OrderedDict()
+        self._lock  = Lock()
+
+    def __repr__ (self) :
+        return '<{name} {length}/{size} hit_rate={hit_rate:0.4f}>'.format(name=self.__class__.__name__,
+                                                                           length=len(self),
+                                                                           size=self.size,
+                                                                           hit_rate=self.hit_rate())
+
+    def __len__ (self) :
+        return len(self._items)
+
+    def __contains__ (self, key) :
+        with self._lock :
+            return key in self._items
+
+    def __iter__ (self) :
+        # The keys are copied, so that other threads can go on using the cache while they're gone through.
+        with self._lock :
+            return iter(list(self._items))
+
+    def __getitem__ (self, key) :
+        with self._lock :
+            value = self._items[key]
+            self._items.move_to_end(key)
+            return value
+
+    def __setitem__ (self, key, value) :
+        with self._lock :
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            if self.size is not None :
+                while len(self._items) > self.size :
+                    self._items.popitem(last=False)
+
+    def __delitem__ (self, key) :
+        with self._lock :
+            del self._items[key]
+
+    def get (self, key, default=None) :
+        ''' This works like <dict.get>, but also keeps track of the cache hits and misses. '''
+
+        with self._lock :
+            try :
+                value = self._items[key]
+            except KeyError :
+                self.misses += 1
+                return default
+            else :
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+
+    def discard (self, key) :
+        with self._lock :
+            self._items.pop(key, None)
+
+    def clear (self) :
+        with self._lock :
+            self._items.clear()
+
+    def hit_rate (self) :
+        try :
+            return self.hits / (self.hits + self.misses)
+        except ZeroDivisionError :
+            return 0.0
+
+def __test__ (ut) :
+    cache = Cache(size=2)
+
+    cache['a'] = 0
+    cache['b'] = 1
+    ut.assert_equal(list(cache), ['a', 'b'])
+
+    ut.assert_equal(cache['a'], 0) # This makes <a> the most recently used item.
+    cache['c'] = 2
+    ut.assert_equal(list(cache), ['a', 'c'])
+    ut.assert_true('b' not in cache)
+
+    ut.assert_equal(cache.get('c'), 2)
+    ut.assert_equal(cache.get('b', 'missing'), 'missing')
+    ut.assert_equal((cache.hits, cache.misses), (1, 1))
+    ut.assert_equal(cache.hit_rate(), 0.5)
+
+    cache.discard('a')
+    cache.discard('z')
+    ut.assert_equal(len(cache), 1)
+
+    cache.clear()
+    ut.assert_equal(len(cache), 0)
+
+    unbounded = Cache()
+    for i in range(1000) :
+        unbounded[i] = i
+    ut.assert_equal(len(unbounded), 1000)
+    ut.assert_equal(Cache().hit_rate(), 0.0)
+
+    _test_threads(ut)
+
+def _test_threads (ut) :
+    from threading import Thread, Event
+    from time import sleep
+
+    # Reading an item looks it up, then moves it to the end. The gap between the two is widened here, while another
+    # thread removes the item; the removal has to wait for the read to finish.
+    reading = Event()
+
+    class SlowItems (OrderedDict) :
+        def move_to_end (self, *args, **kw) :
+            reading.set()
+            sleep(0.05)
+            super().move_to_end(*args, **kw)
+
+    cache = Cache()
+    cache['a'] = 0
+    cache._items = SlowItems(cache._items)
+
+    def discard () :
+        reading.wait()
+        cache.discard('a')
+
+    thread = Thread(target=discard)
+    thread.start()
+    try :
+        ut.assert_equal(cache['a'], 0)
+    finally :
+        thread.join()
+
+    ut.assert_true('a' not in cache)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -0,0 +1,44 @@
+''' This module contains the ways that strings can be compressed, for storing them in less space. The methods are
+    referred to by name, so that the name can be stored alongside the compressed data. '''
+
+
+import zlib
+import lzma
+
+__all__ = ['methods', 'compress', 'decompress']
+
+_methods = {'zlib' : (lambda data : zlib.compress(data, 6), zlib.decompress),
+            'lzma' : (lzma.compress, lzma.decompress)}
+
+methods = tuple(sorted(_methods))
+
+def _method (name) :
+    try :
+        return _methods[name]
+    except KeyError :
+        raise ValueError('There is no compression method called {0!r}, the methods are {1}.'.format(name, methods))
+
+def compress (string, method) :
+    ''' This returns the string compressed (as bytes) by the method. '''
+
+    return _method(method)[0](string.encode('utf-8', 'surrogatepass'))
+
+def decompress (data, method) :
+    ''' This returns the string that was compressed by the method. '''
+
+    return _method(method)[1](data).decode('utf-8', 'surrogatepass')
+
+def __test__ (ut) :
+    strings = ['', 'the cat sat on the mat ' * 100, 'na\xefve — caf\xe9 \U0001f408 \udc80']
+
+    for method in methods :
+        for string in strings :
+            ut.assert_equal(decompress(compress(string, method), method), string)
+
+        ut.assert_true(len(compress(strings[1], method)) < len(strings[1]) / 10)
+
+    ut.assert_raises(lambda : compress('foo', 'gzip'), ValueError)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -0,0 +1,61 @@
+''' This module contains functions for packing sequences of non-negative integers into compact byte strings. Each
+    integer is stored as the difference from the one before it (so sorted sequences produce small numbers), and each
+    difference is stored in as few bytes as it needs (a variable length quantity, seven bits to a byte). '''
+
+
+__all__ = ['pack', 'unpack']
+
+def _varint (value) :
+    while value > 0x7f :
+        yield (value & 0x7f) | 0x80
+        value >>= 7
+    yield value
+
+def pack (integers) :
+    ''' This packs an ascending sequence of non-negative integers into bytes. '''
+
+    packed = bytearray()
+
+    last = 0
+    for integer in integers :
+        delta = integer - last
+        if delta < 0 :
+            raise ValueError('The integers must be non-negative, and in ascending order.')
+        packed.extend(_varint(delta))
+        last = integer
+
+    return bytes(packed)
+
+def unpack (packed) :
+    ''' This undoes <pack>, yielding the integers one at a time. '''
+
+    last = 0
+    delta, shift = (0, 0)
+
+    for byte in packed :
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80 :
+            shift += 7
+        else :
+            last += delta
+            yield last
+            delta, shift = (0, 0)
+
+    if shift :
+        raise ValueError('The packed bytes were truncated.')
+
+def __test__ (ut) :
+    for integers in [[], [0], [0, 0, 1], [1, 5, 127, 128, 300, 16384, 2 ** 40], list(range(0, 100000, 7))] :
+        ut.assert_equal(list(unpack(pack(integers))), integers)
+
+    ut.assert_equal(pack([1, 2, 3]), b'\x01\x01\x01')
+    ut.assert_equal(pack([128]), b'\x80\x01')
+    ut.assert_equal(len(pack(range(1000))), 1000)
+
+    ut.assert_raises(lambda : pack([2, 1]), ValueError)
+    ut.assert_raises(lambda : pack([-1]), ValueError)
+    ut.assert_raises(lambda : list(unpack(b'\x80')), ValueError)
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
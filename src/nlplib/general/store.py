@@ -0,0 +1,105 @@
+''' This module contains an append-only store for large amounts of text, which is read through a memory map. Only the
+    pages of the file that are actually read are loaded, and they're shared between all of the processes reading the
+    same file.
+
+    Each string is stored in the narrowest fixed width encoding that can hold all of its characters (one byte for each
+    character if it's all Latin-1, two if it's all within the basic multilingual plane, four otherwise). Because the
+    characters are all the same width, a slice of a stored string can be read without reading anything before it. '''
+
+
+import mmap
+
+__all__ = ['TextStore']
+
+_encodings = {1 : 'latin-1', 2 : 'utf-16-le', 4 : 'utf-32-le'}
+
+def _width (string) :
+    highest = max(map(ord, string), default=0)
+    if highest < 0x100 :
+        return 1
+    elif highest < 0x10000 :
+        return 2
+    else :
+        return 4
+
+class TextStore :
+    ''' A file of strings, which can only be added to. Strings are referred to by their offset (in bytes), their length
+        (in characters) and the width of their characters (in bytes), as returned by <TextStore.append>. '''
+
+    def __init__ (self, path) :
+        self.path = path
+
+        self._file = open(path, 'a+b')
+        self._map  = None
+
+    def __repr__ (self) :
+        return '<{name} {path}>'.format(name=self.__class__.__name__, path=self.path)
+
+    def append (self, string) :
+        ''' This adds the string to the end of the file, returning where it was put. '''
+
+        width = _width(string)
+        data = string.encode(_encodings[width], 'surrogatepass')
+
+        self._file.write(data)
+        self._file.flush()
+
+        return (self._file.tell() - len(data), len(string), width)
+
+    def _mapped (self, end) :
+        # The file is mapped again when it has grown past what was mapped.
+        if self._map is None or len(self._map) < end :
+            if self._map is not None :
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self._map
+
+    def read (self, offset, length, width, start=None, end=None) :
+        ''' This returns the stored string, or the slice of it from <start> to <end> (which work the same way as they
+            do for slicing a string). '''
+
+        start, end, _ = slice(start, end).indices(length)
+        if end <= start :
+            return ''
+
+        data = self._mapped(offset + length * width)[offset + start * width:offset + end * width]
+        return data.decode(_encodings[width], 'surrogatepass')
+
+    def close (self) :
+        if self._map is not None :
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+def __test__ (ut) :
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory :
+        store = TextStore(os.path.join(directory, 'text'))
+
+        strings = ['the cat', '', 'caf\xe9', 'naïve — 中文', 'emoji \U0001f408 cat', 'lone \udc80']
+        locations = [store.append(string) for string in strings]
+
+        ut.assert_equal([width for _, _, width in locations], [1, 1, 1, 2, 4, 2])
+        ut.assert_equal([store.read(*location) for location in locations], strings)
+
+        for string, location in zip(strings, locations) :
+            for start, end in [(1, 3), (None, 2), (-3, None), (2, 100), (3, 1)] :
+                ut.assert_equal(store.read(*location, start=start, end=end), string[start:end])
+
+        # Strings appended after the file was mapped can be read too, as can strings stored by another instance.
+        location = store.append('the dog')
+        ut.assert_equal(store.read(*location, start=4), 'dog')
+
+        other = TextStore(store.path)
+        ut.assert_equal(other.read(*locations[0]), 'the cat')
+        ut.assert_equal(other.append('more'), (location[0] + 7, 4, 1))
+
+        store.close()
+        other.close()
+
+if __name__ == '__main__' :
+    from nlplib.general.unittest import UnitTest
+    __test__(UnitTest())
@@ -0,0 +1,135 @@
+''' This script compares the different ways of storing indexes, by how long indexing takes and how much space the
+    resulting database takes up. A randomly generated corpus is used, so that the script doesn't depend on network
+    access. '''
+
+
+import os
+import random
+import tempfile
+from time import time
+
+from nlplib.core.model import Database, Document, Word
+from nlplib.core.process.index import Indexed, SeqCache
+from nlplib.core.process.build import build
+
+__all__ = ['corpus', 'layouts', 'benchmark', 'scaling', 'compression']
+
+# The keyword arguments given to <Indexed>, for each of the layouts.
+layouts = [('indexes, materialized', {'materialize' : True}),
+           ('indexes', {}),
+           ('indexes, decomposed grams', {'decompose' : True}),
+           ('indexes, concordance keys', {'concordance_keys' : True}),
+           ('count only grams', {'positional_grams' : False}),
+           ('packed', {'packed' : True}),
+           ('packed, count only grams', {'packed' : True, 'positional_grams' : False})]
+
+def corpus (amount=50, length=300, vocabulary_size=2000, seed=0) :
+    ''' This yields random document strings, where the frequencies of the words roughly follow Zipf's law. '''
+
+    rng = random.Random(seed)
+    vocabulary = ['w{0}'.format(i) for i in range(vocabulary_size)]
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+
+    for _ in range(amount) :
+        yield ' '.join(rng.choices(vocabulary, weights, k=length))
+
+def _build (path, strings, max_gram_length, chunk_size, **kw) :
+    db = Database('sqlite:///' + path)
+    cache = SeqCache()
+
+    time_0 = time()
+    for i in range(0, len(strings), chunk_size) :
+        with db as session :
+            indexed = Indexed(session, cache=cache, **kw)
+            for string in strings[i:i+chunk_size] :
+                indexed.add(session.add(Document(string)), max_gram_length=max_gram_length)
+
+    return (time() - time_0, db)
+
+def benchmark (strings, max_gram_length=3, chunk_size=10, layouts=layouts, log=print) :
+    ''' This indexes the strings once for every layout, and logs the results. '''
+
+    strings = list(strings)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory :
+        for name, kw in layouts :
+            path = os.path.join(directory, name.replace(' ', '_').replace(',', '') + '.db')
+            seconds, db = _build(path, strings, max_gram_length, chunk_size, **kw)
+
+            with db as session :
+                rows = (sum(1 for _ in session.access.all_indexes()) +
+                        sum(1 for _ in session.access.all_frequencies()))
+            db._sqlalchemy_engine.dispose()
+
+            results[name] = (seconds, rows, os.path.getsize(path))
+            log('{0:<28} {1:>8.2f} s {2:>10} rows {3:>12} bytes'.format(name, *results[name]))
+
+    return results
+
+def scaling (strings, workers=(1, 2, 4), max_gram_length=3, log=print) :
+    ''' This times the parallel builder (see <nlplib.core.process.build>) with different numbers of workers. '''
+
+    strings = list(strings)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory :
+        for amount in workers :
+            db = Database('sqlite:///' + os.path.join(directory, 'workers_{0}.db'.format(amount)))
+
+            time_0 = time()
+            build(db, strings, workers=amount, max_gram_length=max_gram_length)
+            results[amount] = time() - time_0
+            db._sqlalchemy_engine.dispose()
+
+            log('{0:>3} workers {1:>8.2f} s {2:>6.2f}x'.format(amount, results[amount],
+                                                              results[workers[0]] / results[amount]))
+
+    return results
+
+def compression (strings, methods=(None, 'zlib', 'lzma'), log=print) :
+    ''' This compares how much space the strings of documents take up with each of the compression methods (see
+        <Database>), against how long it takes to read all of the strings, and the contexts of a common word, back
+        out again (from a new session, so that nothing is already decompressed). The size of the whole database is
+        logged too, though it's mostly made up of indexes. '''
+
+    strings = list(strings)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory :
+        for method in methods :
+            path = os.path.join(directory, 'compression_{0}.db'.format(method))
+            db = Database('sqlite:///' + path, compression=method, compression_threshold=0)
+
+            with db as session :
+                indexed = Indexed(session)
+                for string in strings :
+                    indexed.add(session.add(Document(string)), max_gram_length=1)
+
+            with db as session :
+                time_0 = time()
+                for document in session.access.all_documents() :
+                    str(document)
+                read_seconds = time() - time_0
+
+            with db as session :
+                word = session.access.most_common(Word, top=1)[0]
+
+                time_0 = time()
+                session.access.contexts(word, before=5, after=5)
+                context_seconds = time() - time_0
+
+            text_size = db._sqlalchemy_engine.execute('SELECT sum(coalesce(length(CAST(string AS BLOB)), 0) + '
+                                                      'coalesce(length(text_compressed), 0)) FROM document').scalar()
+            db._sqlalchemy_engine.dispose()
+
+            results[method] = (text_size, os.path.getsize(path), read_seconds, context_seconds)
+            log('{0:<6} {1:>10} text bytes {2:>6.2f}x {3:>12} bytes in all {4:>8.3f} s reading {5:>8.3f} s '
+                'contexts'.format(str(method), text_size, results[methods[0]][0] / text_size, *results[method][1:]))
+
+    return results
+
+if __name__ == '__main__' :
+    benchmark(corpus())
+    scaling(corpus())
+    compression(corpus())
@@ -1,21 +1,23 @@
 
 
 from nlplib.exterior.scrape.wikipedia import gather_documents
-from nlplib.core.process.index import Indexed
+from nlplib.core.process.index import Indexed, SeqCache
 from nlplib.general.iterate import chunked
 from nlplib.general import timing
 
 @timing
 def make_db (db, amount=100) :
     total = 0
+    cache = SeqCache()
     for chunk in chunked(enumerate(gather_documents(amount), total + 1), 10, trail=True) :
         with db as session :
-            indexed = Indexed(session)
+            indexed = Indexed(session, cache=cache)
             for total, document in chunk :
                 if len(document) :
                     session.add(document)
                     indexed.add(document)
                     print(total, ':', repr(document))
+    print(cache)
     return total
 
 if __name__ == '__main__' :
@@ -0,0 +1,29 @@
+''' This script builds a database from scratch out of a directory of text files (one document per file), using a worker
+    process for every core.
+
+    usage : python -m nlplib.scripts.rebuild target.db corpus_directory [workers] [max_gram_length] '''
+
+
+import os
+import sys
+
+from nlplib.core.process.build import build
+from nlplib.core.model import Database
+from nlplib.general import timing
+
+def documents (directory) :
+    for name in sorted(os.listdir(directory)) :
+        with open(os.path.join(directory, name), encoding='utf-8') as file :
+            yield {'string' : file.read(), 'title' : name}
+
+@timing
+def rebuild (path, directory, workers=None, max_gram_length=5) :
+    if os.path.exists(path) :
+        os.remove(path)
+
+    return build(Database('sqlite:///' + path), documents(directory), workers=workers,
+                 max_gram_length=max_gram_length)
+
+if __name__ == '__main__' :
+    path, directory, *rest = sys.argv[1:]
+    rebuild(path, directory, *(int(arg) for arg in rest))